@@ -26,6 +26,19 @@ document.getElementById('excelFile').addEventListener('change', function(e) {
         button.classList.remove('has-file');
     }
 });
+document.getElementById('imagenesFile').addEventListener('change', function(e) {
+    const file = e.target.files[0];
+    const button = document.getElementById('imagenesButton');
+    const fileName = document.getElementById('imagenesFileName');
+    
+    if (file) {
+        fileName.textContent = file.name;
+        button.classList.add('has-file');
+    } else {
+        fileName.textContent = 'Seleccionar archivo...';
+        button.classList.remove('has-file');
+    }
+});
 // Manejo del botón de descarga de Word
 document.getElementById('downloadWordBtn').addEventListener('click', async function(e) {
     e.preventDefault();
@@ -120,6 +133,7 @@ document.getElementById('diplomaForm').addEventListener('submit', async function
     
     const templateFile = document.getElementById('templateFile').files[0];
     const excelFile = document.getElementById('excelFile').files[0];
+    const imagenesFile = document.getElementById('imagenesFile').files[0];
     
     if (!templateFile || !excelFile) {
         showMessage('Por favor, selecciona ambos archivos.', 'error');
@@ -132,8 +146,14 @@ document.getElementById('diplomaForm').addEventListener('submit', async function
         return;
     }
     
-    if (!excelFile.name.endsWith('.xlsx') && !excelFile.name.endsWith('.xls')) {
-        showMessage('El archivo de datos debe ser un archivo .xlsx o .xls', 'error');
+    const extensionesDatos = ['.xlsx', '.xls', '.csv', '.txt', '.parquet', '.arrow', '.feather', '.ipc', '.ndjson', '.jsonl'];
+    if (!extensionesDatos.some(extension => excelFile.name.toLowerCase().endsWith(extension))) {
+        showMessage('El archivo de datos debe ser un Excel (.xlsx), CSV, Parquet o Arrow', 'error');
+        return;
+    }
+    
+    if (imagenesFile && !imagenesFile.name.toLowerCase().endsWith('.zip')) {
+        showMessage('Las fotos y firmas se envían en un archivo .zip', 'error');
         return;
     }
     
@@ -151,54 +171,46 @@ document.getElementById('diplomaForm').addEventListener('submit', async function
     try {
         // Crear FormData
         const formData = new FormData();
-        formData.append('template', templateFile);
         formData.append('excel', excelFile);
+        if (imagenesFile) {
+            formData.append('imagenes', imagenesFile);
+        }
         
-        // Enviar archivos al servidor
-        updateProgress(10, 'Enviando archivos al servidor...');
+        // Si el servidor ya tiene esta plantilla, se envía solo su hash
+        const huella = await plantillaEnServidor(templateFile);
+        if (huella) {
+            formData.append('plantilla', huella);
+        } else {
+            formData.append('template', templateFile);
+        }
+        
+        // Crear el trabajo en el servidor
+        updateProgress(5, 'Enviando archivos al servidor...');
         
-        const response = await fetch('/generate', {
+        const response = await fetch('/jobs', {
             method: 'POST',
             body: formData
         });
         
         if (!response.ok) {
-            // Intentar obtener el error como JSON, pero manejar si no es JSON
-            let errorMessage = 'Error al generar los diplomas';
-            try {
-                const contentType = response.headers.get('content-type');
-                if (contentType && contentType.includes('application/json')) {
-                    const errorData = await response.json();
-                    errorMessage = errorData.error || errorMessage;
-                } else {
-                    const errorText = await response.text();
-                    errorMessage = errorText || errorMessage;
-                }
-            } catch (e) {
-                errorMessage = `Error ${response.status}: ${response.statusText}`;
-            }
-            throw new Error(errorMessage);
+            throw new Error(await leerError(response, 'Error al generar los diplomas'));
         }
         
-        updateProgress(50, 'Procesando archivos...');
+        const trabajo = await response.json();
         
-        // Obtener el archivo ZIP generado
-        const blob = await response.blob();
+        // Consultar el avance hasta que el ZIP esté listo
+        await esperarTrabajo(trabajo);
         
-        updateProgress(90, 'Preparando descarga...');
+        updateProgress(100, '¡Completado!');
         
-        // Crear enlace de descarga
-        const url = window.URL.createObjectURL(blob);
+        // Descargar directamente del servidor (el navegador puede reanudar la descarga)
         const a = document.createElement('a');
-        a.href = url;
+        a.href = trabajo.url_descarga;
         a.download = 'diplomas_generados.zip';
         document.body.appendChild(a);
         a.click();
-        window.URL.revokeObjectURL(url);
         document.body.removeChild(a);
         
-        updateProgress(100, '¡Completado!');
-        
         // Mostrar mensaje de éxito
         showMessage('¡Diplomas generados exitosamente! El archivo ZIP se está descargando.', 'success');
         
@@ -207,8 +219,10 @@ document.getElementById('diplomaForm').addEventListener('submit', async function
             document.getElementById('diplomaForm').reset();
             document.getElementById('templateButton').classList.remove('has-file');
             document.getElementById('excelButton').classList.remove('has-file');
+            document.getElementById('imagenesButton').classList.remove('has-file');
             document.getElementById('templateFileName').textContent = 'Seleccionar archivo...';
             document.getElementById('excelFileName').textContent = 'Seleccionar archivo...';
+            document.getElementById('imagenesFileName').textContent = 'Seleccionar archivo...';
             progressContainer.classList.remove('active');
             generateButton.disabled = false;
             generateButton.textContent = '🚀 Generar Diplomas';
@@ -230,6 +244,79 @@ document.getElementById('diplomaForm').addEventListener('submit', async function
     }
 });
 
+async function plantillaEnServidor(archivo) {
+    // crypto.subtle solo existe en contextos seguros (https o localhost)
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    
+    try {
+        const digest = await window.crypto.subtle.digest('SHA-256', await archivo.arrayBuffer());
+        const huella = Array.from(new Uint8Array(digest))
+            .map(b => b.toString(16).padStart(2, '0'))
+            .join('');
+        const response = await fetch(`/templates/${huella}`);
+        return response.ok ? huella : null;
+    } catch (e) {
+        return null;
+    }
+}
+
+async function leerError(response, mensajePorDefecto) {
+    // Intentar obtener el error como JSON, pero manejar si no es JSON
+    try {
+        const contentType = response.headers.get('content-type');
+        if (contentType && contentType.includes('application/json')) {
+            const errorData = await response.json();
+            return errorData.error || mensajePorDefecto;
+        }
+        const errorText = await response.text();
+        return errorText || mensajePorDefecto;
+    } catch (e) {
+        return `Error ${response.status}: ${response.statusText}`;
+    }
+}
+
+async function esperarTrabajo(trabajo) {
+    while (true) {
+        const response = await fetch(trabajo.url_estado);
+        
+        if (!response.ok) {
+            throw new Error(await leerError(response, 'Error al consultar el avance'));
+        }
+        
+        const estado = await response.json();
+        
+        if (estado.estado === 'completado') {
+            return estado;
+        }
+        
+        if (estado.estado === 'error') {
+            throw new Error(estado.error || 'Error al generar los diplomas');
+        }
+        
+        if (estado.total) {
+            const porcentaje = Math.min(99, Math.round(10 + 85 * estado.generadas / estado.total));
+            let texto = `Generando diplomas: ${estado.generadas} de ${estado.total}`;
+            if (estado.eta_segundos !== null) {
+                texto += ` (faltan ~${formatearTiempo(estado.eta_segundos)})`;
+            }
+            updateProgress(porcentaje, texto);
+        } else {
+            updateProgress(10, 'Leyendo el archivo Excel...');
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+function formatearTiempo(segundos) {
+    if (segundos < 60) {
+        return Math.ceil(segundos) + ' s';
+    }
+    return Math.ceil(segundos / 60) + ' min';
+}
+
 function updateProgress(percentage, text) {
     const progressFill = document.getElementById('progressFill');
     const progressText = document.getElementById('progressText');
@@ -1,18 +1,53 @@
-from flask import Flask, render_template, request, send_file, jsonify
+from flask import Flask, Request, Response, render_template, request, send_file, jsonify, url_for
 from flask_cors import CORS
-import pandas as pd
-from docx import Document
-from docx.oxml.text.paragraph import CT_P
-from docx.oxml.table import CT_Tbl
-from docx.table import _Cell, Table
-from docx.text.paragraph import Paragraph
+import atexit
+import base64
+import gzip
+import hashlib
+import importlib
+import io
+import json
 import os
-from openpyxl import load_workbook
-import zipfile
 import tempfile
+import threading
 import shutil
+import zipfile
+from datetime import datetime, timezone
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+# brotli es opcional: sin él los archivos de ejemplo solo se ofrecen con gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Solo nombres livianos: pandas, openpyxl y python-docx se importan en la primera generación
+# (con gunicorn, en precalentar), así las páginas estáticas se sirven apenas arranca el proceso
+from generador import (
+    COLUMNA_PLANTILLA,
+    COMPLETADO,
+    FORMATOS,
+    MODOS_ARCHIVO,
+    CacheDiplomas,
+    CacheMedios,
+    CachePlantillas,
+    ConvertidorPDF,
+    FilaSinPlantilla,
+    FilasAgrupadas,
+    GestorTrabajos,
+    ImagenNoDisponible,
+    Metricas,
+    RegistroEtapas,
+    clave_plantilla,
+    generar_archivo,
+    huella_contenido,
+    nombre_unico,
+    renderizar_diplomas,
+    resumen_trabajo,
+    unir_pdfs,
+)
+
 app = Flask(__name__)
 CORS(app)
 
@@ -22,108 +57,275 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Configuración
 UPLOAD_FOLDER = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'docx', 'xlsx', 'xls'}
+# Posibles nombres de los archivos de ejemplo incluidos en el proyecto, y segundos que el navegador puede guardarlos
+MAX_EDAD_EJEMPLOS = int(os.environ.get('DIPLOMAS_CACHE_EJEMPLOS_SEGUNDOS', 300))
+NOMBRES_EXCEL_EJEMPLO = [
+    'INFORMACIÓN DIPLOMAS.xlsx',  # Nombre exacto con acento
+    'INFORMACION DIPLOMAS.xlsx',  # Sin acento
+    'informacion_diplomas.xlsx'   # Minúsculas con guiones bajos
+]
+NOMBRES_PLANTILLA_EJEMPLO = [
+    'Diploma  nuevo 2025.docx',  # Nombre exacto con dos espacios
+    'Diploma nuevo 2025.docx',   # Con un espacio
+    'diploma nuevo 2025.docx',   # Minúsculas
+    'diploma_nuevo_2025.docx'    # Con guiones bajos
+]
+# Procesos para generar diplomas en paralelo (1 = secuencial)
+WORKERS = int(os.environ.get('DIPLOMAS_WORKERS', 1))
+# Empaquetado del ZIP por defecto: stored, deflated o combinado
+ARCHIVO_POR_DEFECTO = os.environ.get('DIPLOMAS_ARCHIVO', 'stored')
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Límites de las subidas (MB): la solicitud completa, cada Excel y cada plantilla
+MAX_SUBIDA_MB = int(os.environ.get('DIPLOMAS_MAX_SUBIDA_MB', 64))
+MAX_EXCEL_MB = int(os.environ.get('DIPLOMAS_MAX_EXCEL_MB', 50))
+MAX_PLANTILLA_MB = int(os.environ.get('DIPLOMAS_MAX_PLANTILLA_MB', 16))
+# Filas NDJSON enviadas en el cuerpo de /generate/stream (pueden traer fotos en data: URIs)
+MAX_NDJSON_MB = int(os.environ.get('DIPLOMAS_MAX_NDJSON_MB', 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_SUBIDA_MB * 1024 * 1024
+# Carpeta donde se escriben los archivos mientras se suben
+DIR_SUBIDAS = os.environ.get('DIPLOMAS_DIR_SUBIDAS', os.path.join(tempfile.gettempdir(), 'diplomas_subidas'))
+os.makedirs(DIR_SUBIDAS, exist_ok=True)
 
-def replace_text_in_paragraph(paragraph, search, replace):
-    """Reemplaza texto en un párrafo, incluso si está dividido en múltiples runs"""
-    full_text = ''.join(run.text for run in paragraph.runs)
-    
-    if search in full_text:
-        nuevo_texto = full_text.replace(search, replace)
-        
-        if paragraph.runs:
-            for i, run in enumerate(paragraph.runs):
-                if i == 0:
-                    run.text = nuevo_texto
-                else:
-                    run.text = ''
-        else:
-            paragraph.add_run(nuevo_texto)
-
-def replace_text_in_cell(cell, search, replace):
-    """Reemplaza texto en una celda, buscando en todos sus párrafos"""
-    for paragraph in cell.paragraphs:
-        replace_text_in_paragraph(paragraph, search, replace)
-
-def replace_text_in_xml_elements(element, search, replace):
-    """Función recursiva para buscar y reemplazar en elementos XML"""
-    from docx.oxml.ns import qn
-    
-    for t_elem in element.iter(qn('w:t')):
-        if t_elem.text and search in t_elem.text:
-            t_elem.text = t_elem.text.replace(search, replace)
-    
-    for t_elem in element.iter():
-        if t_elem.tag.endswith('}t') and hasattr(t_elem, 'text') and t_elem.text:
-            if search in t_elem.text:
-                t_elem.text = t_elem.text.replace(search, replace)
-
-def replace_text(doc, search, replace):
-    """Reemplaza texto en todo el documento de forma exhaustiva"""
-    for paragraph in doc.paragraphs:
-        replace_text_in_paragraph(paragraph, search, replace)
-    
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                replace_text_in_cell(cell, search, replace)
-    
-    for section in doc.sections:
-        for header in [section.header, section.first_page_header, section.even_page_header]:
-            for paragraph in header.paragraphs:
-                replace_text_in_paragraph(paragraph, search, replace)
-            for table in header.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        replace_text_in_cell(cell, search, replace)
-        
-        for footer in [section.footer, section.first_page_footer, section.even_page_footer]:
-            for paragraph in footer.paragraphs:
-                replace_text_in_paragraph(paragraph, search, replace)
-            for table in footer.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        replace_text_in_cell(cell, search, replace)
-    
-    replace_text_in_xml_elements(doc.element.body, search, replace)
+# Trabajos en segundo plano: carpeta compartida, cuántos a la vez y cuánto se guardan (segundos)
+TRABAJOS = GestorTrabajos(
+    os.environ.get('DIPLOMAS_DIR_TRABAJOS', os.path.join(tempfile.gettempdir(), 'diplomas_trabajos')),
+    max_simultaneos=int(os.environ.get('DIPLOMAS_TRABAJOS_SIMULTANEOS', 2)),
+    ttl=int(os.environ.get('DIPLOMAS_TTL_TRABAJOS', 3600)),
+    max_en_cola=int(os.environ.get('DIPLOMAS_COLA_TRABAJOS', 8)),
+)
 
-def formatear_numero_con_puntos(numero):
-    """Formatea un número con puntos como separadores de miles (formato colombiano)"""
-    if numero is None:
-        return ''
-    
-    num_str = str(numero).strip()
-    
-    if num_str == '' or num_str.lower() == 'nan':
-        return ''
+# Descargas directas (/generate y /generate/stream) a la vez; con más, o con la cola de trabajos
+# llena, se responde 429
+GENERACIONES = threading.BoundedSemaphore(int(os.environ.get('DIPLOMAS_GENERACIONES_SIMULTANEAS', 4)))
+# Segundos sugeridos en Retry-After
+REINTENTAR_EN = 10
+
+# PDF: procesos de LibreOffice que quedan abiertos y ejecutable a usar
+CONVERTIDORES_PDF = int(os.environ.get('DIPLOMAS_CONVERTIDORES_PDF', 2))
+SOFFICE = os.environ.get('DIPLOMAS_SOFFICE', 'soffice')
+UNOSERVER = os.environ.get('DIPLOMAS_UNOSERVER', 'unoserver')
+_convertidor = None
+_lock_convertidor = threading.Lock()
+
+# Plantillas por hash de contenido: carpeta donde se guardan y memoria para las compiladas (MB)
+PLANTILLAS = CachePlantillas(
+    os.environ.get('DIPLOMAS_DIR_PLANTILLAS', os.path.join(tempfile.gettempdir(), 'diplomas_plantillas')),
+    max_bytes=int(os.environ.get('DIPLOMAS_CACHE_PLANTILLAS_MB', 64)) * 1024 * 1024,
+)
+
+# Diplomas ya generados, por plantilla y contenido de la fila: al volver a subir un Excel corregido
+# solo se generan las filas que cambiaron. Tamaño máximo (MB, 0 lo desactiva) y días sin uso que se conservan
+CACHE_DIPLOMAS_MB = int(os.environ.get('DIPLOMAS_CACHE_DIPLOMAS_MB', 512))
+DIPLOMAS = CacheDiplomas(
+    os.environ.get('DIPLOMAS_DIR_DIPLOMAS', os.path.join(tempfile.gettempdir(), 'diplomas_cache')),
+    max_bytes=CACHE_DIPLOMAS_MB * 1024 * 1024,
+    max_edad=float(os.environ.get('DIPLOMAS_CACHE_DIPLOMAS_DIAS', 7)) * 24 * 3600,
+) if CACHE_DIPLOMAS_MB > 0 else None
+
+# Fotos y códigos QR ya preparados, por hash de contenido (MB), e hilos que los preparan mientras se generan
+# los diplomas
+MEDIOS = CacheMedios(max_bytes=int(os.environ.get('DIPLOMAS_CACHE_IMAGENES_MB', 32)) * 1024 * 1024)
+HILOS_IMAGENES = int(os.environ.get('DIPLOMAS_HILOS_IMAGENES', 2))
+
+# Métricas del proceso para GET /metrics: tiempos por etapa, filas, bytes y fallos
+METRICAS = Metricas()
+METRICAS.agregar_medidor('diplomas_cache_plantillas_aciertos_total', 'counter',
+                         'Plantillas compiladas tomadas del caché', lambda: PLANTILLAS.aciertos)
+METRICAS.agregar_medidor('diplomas_cache_plantillas_fallos_total', 'counter',
+                         'Plantillas que hubo que compilar', lambda: PLANTILLAS.fallos)
+METRICAS.agregar_medidor('diplomas_cache_plantillas_bytes', 'gauge',
+                         'Memoria aproximada de las plantillas compiladas en caché',
+                         lambda: PLANTILLAS.estadisticas()['bytes'])
+METRICAS.agregar_medidor('diplomas_cache_imagenes_bytes', 'gauge',
+                         'Memoria de las fotos y códigos QR preparados en caché',
+                         lambda: MEDIOS.estadisticas()['bytes'])
+if DIPLOMAS is not None:
+    METRICAS.agregar_medidor('diplomas_cache_diplomas_bytes', 'gauge',
+                             'Bytes de los diplomas guardados en el caché de filas',
+                             lambda: DIPLOMAS.estadisticas()['bytes'])
+
+def obtener_convertidor():
+    """Pool de LibreOffice compartido por todas las solicitudes; se inicia con el primer PDF"""
+    global _convertidor
+    with _lock_convertidor:
+        if _convertidor is None:
+            _convertidor = ConvertidorPDF(procesos=CONVERTIDORES_PDF, soffice=SOFFICE, unoserver=UNOSERVER)
+            atexit.register(_convertidor.cerrar)
+        return _convertidor
+
+def buscar_ejemplo(nombres):
+    """Ruta del primer archivo de ejemplo que exista (relativo o junto a app.py), o None"""
+    for name in nombres:
+        for full_path in (os.path.abspath(name), os.path.join(BASE_DIR, name)):
+            if os.path.exists(full_path):
+                return full_path
+    return None
+
+def precalentar():
+    """Importa el motor completo, deja compilada la plantilla de ejemplo y genera un diploma de prueba.
+
+    Con gunicorn y preload_app se llama una vez en el proceso principal: los
+    módulos, la plantilla compilada y el código que se carga al generar el
+    primer diploma quedan compartidos por todos los workers.
+    """
+    from generador import HojaExcel
     
-    if '.' in num_str and not num_str.startswith('.'):
-        partes = num_str.split('.')
-        es_formato_valido = all(len(p) == 3 for p in partes[:-1]) and len(partes[-1]) <= 3
-        if es_formato_valido:
-            return num_str
+    # Los módulos que app.py importa recién en la primera generación quedan cargados
+    for modulo in ('excel', 'lectores', 'plantilla', 'documento_unico'):
+        importlib.import_module(f'generador.{modulo}')
     
-    try:
-        if isinstance(numero, (int, float)):
-            num_int = int(numero)
-        elif num_str.replace('.', '').isdigit():
-            num_int = int(num_str.replace('.', ''))
-        else:
-            return num_str
-        
-        num_str_formateado = ''
-        num_str_sin_puntos = str(num_int)
-        
-        for i, digito in enumerate(reversed(num_str_sin_puntos)):
-            if i > 0 and i % 3 == 0:
-                num_str_formateado = '.' + num_str_formateado
-            num_str_formateado = digito + num_str_formateado
-        
-        return num_str_formateado
-    except (ValueError, TypeError):
-        return num_str
+    plantilla_path = buscar_ejemplo(NOMBRES_PLANTILLA_EJEMPLO)
+    excel_path = buscar_ejemplo(NOMBRES_EXCEL_EJEMPLO)
+    if plantilla_path is None or excel_path is None:
+        return
+    huella = PLANTILLAS.guardar_ruta(plantilla_path)
+    with HojaExcel(excel_path) as hoja:
+        plantilla = PLANTILLAS.obtener(huella, hoja.columnas)
+        for _, valores in hoja.filas():
+            plantilla.renderizar(valores, io.BytesIO())
+            break
+
+def allowed_file(filename, extensiones=ALLOWED_EXTENSIONS):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensiones
+
+def es_docx(contenido):
+    """Un .docx es un ZIP; lo demás se rechaza antes de guardarlo en el caché de plantillas"""
+    return zipfile.is_zipfile(io.BytesIO(contenido))
+
+class ArchivoEnDisco:
+    """Archivo subido que se escribe en disco a medida que llega, con un tamaño máximo"""
+
+    def __init__(self, archivo, limite):
+        self._archivo = archivo
+        self._limite = limite
+        self._tamano = 0
+
+    def write(self, datos):
+        self._tamano += len(datos)
+        if self._tamano > self._limite:
+            raise RequestEntityTooLarge(f'El archivo supera el máximo de {self._limite // (1024 * 1024)} MB')
+        return self._archivo.write(datos)
+
+    def __getattr__(self, nombre):
+        return getattr(self._archivo, nombre)
+
+    def __iter__(self):
+        return iter(self._archivo)
+
+class SolicitudConSubidas(Request):
+    """Request que guarda cada archivo del formulario directamente en DIR_SUBIDAS, nunca en memoria"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        es_plantilla = (filename or '').lower().endswith('.docx')
+        limite = (MAX_PLANTILLA_MB if es_plantilla else MAX_EXCEL_MB) * 1024 * 1024
+        archivo = tempfile.NamedTemporaryFile(dir=DIR_SUBIDAS, prefix='subida_', delete=False)
+        self.__dict__.setdefault('_subidas', []).append(archivo.name)
+        return ArchivoEnDisco(archivo, limite)
+
+    def close(self):
+        # Los archivos que no se movieron con guardar_subida se borran al terminar la solicitud
+        super().close()
+        for ruta in self.__dict__.get('_subidas', ()):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+app.request_class = SolicitudConSubidas
+
+def guardar_subida(archivo, destino):
+    """Mueve un archivo subido a destino, sin copiarlo si ya está en disco"""
+    if isinstance(archivo.stream, ArchivoEnDisco):
+        archivo.stream.flush()
+        shutil.move(archivo.stream.name, destino)
+    else:
+        archivo.save(destino)
+
+@app.errorhandler(RequestEntityTooLarge)
+def subida_demasiado_grande(e):
+    # Sin descripción propia es el límite de la solicitud completa (MAX_CONTENT_LENGTH)
+    if e.description == RequestEntityTooLarge.description:
+        return jsonify({'error': f'La solicitud supera el máximo de {MAX_SUBIDA_MB} MB'}), 413
+    return jsonify({'error': e.description}), 413
+
+def servidor_ocupado():
+    """Respuesta cuando ya hay demasiadas generaciones en curso"""
+    respuesta = jsonify({'error': 'El servidor está ocupado con otras generaciones, intenta de nuevo en unos segundos'})
+    respuesta.headers['Retry-After'] = str(REINTENTAR_EN)
+    return respuesta, 429
+
+class ArchivoEjemplo:
+    """Archivo de ejemplo leído una sola vez al arrancar, servido desde memoria.
+
+    La huella (SHA-256) es su ETag, así que el navegador puede preguntar con
+    If-None-Match y recibir 304. También se aceptan peticiones Range. Las
+    versiones gzip (y brotli, si está instalado) se guardan solo si ahorran
+    al menos un 10 %; un .docx o un .xlsx ya vienen comprimidos y casi nunca
+    lo hacen.
+    """
+
+    def __init__(self, ruta, mimetype, download_name):
+        self.ruta = ruta
+        self.mimetype = mimetype
+        self.download_name = download_name
+        with open(ruta, 'rb') as f:
+            self.contenido = f.read()
+        self.huella = huella_contenido(self.contenido)
+        self.modificado = datetime.fromtimestamp(os.path.getmtime(ruta), timezone.utc)
+
+        self.variantes = {}
+        comprimidos = {'gzip': gzip.compress(self.contenido, 9, mtime=0)}
+        if brotli is not None:
+            comprimidos['br'] = brotli.compress(self.contenido)
+        for codificacion, datos in comprimidos.items():
+            if len(datos) <= len(self.contenido) * 0.9:
+                self.variantes[codificacion] = datos
+
+    def respuesta(self):
+        """Respuesta para la solicitud actual: 304, 206 con el rango pedido, o el archivo completo"""
+        codificacion = next((c for c in ('br', 'gzip') if c in self.variantes and c in request.accept_encodings),
+                            None)
+        datos = self.variantes[codificacion] if codificacion else self.contenido
+
+        respuesta = Response(datos, mimetype=self.mimetype)
+        respuesta.headers.set('Content-Disposition', 'attachment', filename=self.download_name)
+        if self.variantes:
+            respuesta.vary.add('Accept-Encoding')
+        if codificacion:
+            respuesta.content_encoding = codificacion
+        respuesta.set_etag(f"{self.huella}-{codificacion}" if codificacion else self.huella)
+        respuesta.last_modified = self.modificado
+        respuesta.cache_control.public = True
+        respuesta.cache_control.max_age = MAX_EDAD_EJEMPLOS
+        return respuesta.make_conditional(request, accept_ranges=True, complete_length=len(datos))
+
+def cargar_ejemplo(nombres, mimetype, download_name):
+    """ArchivoEjemplo del primer nombre que exista, o None si no está en el proyecto"""
+    ruta = buscar_ejemplo(nombres)
+    if ruta is None:
+        print(f"Archivo de ejemplo no encontrado: {nombres[0]} (directorio base: {BASE_DIR})")
+        return None
+    return ArchivoEjemplo(ruta, mimetype, download_name)
+
+# Los archivos de ejemplo se buscan y se leen una sola vez; cambiarlos requiere reiniciar el servidor
+EXCEL_EJEMPLO = cargar_ejemplo(NOMBRES_EXCEL_EJEMPLO,
+                               'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                               'INFORMACION_DIPLOMAS.xlsx')
+PLANTILLA_EJEMPLO = cargar_ejemplo(NOMBRES_PLANTILLA_EJEMPLO,
+                                   'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                                   'Diploma_nuevo_2025.docx')
+# El hash de la plantilla de ejemplo (cabecera X-Plantilla de /download-word) queda válido desde el arranque
+if PLANTILLA_EJEMPLO is not None:
+    PLANTILLAS.guardar(PLANTILLA_EJEMPLO.contenido)
+
+def plantilla_guardada(huella):
+    """Si la plantilla con esa huella está en el caché; la de ejemplo se vuelve a guardar si la limpieza la borró"""
+    if PLANTILLAS.ruta(huella) is not None:
+        return True
+    if PLANTILLA_EJEMPLO is None or huella != PLANTILLA_EJEMPLO.huella:
+        return False
+    PLANTILLAS.guardar(PLANTILLA_EJEMPLO.contenido)
+    return True
 
 @app.route('/')
 def index():
@@ -135,256 +337,639 @@ def app_js():
 
 @app.route('/download-excel', methods=['GET'])
 def download_excel():
-    try:
-        # Lista de posibles nombres del archivo Excel
-        possible_names = [
-            'INFORMACIÓN DIPLOMAS.xlsx',  # Nombre exacto con acento
-            'INFORMACION DIPLOMAS.xlsx',  # Sin acento
-            'informacion_diplomas.xlsx'   # Minúsculas con guiones bajos
-        ]
-        
-        print(f"Directorio base: {BASE_DIR}")
-        print(f"Directorio de trabajo actual: {os.getcwd()}")
-        print(f"Buscando archivo Excel...")
-        
-        # Buscar el archivo en el directorio base
-        for name in possible_names:
-            # Intentar con ruta relativa primero
-            if os.path.exists(name):
-                full_path = os.path.abspath(name)
-                print(f"Archivo encontrado (relativo): {full_path}")
-                return send_file(
-                    full_path,
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    as_attachment=True,
-                    download_name='INFORMACION_DIPLOMAS.xlsx'
-                )
-            
-            # Intentar con ruta absoluta desde BASE_DIR
-            full_path = os.path.join(BASE_DIR, name)
-            if os.path.exists(full_path):
-                print(f"Archivo encontrado (absoluto): {full_path}")
-                return send_file(
-                    full_path,
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    as_attachment=True,
-                    download_name='INFORMACION_DIPLOMAS.xlsx'
-                )
-            
-            print(f"No encontrado: {name} (ruta: {full_path})")
-        
-        # Listar archivos en el directorio para debugging
-        print(f"Archivos en directorio base:")
-        try:
-            for file in os.listdir(BASE_DIR):
-                print(f"  - {file}")
-        except Exception as e:
-            print(f"Error al listar directorio: {e}")
-        
+    if EXCEL_EJEMPLO is None:
         error_msg = 'Archivo Excel de ejemplo no encontrado. Verifica que el archivo "INFORMACIÓN DIPLOMAS.xlsx" esté en el directorio raíz del proyecto.'
-        print(f"ERROR: {error_msg}")
         return jsonify({'error': error_msg}), 404
-        
-    except Exception as e:
-        import traceback
-        error_msg = f"Error al descargar Excel: {str(e)}"
-        print(error_msg)
-        print(traceback.format_exc())
-        return jsonify({'error': error_msg}), 500
+    return EXCEL_EJEMPLO.respuesta()
 
 @app.route('/download-word', methods=['GET'])
 def download_word():
-    try:
-        # Lista de posibles nombres del archivo Word
-        possible_names = [
-            'Diploma  nuevo 2025.docx',  # Nombre exacto con dos espacios
-            'Diploma nuevo 2025.docx',   # Con un espacio
-            'diploma nuevo 2025.docx',   # Minúsculas
-            'diploma_nuevo_2025.docx'    # Con guiones bajos
-        ]
+    if PLANTILLA_EJEMPLO is None:
+        error_msg = 'Archivo Word de ejemplo no encontrado. Verifica que el archivo "Diploma  nuevo 2025.docx" esté en el directorio raíz del proyecto.'
+        return jsonify({'error': error_msg}), 404
+    
+    # La plantilla de ejemplo ya está en el caché desde el arranque: usarla tal cual no la vuelve a analizar
+    respuesta = PLANTILLA_EJEMPLO.respuesta()
+    respuesta.headers['X-Plantilla'] = PLANTILLA_EJEMPLO.huella
+    return respuesta
+
+def leer_solicitud():
+    """Valida los archivos y opciones del formulario; devuelve (datos, None) o (None, respuesta de error).
+    
+    La plantilla puede llegar como archivo o, si ya se envió antes, solo con su hash en el campo plantilla.
+    Con varias plantillas (varios archivos template, o plantilla=nombre=hash), la columna indicada en
+    columna_plantilla (PLANTILLA por defecto) elige la de cada fila por el nombre del archivo sin .docx.
+    """
+    # Verificar que se hayan enviado los archivos
+    huellas = request.form.getlist('plantilla')
+    template_files = request.files.getlist('template')
+    if 'excel' not in request.files or (not template_files and not huellas):
+        return None, (jsonify({'error': 'Faltan archivos requeridos'}), 400)
+    
+    excel_file = request.files['excel']
+    if huellas:
+        template_files = [archivo for archivo in template_files if archivo.filename]
+    
+    if excel_file.filename == '' or any(archivo.filename == '' for archivo in template_files):
+        return None, (jsonify({'error': 'No se seleccionaron archivos'}), 400)
+    
+    # Los datos pueden venir en Excel, CSV, Parquet o Arrow
+    from generador import EXTENSIONES_DATOS
+    
+    if not allowed_file(excel_file.filename, EXTENSIONES_DATOS) or \
+            not all(allowed_file(archivo.filename) for archivo in template_files):
+        return None, (jsonify({'error': 'Tipo de archivo no permitido'}), 400)
+    
+    # Fotos y firmas de las filas, opcionales, en un ZIP
+    imagenes_file = request.files.get('imagenes')
+    if imagenes_file is not None and imagenes_file.filename and not allowed_file(imagenes_file.filename, {'zip'}):
+        return None, (jsonify({'error': 'Las imágenes se envían en un archivo .zip'}), 400)
+    
+    # Nombre de cada plantilla (el del archivo sin extensión) y su hash; vacío si es una sola enviada por hash
+    plantillas = {}
+    for valor in huellas:
+        nombre, _, huella = valor.rpartition('=')
+        if not plantilla_guardada(huella):
+            return None, (jsonify({'error': 'Plantilla no encontrada, envía el archivo de nuevo'}), 404)
+        plantillas[nombre.strip()] = huella
+    nombres = list(plantillas) + [os.path.splitext(os.path.basename(archivo.filename))[0]
+                                  for archivo in template_files]
+    
+    columna = request.form.get('columna_plantilla') or (COLUMNA_PLANTILLA if len(nombres) > 1 else None)
+    if columna:
+        claves = [clave_plantilla(nombre) for nombre in nombres]
+        if '' in claves:
+            return None, (jsonify({'error': 'Con varias plantillas, cada hash se envía como plantilla=nombre=hash'}),
+                          400)
+        if len(set(claves)) < len(claves):
+            return None, (jsonify({'error': 'Dos plantillas tienen el mismo nombre'}), 400)
+    elif len(nombres) > 1:
+        return None, (jsonify({'error': 'Envía una sola plantilla'}), 400)
+    
+    opciones, error = leer_opciones(request.form)
+    if error:
+        return None, error
+    if opciones['unir'] and opciones['formato'] == 'docx' and columna:
+        return None, (jsonify({'error': 'El documento Word único admite una sola plantilla'}), 400)
+    
+    # Todas se validan antes de guardar ninguna: un archivo que no es .docx no llega al caché
+    contenidos = [template_file.read() for template_file in template_files]
+    if not all(es_docx(contenido) for contenido in contenidos):
+        return None, (jsonify({'error': 'La plantilla no es un documento Word (.docx) válido'}), 400)
+    
+    # Una plantilla ya recibida antes (mismo contenido) se reutiliza sin volver a analizarla
+    for nombre, contenido in zip(nombres[len(plantillas):], contenidos):
+        plantillas[nombre] = PLANTILLAS.guardar(contenido)
+    
+    opciones.update(columna_plantilla=columna.strip().upper() if columna else None, imagenes=None)
+    return (plantillas, excel_file, opciones), None
+
+def leer_opciones(campos):
+    """Modo del ZIP, nivel, formato y unir del formulario o de la URL; devuelve (opciones, None) o (None, error)"""
+    # Modo del ZIP y nivel de compresión (0-9) opcionales
+    modo_archivo = campos.get('archivo', ARCHIVO_POR_DEFECTO)
+    if modo_archivo not in MODOS_ARCHIVO:
+        return None, (jsonify({'error': f'Modo de archivo no válido. Usa uno de: {", ".join(MODOS_ARCHIVO)}'}), 400)
+    
+    nivel = campos.get('nivel')
+    if nivel is not None:
+        if not nivel.isdigit() or int(nivel) > 9:
+            return None, (jsonify({'error': 'El nivel de compresión debe estar entre 0 y 9'}), 400)
+        nivel = int(nivel)
+    
+    # Formato de los diplomas y si se unen en un solo archivo (.docx con una sección por fila, o PDF)
+    formato = campos.get('formato', 'docx')
+    if formato not in FORMATOS:
+        return None, (jsonify({'error': f'Formato no válido. Usa uno de: {", ".join(FORMATOS)}'}), 400)
+    unir = campos.get('unir', '').lower() in ('1', 'true', 'si', 'sí', 'on')
+    return {'archivo': modo_archivo, 'nivel': nivel, 'formato': formato, 'unir': unir}, None
+
+@app.route('/templates', methods=['POST'])
+def upload_template():
+    """Guarda una plantilla y devuelve su hash, para usarla después sin volver a enviarla"""
+    template_file = request.files.get('template')
+    if template_file is None or template_file.filename == '':
+        return jsonify({'error': 'Falta la plantilla'}), 400
+    if not allowed_file(template_file.filename):
+        return jsonify({'error': 'Tipo de archivo no permitido'}), 400
+    
+    contenido = template_file.read()
+    if not es_docx(contenido):
+        return jsonify({'error': 'La plantilla no es un documento Word (.docx) válido'}), 400
+    return jsonify({'plantilla': PLANTILLAS.guardar(contenido)}), 201
+
+@app.route('/templates/<huella>', methods=['GET'])
+def template_status(huella):
+    if not plantilla_guardada(huella):
+        return jsonify({'error': 'Plantilla no encontrada'}), 404
+    return jsonify({'plantilla': huella})
+
+def guardar_imagenes(directorio, registro):
+    """Guarda el ZIP de imágenes de la solicitud en directorio; devuelve su ruta, o None si no se envió"""
+    imagenes_file = request.files.get('imagenes')
+    if imagenes_file is None or not imagenes_file.filename:
+        return None
+    ruta = os.path.join(directorio, 'imagenes.zip')
+    with registro.etapa('guardar_subida'):
+        guardar_subida(imagenes_file, ruta)
+    if not zipfile.is_zipfile(ruta):
+        raise ImagenNoDisponible('El archivo de imágenes no es un ZIP válido')
+    return ruta
+
+def cabecera_plantillas(plantillas):
+    """Hash de la plantilla, o nombre=hash de cada una separados por comas, para reutilizarlas después"""
+    if len(plantillas) == 1:
+        return next(iter(plantillas.values()))
+    return ', '.join(f'{nombre}={huella}' for nombre, huella in plantillas.items())
+
+def nombre_salida(opciones):
+    """Nombre y tipo del archivo que se entrega: el ZIP, o el .docx o PDF con todos los diplomas"""
+    if opciones['unir'] and opciones['formato'] == 'pdf':
+        return 'diplomas_generados.pdf', 'application/pdf'
+    if opciones['unir']:
+        return 'diplomas_generados.docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    return 'diplomas_generados.zip', 'application/zip'
+
+def modo_plantilla(opciones):
+    """El .docx único se arma sobre la ruta rápida; lo demás acepta cualquier plantilla"""
+    return 'rapido' if opciones['unir'] and opciones['formato'] == 'docx' else 'auto'
+
+def cache_diplomas(huella, plantilla, opciones):
+    """Caché de las filas de esta plantilla y formato; el .docx único no genera diplomas sueltos"""
+    if DIPLOMAS is None or (opciones['unir'] and opciones['formato'] == 'docx'):
+        return None
+    return DIPLOMAS.para(huella, plantilla, opciones['formato'])
+
+def unir_en_pdf(diplomas):
+    salida = io.BytesIO()
+    unir_pdfs((contenido for _, contenido in diplomas), salida)
+    yield salida.getvalue()
+
+def preparar_grupos(plantillas, hoja, opciones, registro, directorio):
+    """Grupos (carpeta, hash, plantilla compilada, filas) que se generan, uno por plantilla con filas.
+
+    Con una sola plantilla las filas del Excel llegan en streaming. Con varias, primero se reparten
+    según la columna de plantilla (guardándolas en directorio) y cada grupo va a su carpeta del ZIP.
+    """
+    columna = opciones['columna_plantilla']
+    # La lectura de la hoja se mide aquí y solo aquí, se agrupen o no las filas
+    filas = registro.iterar('leer_excel', hoja.filas())
+    if not columna:
+        (huella,) = plantillas.values()
+        with registro.etapa('plantilla'):
+            plantilla = PLANTILLAS.obtener(huella, hoja.columnas, modo=modo_plantilla(opciones))
+        # Sin Pillow o segno, una plantilla con fotos o QR falla antes de empezar
+        MEDIOS.comprobar(plantilla.imagenes)
+        return [('', huella, plantilla, filas)]
+    
+    if columna not in hoja.columnas:
+        raise FilaSinPlantilla(f'El Excel no tiene la columna {columna}')
+    with registro.etapa('agrupar_filas'):
+        agrupadas = FilasAgrupadas(filas, columna, plantillas, directorio)
+    
+    # Cada plantilla usada se compila una vez (o sale del caché) y sus filas se generan juntas
+    grupos = []
+    for nombre in agrupadas.usadas():
+        with registro.etapa('plantilla'):
+            plantilla = PLANTILLAS.obtener(plantillas[nombre], hoja.columnas, modo=modo_plantilla(opciones))
+        MEDIOS.comprobar(plantilla.imagenes)
+        # Volver a leer las filas guardadas de cada grupo es parte del costo de agrupar
+        grupos.append((nombre, plantillas[nombre], plantilla,
+                       registro.iterar('agrupar_filas', agrupadas.filas(nombre))))
+    return grupos
+
+def preparar_imagenes(plantilla, filas, origen, registro, al_fallar=None):
+    """Filas con sus fotos y códigos QR listos, preparados en hilos aparte unas filas por delante del render"""
+    if not plantilla.imagenes:
+        return filas
+    return registro.iterar('preparar_imagenes', MEDIOS.preparar(filas, plantilla.imagenes, origen,
+                                                                hilos=HILOS_IMAGENES, al_fallar=al_fallar))
+
+def generar_diplomas_grupo(plantilla, filas, opciones, registro, cache=None, origen=None, al_fallar=None):
+    """(nombre, contenido) de cada diploma de una plantilla, en el formato pedido"""
+    por_fila = {'filas_generadas': 1, 'placeholders_reemplazados': plantilla.placeholders}
+    
+    # Cada diploma pasa de memoria a la salida en cuanto se genera (en paralelo si DIPLOMAS_WORKERS > 1)
+    def generar(filas):
+        diplomas = registro.iterar('renderizar', renderizar_diplomas(plantilla, filas, workers=WORKERS), por_fila)
+        if opciones['formato'] == 'pdf':
+            diplomas = registro.iterar('convertir_pdf', obtener_convertidor().convertir_diplomas(diplomas))
+        return diplomas
+    
+    # Las imágenes van antes del caché: la clave de cada fila incluye el hash de sus imágenes
+    filas = preparar_imagenes(plantilla, filas, origen, registro, al_fallar)
+    if cache is None:
+        return generar(filas)
+    return registro.iterar('cache_diplomas', cache.generar(filas, generar))
+
+def generar_salida(grupos, opciones, registro, contar=None):
+    """Genera por partes los bytes del archivo que se entrega, según las opciones de la solicitud.
+
+    grupos viene de preparar_grupos. El tiempo de cada etapa y los contadores (filas, placeholders,
+    bytes) quedan en registro. Las filas que no cambiaron desde una generación anterior se toman del
+    caché de diplomas.
+    """
+    from generador import abrir_imagenes
+    
+    caches = []
+    origen = abrir_imagenes(opciones['imagenes']) if opciones['imagenes'] else None
+    if opciones['unir'] and opciones['formato'] == 'docx':
+        from generador import docx_unico_en_streaming
         
-        print(f"Directorio base: {BASE_DIR}")
-        print(f"Directorio de trabajo actual: {os.getcwd()}")
-        print(f"Buscando archivo Word...")
+        # leer_solicitud solo acepta una plantilla para el documento único
+        (_, _, plantilla, filas), = grupos
+        filas = preparar_imagenes(plantilla, filas, origen, registro)
+        if contar is not None:
+            filas = contar(filas)
         
-        # Buscar el archivo en el directorio base
-        for name in possible_names:
-            # Intentar con ruta relativa primero
-            if os.path.exists(name):
-                full_path = os.path.abspath(name)
-                print(f"Archivo encontrado (relativo): {full_path}")
-                return send_file(
-                    full_path,
-                    mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                    as_attachment=True,
-                    download_name='Diploma_nuevo_2025.docx'
-                )
-            
-            # Intentar con ruta absoluta desde BASE_DIR
-            full_path = os.path.join(BASE_DIR, name)
-            if os.path.exists(full_path):
-                print(f"Archivo encontrado (absoluto): {full_path}")
-                return send_file(
-                    full_path,
-                    mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                    as_attachment=True,
-                    download_name='Diploma_nuevo_2025.docx'
-                )
-            
-            print(f"No encontrado: {name} (ruta: {full_path})")
+        def valores_filas():
+            for _, valores in filas:
+                registro.contar('filas_generadas')
+                registro.contar('placeholders_reemplazados', plantilla.placeholders)
+                yield valores
         
-        # Listar archivos en el directorio para debugging
-        print(f"Archivos en directorio base:")
-        try:
-            for file in os.listdir(BASE_DIR):
-                print(f"  - {file}")
-        except Exception as e:
-            print(f"Error al listar directorio: {e}")
+        salida = registro.iterar('documento_unico', docx_unico_en_streaming(
+            plantilla, valores_filas(), nivel=opciones['nivel']))
+    else:
+        def diplomas_grupos():
+            for carpeta, huella, plantilla, filas in grupos:
+                cache = cache_diplomas(huella, plantilla, opciones)
+                if cache is not None:
+                    caches.append(cache)
+                diplomas = generar_diplomas_grupo(plantilla, filas, opciones, registro, cache=cache, origen=origen)
+                if carpeta:
+                    diplomas = ((f'{carpeta}/{nombre}', contenido) for nombre, contenido in diplomas)
+                yield from diplomas
         
-        error_msg = 'Archivo Word de ejemplo no encontrado. Verifica que el archivo "Diploma  nuevo 2025.docx" esté en el directorio raíz del proyecto.'
-        print(f"ERROR: {error_msg}")
-        return jsonify({'error': error_msg}), 404
+        diplomas = diplomas_grupos()
+        if contar is not None:
+            diplomas = contar(diplomas)
         
-    except Exception as e:
-        import traceback
-        error_msg = f"Error al descargar Word: {str(e)}"
-        print(error_msg)
-        print(traceback.format_exc())
-        return jsonify({'error': error_msg}), 500
+        if opciones['unir']:
+            salida = registro.iterar('empaquetar', unir_en_pdf(diplomas))
+        else:
+            salida = registro.iterar('empaquetar', generar_archivo(diplomas, modo=opciones['archivo'],
+                                                                   nivel=opciones['nivel']))
+    
+    try:
+        for trozo in salida:
+            registro.contar('bytes_escritos', len(trozo))
+            yield trozo
+    finally:
+        for cache in caches:
+            registro.contar('filas_en_cache', cache.aciertos)
+        if origen is not None:
+            origen.cerrar()
+
+def con_lugar(responder):
+    """Respuesta de responder() con un lugar entre las GENERACIONES simultáneas, o 429 si no hay"""
+    # El lugar se pide antes de leer el cuerpo: una solicitud rechazada no llega a guardarse en disco
+    if not GENERACIONES.acquire(blocking=False):
+        return servidor_ocupado()
+    try:
+        respuesta = responder()
+    except BaseException:
+        GENERACIONES.release()
+        raise
+    # Una descarga en streaming ocupa su lugar hasta que termina de enviarse
+    if isinstance(respuesta, Response) and respuesta.is_streamed:
+        respuesta.call_on_close(GENERACIONES.release)
+    else:
+        GENERACIONES.release()
+    return respuesta
 
 @app.route('/generate', methods=['POST'])
 def generate_diplomas():
+    return con_lugar(generar_descarga)
+
+def generar_descarga():
+    """Respuesta de /generate: el archivo en streaming o el error en JSON"""
+    from generador import FormatoNoSoportado, PlantillaNoSoportada, abrir_hoja
+    
+    registro = RegistroEtapas()
     try:
-        # Verificar que se hayan enviado los archivos
-        if 'template' not in request.files or 'excel' not in request.files:
-            return jsonify({'error': 'Faltan archivos requeridos'}), 400
-        
-        template_file = request.files['template']
-        excel_file = request.files['excel']
-        
-        if template_file.filename == '' or excel_file.filename == '':
-            return jsonify({'error': 'No se seleccionaron archivos'}), 400
-        
-        if not allowed_file(template_file.filename) or not allowed_file(excel_file.filename):
-            return jsonify({'error': 'Tipo de archivo no permitido'}), 400
+        with registro.etapa('guardar_subida'):
+            datos, error = leer_solicitud()
+        if error:
+            return error
+        plantillas, excel_file, opciones = datos
         
         # Crear directorio temporal para trabajar
         temp_dir = tempfile.mkdtemp()
-        output_folder = os.path.join(temp_dir, 'DIPLOMAS_GENERADOS')
-        os.makedirs(output_folder, exist_ok=True)
         
         try:
-            # Guardar archivos temporalmente
-            template_path = os.path.join(temp_dir, secure_filename(template_file.filename))
+            # Guardar el Excel temporalmente
             excel_path = os.path.join(temp_dir, secure_filename(excel_file.filename))
+            with registro.etapa('guardar_subida'):
+                guardar_subida(excel_file, excel_path)
+            opciones['imagenes'] = guardar_imagenes(temp_dir, registro)
             
-            template_file.save(template_path)
-            excel_file.save(excel_path)
-            
-            # Leer Excel usando pandas
-            df = pd.read_excel(excel_path, dtype=str, keep_default_na=False)
-            df.columns = df.columns.str.upper()
-            
-            # Leer el Excel con openpyxl para obtener los valores formateados
-            wb = load_workbook(excel_path, data_only=False)
-            ws = wb.active
-            
-            # Obtener nombres de columnas del Excel
-            excel_headers = []
-            for cell in ws[1]:
-                header_val = str(cell.value).upper().strip() if cell.value else ''
-                excel_headers.append(header_val)
-            
-            # Formatear N_DOCUMENTO si existe
-            if 'N_DOCUMENTO' in excel_headers:
-                n_doc_col_idx = excel_headers.index('N_DOCUMENTO')
-                
-                for idx in range(len(df)):
-                    cell = ws.cell(row=idx + 2, column=n_doc_col_idx + 1)
-                    
-                    if cell.value is not None:
-                        valor_crudo = cell.value
-                        valor_formateado = formatear_numero_con_puntos(valor_crudo)
-                        df.iloc[idx, df.columns.get_loc('N_DOCUMENTO')] = valor_formateado
-            
-            # Leer LUGAR_EXPEDICION directamente del Excel
-            lugar_expedicion_valores = {}
-            if 'LUGAR_EXPEDICION' in excel_headers:
-                lugar_exp_col_idx = excel_headers.index('LUGAR_EXPEDICION')
-                for idx in range(len(df)):
-                    cell = ws.cell(row=idx + 2, column=lugar_exp_col_idx + 1)
-                    if cell.value is not None:
-                        valor_exacto = str(cell.value)
-                        lugar_expedicion_valores[idx] = valor_exacto
-                    else:
-                        lugar_expedicion_valores[idx] = ''
-            
-            # Actualizar LUGAR_EXPEDICION en el DataFrame
-            if 'LUGAR_EXPEDICION' in df.columns and lugar_expedicion_valores:
-                for idx in range(len(df)):
-                    if idx in lugar_expedicion_valores:
-                        df.iloc[idx, df.columns.get_loc('LUGAR_EXPEDICION')] = lugar_expedicion_valores[idx]
-            
-            # Limpiar valores vacíos
-            for col in df.columns:
-                if col != 'LUGAR_EXPEDICION':
-                    df[col] = df[col].replace(['nan', 'NaN'], '')
-            
-            wb.close()
-            
-            # Generar diplomas
-            for idx, (index, row) in enumerate(df.iterrows()):
-                doc = Document(template_path)
-                
-                # Reemplazar cada campo
-                for col in df.columns:
-                    placeholder = "{" + col + "}"
-                    
-                    if col == 'LUGAR_EXPEDICION':
-                        valor = lugar_expedicion_valores.get(idx, '')
-                    else:
-                        valor_raw = row[col]
-                        if pd.isna(valor_raw) or str(valor_raw).strip() == '' or str(valor_raw).strip().lower() == 'nan':
-                            valor = ""
-                        else:
-                            valor = str(valor_raw).strip()
-                    
-                    replace_text(doc, placeholder, valor)
-                
-                # Nombre del archivo
-                nombre_raw = row.get("NOMBRE_COMPLETO", f"SinNombre_{index+1}")
-                nombre = str(nombre_raw).replace(" ", "_")
-                
-                output_path = os.path.join(output_folder, f"Diploma_{nombre}.docx")
-                doc.save(output_path)
-            
-            # Crear archivo ZIP
-            zip_path = os.path.join(temp_dir, 'diplomas_generados.zip')
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, dirs, files in os.walk(output_folder):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, output_folder)
-                        zipf.write(file_path, arcname)
-            
-            # Enviar el archivo ZIP
-            return send_file(
-                zip_path,
-                mimetype='application/zip',
-                as_attachment=True,
-                download_name='diplomas_generados.zip'
-            )
-            
-        finally:
-            # Limpiar archivos temporales
+            # Abrir el Excel, CSV, Parquet o Arrow (con una sola plantilla las filas se leen a medida
+            # que se generan); cada plantilla compilada sale del caché
+            with registro.etapa('leer_excel'):
+                hoja = abrir_hoja(excel_path)
+            try:
+                grupos = preparar_grupos(plantillas, hoja, opciones, registro, temp_dir)
+                # LibreOffice se inicia antes de responder, así un error se informa como JSON
+                if opciones['formato'] == 'pdf':
+                    obtener_convertidor()
+            except Exception:
+                hoja.cerrar()
+                raise
+        
+        except PlantillaNoSoportada as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return jsonify({'error': f'La plantilla no se puede unir en un solo documento: {str(e)}'}), 400
+        except (FilaSinPlantilla, FormatoNoSoportado, ImagenNoDisponible) as e:
             shutil.rmtree(temp_dir, ignore_errors=True)
+            return jsonify({'error': str(e)}), 400
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        
+        def generar_zip():
+            fallo = False
+            try:
+                yield from generar_salida(grupos, opciones, registro)
+            except Exception as e:
+                import traceback
+                fallo = True
+                print(f"Error al generar el ZIP: {str(e)}")
+                print(traceback.format_exc())
+                raise
+            finally:
+                # Limpiar archivos temporales cuando termina la descarga
+                hoja.cerrar()
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                METRICAS.registrar(registro, error=fallo, origen='generate')
+        
+        # Enviar el ZIP por partes mientras se siguen generando los diplomas
+        nombre, mimetype = nombre_salida(opciones)
+        return Response(
+            generar_zip(),
+            mimetype=mimetype,
+            headers={
+                'Content-Disposition': f'attachment; filename={nombre}',
+                'X-Plantilla': cabecera_plantillas(plantillas),
+            }
+        )
     
+    except RequestEntityTooLarge:
+        # La subida superó un límite: la responde subida_demasiado_grande
+        raise
     except Exception as e:
         import traceback
         error_details = str(e)
         print(f"Error en generate_diplomas: {error_details}")
         print(traceback.format_exc())
+        METRICAS.registrar(registro, error=True, origen='generate')
+        return jsonify({'error': f'Error al procesar: {error_details}'}), 500
+
+# Formas de entregar los diplomas de /generate/stream
+RESPUESTAS_STREAM = ('zip', 'ndjson')
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    return con_lugar(generar_desde_ndjson)
+
+def lineas_ndjson(resultados, resumen):
+    """Una línea JSON por fila, en el orden en que llegaron, con su estado y el diploma en base64.
+
+    resultados viene de HojaNDJSON.resultados. resumen cuenta las filas,
+    las generadas y las que fallaron.
+    """
+    usados = set()
+    for estado, contenido in resultados:
+        resumen['filas'] += 1
+        if contenido is None:
+            resumen['errores'] += 1
+        else:
+            resumen['generadas'] += 1
+            estado['nombre'] = nombre_unico(estado['nombre'], usados)
+            estado['bytes'] = len(contenido)
+            estado['sha256'] = hashlib.sha256(contenido).hexdigest()
+            estado['contenido'] = base64.b64encode(contenido).decode('ascii')
+        yield (json.dumps(estado, ensure_ascii=False) + '\n').encode('utf-8')
+
+def generar_desde_ndjson():
+    """Respuesta de /generate/stream: genera cada fila NDJSON del cuerpo a medida que llega.
+
+    La plantilla se indica con su hash (de POST /templates) en la URL, junto
+    con las mismas opciones que /generate salvo unir. Con respuesta=zip se
+    entrega el ZIP y una línea inválida lo corta; con respuesta=ndjson cada
+    fila recibe su línea de estado y las inválidas no detienen a las demás.
+    """
+    from generador import FilaInvalida, HojaNDJSON
+    
+    registro = RegistroEtapas()
+    try:
+        huella = request.args.get('plantilla', '')
+        if not huella:
+            return jsonify({'error': 'Falta el hash de la plantilla en ?plantilla= (POST /templates lo devuelve)'}), 400
+        if not plantilla_guardada(huella):
+            return jsonify({'error': 'Plantilla no encontrada, envíala de nuevo a /templates'}), 404
+        opciones, error = leer_opciones(request.args)
+        if error:
+            return error
+        if opciones['unir']:
+            return jsonify({'error': 'El envío en streaming entrega los diplomas por separado, sin unir'}), 400
+        opciones.update(columna_plantilla=None, imagenes=None)
+        respuesta = request.args.get('respuesta', 'zip')
+        if respuesta not in RESPUESTAS_STREAM:
+            return jsonify({'error': f'Respuesta no válida. Usa una de: {", ".join(RESPUESTAS_STREAM)}'}), 400
+        if request.mimetype == 'multipart/form-data':
+            return jsonify({'error': 'Las filas se envían como NDJSON en el cuerpo, un objeto JSON por línea'}), 400
+        columnas = [columna.strip() for columna in request.args.get('columnas', '').split(',') if columna.strip()]
+        
+        # El cuerpo se lee a medida que se generan los diplomas, con su propio límite
+        request.max_content_length = MAX_NDJSON_MB * 1024 * 1024
+        if request.content_length is not None and request.content_length > request.max_content_length:
+            return jsonify({'error': f'Las filas superan el máximo de {MAX_NDJSON_MB} MB'}), 413
+        with registro.etapa('leer_excel'):
+            hoja = HojaNDJSON(request.stream, columnas, estricta=respuesta == 'zip')
+        try:
+            if not hoja.columnas:
+                hoja.cerrar()
+                return jsonify({'error': 'No llegó ninguna fila'}), 400
+            with registro.etapa('plantilla'):
+                plantilla = PLANTILLAS.obtener(huella, hoja.columnas)
+            MEDIOS.comprobar(plantilla.imagenes)
+            if opciones['formato'] == 'pdf':
+                obtener_convertidor()
+        except Exception:
+            hoja.cerrar()
+            raise
+    except RequestEntityTooLarge:
+        raise
+    except (FilaInvalida, ImagenNoDisponible) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        print(f"Error en generate_stream: {str(e)}")
+        print(traceback.format_exc())
+        METRICAS.registrar(registro, error=True, origen='stream')
+        return jsonify({'error': f'Error al procesar: {str(e)}'}), 500
+    
+    # Las fotos llegan como data: URIs en las filas; sin ZIP de imágenes no hay otro origen
+    cache = cache_diplomas(huella, plantilla, opciones)
+    al_fallar = None if respuesta == 'zip' else hoja.fallo
+    filas = registro.iterar('leer_excel', hoja.filas())
+    diplomas = generar_diplomas_grupo(plantilla, filas, opciones, registro, cache=cache, al_fallar=al_fallar)
+    resumen = {'estado': 'fin', 'filas': 0, 'generadas': 0, 'errores': 0}
+    if respuesta == 'zip':
+        salida = registro.iterar('empaquetar', generar_archivo(diplomas, modo=opciones['archivo'],
+                                                               nivel=opciones['nivel']))
+    else:
+        salida = registro.iterar('empaquetar', lineas_ndjson(hoja.resultados(diplomas), resumen))
+    
+    def generar():
+        fallo = False
+        try:
+            for trozo in salida:
+                registro.contar('bytes_escritos', len(trozo))
+                yield trozo
+        except Exception as e:
+            import traceback
+            fallo = True
+            print(f"Error al generar desde NDJSON: {str(e)}")
+            print(traceback.format_exc())
+            if respuesta == 'zip':
+                raise
+            # En NDJSON el error queda en la última línea, así el cliente sabe hasta dónde llegó
+            if isinstance(e, RequestEntityTooLarge):
+                e = f'Las filas superan el máximo de {MAX_NDJSON_MB} MB'
+            resumen.update(estado='interrumpido', error=str(e))
+        finally:
+            hoja.cerrar()
+            if cache is not None:
+                registro.contar('filas_en_cache', cache.aciertos)
+            METRICAS.registrar(registro, error=fallo, origen='stream')
+        if respuesta == 'ndjson':
+            yield (json.dumps(resumen, ensure_ascii=False) + '\n').encode('utf-8')
+    
+    if respuesta == 'zip':
+        nombre, mimetype = nombre_salida(opciones)
+        cabeceras = {'Content-Disposition': f'attachment; filename={nombre}'}
+    else:
+        mimetype, cabeceras = 'application/x-ndjson', {}
+    cabeceras['X-Plantilla'] = huella
+    return Response(generar(), mimetype=mimetype, headers=cabeceras)
+
+def ejecutar_trabajo(trabajo, plantillas, excel_path, opciones, registro):
+    """Genera el archivo de un trabajo en segundo plano, informando el avance"""
+    from generador import abrir_hoja
+    
+    fallo = True
+    try:
+        with registro.etapa('leer_excel'):
+            hoja = abrir_hoja(excel_path)
+        with hoja:
+            trabajo.iniciar(hoja.total_estimado)
+            grupos = preparar_grupos(plantillas, hoja, opciones, registro, trabajo.directorio)
+            
+            # El ZIP se escribe con otro nombre y se renombra al final, para no entregarlo a medias
+            parcial = trabajo.ruta_archivo + '.parcial'
+            with open(parcial, 'wb') as f:
+                for trozo in generar_salida(grupos, opciones, registro, contar=trabajo.contar):
+                    f.write(trozo)
+            os.replace(parcial, trabajo.ruta_archivo)
+        fallo = False
+    finally:
+        # Los tiempos por etapa quedan en el estado del trabajo y en las métricas del proceso
+        trabajo.guardar_estado(metricas=registro.resumen())
+        METRICAS.registrar(registro, error=fallo, origen='trabajo')
+    
+    # El total inicial sale de la dimensión de la hoja; al terminar se conoce el real
+    trabajo.guardar_estado(total=trabajo.generadas)
+    
+    os.remove(excel_path)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    # Con la cola llena se responde 429 antes de recibir los archivos
+    if not TRABAJOS.reservar():
+        return servidor_ocupado()
+    enviado = False
+    trabajo = None
+    registro = RegistroEtapas()
+    try:
+        with registro.etapa('guardar_subida'):
+            datos, error = leer_solicitud()
+        if error:
+            return error
+        plantillas, excel_file, opciones = datos
+        
+        # Guardar el Excel en la carpeta del trabajo
+        trabajo = TRABAJOS.crear()
+        excel_path = os.path.join(trabajo.directorio, secure_filename(excel_file.filename))
+        with registro.etapa('guardar_subida'):
+            guardar_subida(excel_file, excel_path)
+        opciones['imagenes'] = guardar_imagenes(trabajo.directorio, registro)
+        
+        # El nombre de la descarga queda en el estado, para que cualquier proceso lo entregue igual
+        nombre, mimetype = nombre_salida(opciones)
+        trabajo.guardar_estado(nombre_descarga=nombre, mimetype=mimetype)
+        TRABAJOS.enviar(trabajo, ejecutar_trabajo, plantillas, excel_path, opciones, registro)
+        enviado = True
+        
+        respuesta = resumen_trabajo(trabajo.leer_estado())
+        respuesta['plantilla'] = cabecera_plantillas(plantillas)
+        respuesta['url_estado'] = url_for('job_status', job_id=trabajo.id)
+        respuesta['url_descarga'] = url_for('download_job', job_id=trabajo.id)
+        return jsonify(respuesta), 202
+    
+    except RequestEntityTooLarge:
+        # La subida superó un límite: la responde subida_demasiado_grande
+        raise
+    except ImagenNoDisponible as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        import traceback
+        error_details = str(e)
+        print(f"Error en create_job: {error_details}")
+        print(traceback.format_exc())
+        METRICAS.registrar(registro, error=True, origen='trabajo')
         return jsonify({'error': f'Error al procesar: {error_details}'}), 500
+    finally:
+        if not enviado:
+            TRABAJOS.liberar()
+            # Un trabajo que no llegó a enviarse no queda pendiente para siempre con sus archivos
+            if trabajo is not None:
+                TRABAJOS.borrar(trabajo)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en el formato de texto de Prometheus"""
+    return Response(METRICAS.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    trabajo = TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    return jsonify(resumen_trabajo(trabajo.leer_estado()))
+
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+def download_job(job_id):
+    trabajo = TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    datos = trabajo.leer_estado()
+    estado = resumen_trabajo(datos)
+    if estado['estado'] != COMPLETADO:
+        estado['error'] = estado.get('error') or 'El trabajo todavía no ha terminado'
+        return jsonify(estado), 409
+    
+    # conditional=True responde ETag/Last-Modified y peticiones Range para reanudar descargas
+    return send_file(
+        trabajo.ruta_archivo,
+        mimetype=datos.get('mimetype', 'application/zip'),
+        as_attachment=True,
+        download_name=datos.get('nombre_descarga', 'diplomas_generados.zip'),
+        conditional=True
+    )
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,562 @@
+"""Benchmark del pipeline de generación con plantillas y hojas de Excel sintéticas.
+
+Mide el proceso del script original como punto de partida, cada etapa por
+separado (lectura del Excel y de los mismos datos en CSV, Parquet y Arrow,
+normalización, reemplazo, guardado, empaquetado) y el proceso completo, y entrega un JSON con filas por
+segundo, pico de memoria (RSS) y tiempo de cada etapa. Con --comparar se
+revisa un resultado nuevo contra uno anterior y se informan las regresiones.
+Con --arranque se mide en cambio cuánto tardan en arrancar el servidor y el
+CLI, cada vez en un proceso nuevo.
+
+    python benchmark.py --filas 10,1000,100000 --salida resultados.json
+    python benchmark.py --filas 1000 --comparar resultados.json
+    python benchmark.py --arranque --salida arranque.json
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import struct
+import subprocess
+import sys
+import shutil
+import tempfile
+import time
+import zipfile
+import zlib
+
+import pandas as pd
+from docx import Document
+from docx.oxml import parse_xml
+from docx.shared import Inches
+from openpyxl import Workbook, load_workbook
+
+from generador import (
+    COLUMNA_DOCUMENTO,
+    COLUMNA_LUGAR,
+    COLUMNA_NOMBRE,
+    FILAS_POR_BLOQUE,
+    MODOS_ARCHIVO,
+    HojaExcel,
+    PlantillaCompilada,
+    PlantillaNoSoportada,
+    PlantillaOOXML,
+    abrir_hoja,
+    compilar_plantilla,
+    docx_unico_en_streaming,
+    formatear_numero_con_puntos,
+    generar_archivo,
+    normalizar_bloque,
+    renderizar_diplomas,
+    replace_text,
+)
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# pyarrow es opcional: sin él solo se mide la lectura de CSV además de la del Excel
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+VARIANTES = ('simple', 'runs_partidos', 'encabezados', 'cuadros_texto', 'imagenes', 'completa')
+
+# Arranque medido en un proceso nuevo: código que ejecuta cada proceso
+ARRANQUES = {
+    'import_generador': 'import generador',
+    'import_app': 'import app',
+    'primera_pagina': 'import app; assert app.app.test_client().get("/").status_code == 200',
+    'cli_ayuda': 'import runpy, sys; sys.argv = ["diplomas.py", "--help"]; '
+                 'runpy.run_path("diplomas.py", run_name="__main__")',
+}
+# Módulos que no deberían cargarse solo por arrancar
+MODULOS_PESADOS = ('pandas', 'numpy', 'openpyxl', 'docx', 'lxml')
+
+# Diplomas distintos que se reutilizan para medir el empaquetado sin guardarlos todos en memoria
+DIPLOMAS_MUESTRA = 256
+
+_CUADRO_TEXTO = (
+    '<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    ' xmlns:v="urn:schemas-microsoft-com:vml"><w:pict><v:shape style="width:200pt;height:40pt">'
+    '<v:textbox><w:txbxContent><w:p><w:r><w:t>Cuadro {{{mitad1}</w:t></w:r><w:r><w:t>{mitad2}}}</w:t></w:r>'
+    '</w:p></w:txbxContent></v:textbox></v:shape></w:pict></w:r>'
+)
+
+
+# --- Datos sintéticos ---
+
+def columnas_sinteticas(placeholders):
+    """Columnas especiales del Excel más CAMPO_4, CAMPO_5, ... hasta completar placeholders"""
+    columnas = [COLUMNA_NOMBRE, COLUMNA_DOCUMENTO, COLUMNA_LUGAR]
+    columnas += [f'CAMPO_{i}' for i in range(len(columnas) + 1, placeholders + 1)]
+    return columnas[:max(placeholders, 1)]
+
+
+def crear_png(ancho, alto):
+    """PNG RGB con ruido, para que la imagen no se comprima casi a nada"""
+    filas = b''.join(b'\x00' + os.urandom(ancho * 3) for _ in range(alto))
+
+    def bloque(tipo, datos):
+        return struct.pack('>I', len(datos)) + tipo + datos + struct.pack('>I', zlib.crc32(tipo + datos))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + bloque(b'IHDR', struct.pack('>2I5B', ancho, alto, 8, 2, 0, 0, 0))
+            + bloque(b'IDAT', zlib.compress(filas))
+            + bloque(b'IEND', b''))
+
+
+def crear_plantilla(ruta, variante, placeholders):
+    """Plantilla .docx con un párrafo por placeholder y los elementos que pide la variante"""
+    columnas = columnas_sinteticas(placeholders)
+    partidos = variante in ('runs_partidos', 'completa')
+
+    doc = Document()
+    doc.add_heading('Diploma de prueba', 0)
+    for i, columna in enumerate(columnas):
+        p = doc.add_paragraph(f'Campo {i}: ')
+        if partidos:
+            # Como lo deja Word al editar: el placeholder repartido en runs con distinto formato
+            mitad = len(columna) // 2
+            p.add_run('{' + columna[:mitad]).bold = True
+            p.add_run(columna[mitad:] + '}')
+        else:
+            p.add_run('{' + columna + '}')
+
+    if variante in ('encabezados', 'completa'):
+        seccion = doc.sections[0]
+        seccion.header.paragraphs[0].text = f'Encabezado {{{columnas[0]}}}'
+        seccion.footer.paragraphs[0].text = f'Pie {{{columnas[-1]}}}'
+
+    if variante in ('cuadros_texto', 'completa'):
+        columna = columnas[0]
+        mitad = len(columna) // 2
+        cuadro = _CUADRO_TEXTO.format(mitad1=columna[:mitad], mitad2=columna[mitad:])
+        doc.add_paragraph()._p.append(parse_xml(cuadro))
+
+    if variante in ('imagenes', 'completa'):
+        doc.add_picture(io.BytesIO(crear_png(200, 150)), width=Inches(3))
+
+    doc.save(ruta)
+    return columnas
+
+
+def crear_excel(ruta, filas, columnas, semilla=0):
+    """Excel con filas de datos variados: documentos numéricos, en texto y ya formateados"""
+    aleatorio = random.Random(semilla)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([columna.lower() for columna in columnas])
+    for i in range(filas):
+        fila = []
+        for columna in columnas:
+            if columna == COLUMNA_NOMBRE:
+                fila.append(f'Persona Número {i}')
+            elif columna == COLUMNA_DOCUMENTO:
+                numero = aleatorio.randint(1_000_000, 1_999_999_999)
+                fila.append((numero, str(numero), f'{numero:,}'.replace(',', '.'))[i % 3])
+            elif columna == COLUMNA_LUGAR:
+                fila.append(f'  Ciudad {i % 50} ' if i % 7 else None)
+            else:
+                fila.append(f'valor {i}' if i % 11 else None)
+        ws.append(fila)
+    wb.save(ruta)
+
+
+def exportar_datos(crudas, columnas, base):
+    """Las mismas filas del Excel en CSV y, con pyarrow, en Parquet y Arrow; devuelve {formato: ruta}"""
+    encabezados = [columna.lower() for columna in columnas]
+    rutas = {'csv': base + '.csv'}
+    with open(rutas['csv'], 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(encabezados)
+        escritor.writerows(['' if valor is None else valor for valor in fila] for fila in crudas)
+    if pyarrow is not None:
+        # Columnas de texto: N_DOCUMENTO mezcla números y texto, que una columna de Arrow no admite
+        tabla = pyarrow.table({
+            encabezado: [None if i >= len(fila) or fila[i] is None else str(fila[i]) for fila in crudas]
+            for i, encabezado in enumerate(encabezados)
+        })
+        rutas['parquet'] = base + '.parquet'
+        rutas['arrow'] = base + '.arrow'
+        pyarrow.parquet.write_table(tabla, rutas['parquet'])
+        pyarrow.feather.write_feather(tabla, rutas['arrow'])
+    return rutas
+
+
+# --- Medición ---
+
+def _reiniciar_pico():
+    """Reinicia el pico de RSS del proceso (solo Linux); si no se puede, el pico es el de todo el proceso"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _pico_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for linea in f:
+                if linea.startswith('VmHWM:'):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KB y macOS en bytes
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def medir(funcion, *args):
+    """Ejecuta funcion(*args), que devuelve (filas procesadas, datos extra), y mide tiempo y memoria"""
+    _reiniciar_pico()
+    inicio = time.perf_counter()
+    filas, extra = funcion(*args)
+    # Una etapa puede informar su propio tiempo si mide solo una parte de lo que ejecuta
+    segundos = extra.pop('segundos', time.perf_counter() - inicio)
+    resultado = {
+        'filas': filas,
+        'segundos': round(segundos, 4),
+        'filas_por_segundo': round(filas / segundos, 1) if segundos > 0 else None,
+        'pico_rss_mb': _pico_rss_mb(),
+    }
+    resultado.update(extra)
+    return resultado
+
+
+# --- Etapas ---
+
+def etapa_carga_excel(excel_path):
+    """Lectura de las filas crudas con openpyxl en modo de solo lectura"""
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    filas = list(wb.worksheets[0].iter_rows(values_only=True))
+    wb.close()
+    return len(filas) - 1, {}
+
+
+def etapa_normalizacion(filas_crudas, columnas):
+    """Normalización por bloques, igual que HojaExcel"""
+    total = 0
+    for inicio in range(0, len(filas_crudas), FILAS_POR_BLOQUE):
+        bloque = pd.DataFrame(filas_crudas[inicio:inicio + FILAS_POR_BLOQUE], columns=columnas, dtype=object)
+        nombres, _ = normalizar_bloque(bloque, inicio=total)
+        total += len(nombres)
+    return total, {}
+
+
+def etapa_lectura(excel_path, destino):
+    """Lectura y normalización completas con HojaExcel; deja las filas en destino"""
+    with HojaExcel(excel_path) as hoja:
+        destino.extend(hoja.filas())
+    return len(destino), {}
+
+
+def etapa_lectura_formato(ruta):
+    """Lectura y normalización completas de un CSV, Parquet o Arrow con abrir_hoja"""
+    with abrir_hoja(ruta) as hoja:
+        total = sum(1 for _ in hoja.filas())
+    return total, {}
+
+
+def etapa_reemplazo_docx(plantilla, filas):
+    """Reemplazo de placeholders con la plantilla compilada de python-docx, sin guardar"""
+    for _, valores in filas:
+        with plantilla.documento_con(valores):
+            pass
+    return len(filas), {}
+
+
+def etapa_guardado_docx(plantilla, filas):
+    """doc.save de cada diploma de python-docx, con los valores ya reemplazados"""
+    segundos = 0.0
+    tamano = 0
+    for _, valores in filas:
+        with plantilla.documento_con(valores) as doc:
+            salida = io.BytesIO()
+            inicio = time.perf_counter()
+            doc.save(salida)
+            segundos += time.perf_counter() - inicio
+        tamano += salida.tell()
+    # Solo el tiempo de save; el reemplazo ya se mide en su propia etapa
+    return len(filas), {'segundos': segundos, 'bytes_salida': tamano}
+
+
+def etapa_original(template_path, excel_path, carpeta):
+    """El proceso del script original, como punto de partida: pd.read_excel, openpyxl para N_DOCUMENTO y
+    LUGAR_EXPEDICION, y por fila Document() y replace_text de cada columna, en disco y luego en un ZIP"""
+    df = pd.read_excel(excel_path, dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.upper()
+
+    wb = load_workbook(excel_path, data_only=False)
+    ws = wb.active
+    excel_headers = [str(cell.value).upper().strip() if cell.value else '' for cell in ws[1]]
+
+    if 'N_DOCUMENTO' in excel_headers:
+        n_doc_col_idx = excel_headers.index('N_DOCUMENTO')
+        for idx in range(len(df)):
+            cell = ws.cell(row=idx + 2, column=n_doc_col_idx + 1)
+            if cell.value is not None:
+                df.iloc[idx, df.columns.get_loc('N_DOCUMENTO')] = formatear_numero_con_puntos(cell.value)
+
+    lugar_expedicion_valores = {}
+    if 'LUGAR_EXPEDICION' in excel_headers:
+        lugar_exp_col_idx = excel_headers.index('LUGAR_EXPEDICION')
+        for idx in range(len(df)):
+            cell = ws.cell(row=idx + 2, column=lugar_exp_col_idx + 1)
+            lugar_expedicion_valores[idx] = str(cell.value) if cell.value is not None else ''
+
+    for col in df.columns:
+        if col != 'LUGAR_EXPEDICION':
+            df[col] = df[col].replace(['nan', 'NaN'], '')
+    wb.close()
+
+    output_folder = os.path.join(carpeta, 'original')
+    os.makedirs(output_folder, exist_ok=True)
+    for idx, (index, row) in enumerate(df.iterrows()):
+        doc = Document(template_path)
+        for col in df.columns:
+            placeholder = "{" + col + "}"
+            if col == 'LUGAR_EXPEDICION':
+                valor = lugar_expedicion_valores.get(idx, '')
+            else:
+                valor_raw = row[col]
+                if pd.isna(valor_raw) or str(valor_raw).strip() == '' or str(valor_raw).strip().lower() == 'nan':
+                    valor = ""
+                else:
+                    valor = str(valor_raw).strip()
+            replace_text(doc, placeholder, valor)
+
+        nombre_raw = row.get("NOMBRE_COMPLETO", f"SinNombre_{index+1}")
+        nombre = str(nombre_raw).replace(" ", "_")
+        doc.save(os.path.join(output_folder, f"Diploma_{nombre}.docx"))
+
+    zip_path = os.path.join(carpeta, 'original.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for root, dirs, files in os.walk(output_folder):
+            for file in files:
+                file_path = os.path.join(root, file)
+                zipf.write(file_path, os.path.relpath(file_path, output_folder))
+    tamano = os.path.getsize(zip_path)
+    shutil.rmtree(output_folder)
+    os.remove(zip_path)
+    return len(df), {'bytes_salida': tamano}
+
+
+def etapa_render(plantilla, filas, muestra):
+    """Diplomas completos (.docx en memoria); guarda los primeros en muestra para el empaquetado"""
+    tamano = 0
+    for _, contenido in renderizar_diplomas(plantilla, filas):
+        tamano += len(contenido)
+        if len(muestra) < DIPLOMAS_MUESTRA:
+            muestra.append(contenido)
+    return len(filas), {'bytes_salida': tamano}
+
+
+def etapa_zip(filas, muestra, modo):
+    """Empaquetado de tantos diplomas como filas, repitiendo los de la muestra"""
+    diplomas = ((nombre, contenido) for (nombre, _), contenido in zip(filas, itertools.cycle(muestra)))
+    tamano = sum(len(trozo) for trozo in generar_archivo(diplomas, modo=modo))
+    return len(filas), {'bytes_salida': tamano}
+
+
+def etapa_documento_unico(plantilla, filas):
+    """Un solo .docx con una sección por fila"""
+    tamano = sum(len(trozo) for trozo in docx_unico_en_streaming(plantilla, (valores for _, valores in filas)))
+    return len(filas), {'bytes_salida': tamano}
+
+
+def etapa_completa(template_path, excel_path):
+    """Excel, plantilla, diplomas y ZIP, como POST /generate con las opciones por defecto"""
+    filas = 0
+
+    def contar(diplomas):
+        nonlocal filas
+        for diploma in diplomas:
+            filas += 1
+            yield diploma
+
+    with HojaExcel(excel_path) as hoja:
+        plantilla = compilar_plantilla(template_path, hoja.columnas)
+        tamano = sum(len(trozo) for trozo in generar_archivo(contar(renderizar_diplomas(plantilla, hoja.filas()))))
+    return filas, {'bytes_salida': tamano}
+
+
+def ejecutar(variante, placeholders, filas, carpeta, max_filas_docx):
+    """Crea la plantilla y el Excel sintéticos y mide todas las etapas"""
+    template_path = os.path.join(carpeta, f'{variante}_{placeholders}.docx')
+    excel_path = os.path.join(carpeta, f'datos_{placeholders}_{filas}.xlsx')
+    columnas = crear_plantilla(template_path, variante, placeholders)
+    if not os.path.exists(excel_path):
+        crear_excel(excel_path, filas, columnas)
+
+    etapas = {}
+    # El script original es mucho más lento: se mide con un Excel de max_filas_docx filas como máximo
+    excel_original = os.path.join(carpeta, f'datos_{placeholders}_{min(filas, max_filas_docx)}.xlsx')
+    if not os.path.exists(excel_original):
+        crear_excel(excel_original, min(filas, max_filas_docx), columnas)
+    etapas['original'] = medir(etapa_original, template_path, excel_original, carpeta)
+    etapas['carga_excel'] = medir(etapa_carga_excel, excel_path)
+
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    crudas = list(itertools.islice(wb.worksheets[0].iter_rows(values_only=True), 1, None))
+    wb.close()
+    etapas['normalizacion'] = medir(etapa_normalizacion, crudas, columnas)
+    datos = exportar_datos(crudas, columnas, os.path.splitext(excel_path)[0])
+    del crudas
+    for formato, ruta in datos.items():
+        etapas[f'lectura_{formato}'] = medir(etapa_lectura_formato, ruta)
+
+    leidas = []
+    etapas['lectura_excel'] = medir(etapa_lectura, excel_path, leidas)
+
+    # python-docx es mucho más lento: se mide sobre las primeras max_filas_docx filas
+    compilada = PlantillaCompilada(template_path)
+    etapas['reemplazo_docx'] = medir(etapa_reemplazo_docx, compilada, leidas[:max_filas_docx])
+    etapas['guardado_docx'] = medir(etapa_guardado_docx, compilada, leidas[:max_filas_docx])
+    del compilada
+
+    muestra = []
+    try:
+        rapida = PlantillaOOXML(template_path, columnas)
+    except PlantillaNoSoportada:
+        rapida = None
+    if rapida is not None:
+        etapas['render_rapido'] = medir(etapa_render, rapida, leidas, muestra)
+        etapas['documento_unico'] = medir(etapa_documento_unico, rapida, leidas)
+    else:
+        compilada = PlantillaCompilada(template_path)
+        etapas['render_docx'] = medir(etapa_render, compilada, leidas[:max_filas_docx], muestra)
+
+    for modo in MODOS_ARCHIVO:
+        etapas[f'zip_{modo}'] = medir(etapa_zip, leidas, muestra, modo)
+    del leidas, muestra
+
+    etapas['completo'] = medir(etapa_completa, template_path, excel_path)
+    return {'variante': variante, 'placeholders': placeholders, 'filas': filas, 'etapas': etapas}
+
+
+# --- Arranque ---
+
+def medir_arranque(repeticiones):
+    """Mediana de segundos hasta que termina cada proceso de ARRANQUES, y qué módulos pesados cargó"""
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    # Al salir, cada proceso informa cuáles de MODULOS_PESADOS quedaron importados
+    informe = ('import atexit, json, sys; atexit.register(lambda: sys.stderr.write('
+               f'"\\n" + json.dumps([m for m in {MODULOS_PESADOS!r} if m in sys.modules])))')
+    resultados = {}
+    for nombre, codigo in ARRANQUES.items():
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            proceso = subprocess.run([sys.executable, '-c', f'{informe}\n{codigo}'],
+                                     cwd=carpeta, capture_output=True, text=True)
+            tiempos.append(time.perf_counter() - inicio)
+            if proceso.returncode != 0:
+                raise RuntimeError(f'{nombre} terminó con error:\n{proceso.stderr}')
+        resultados[nombre] = {
+            'segundos': round(statistics.median(tiempos), 4),
+            'modulos_pesados': json.loads(proceso.stderr.rsplit('\n', 1)[-1]),
+        }
+    return resultados
+
+
+# --- Reporte ---
+
+def comparar(base, nuevo, tolerancia):
+    """Etapas cuyas filas por segundo bajaron (o arranques que se alargaron) más que tolerancia respecto de base"""
+    regresiones = []
+    for nombre, medicion in nuevo.get('arranque', {}).items():
+        antes = base.get('arranque', {}).get(nombre, {}).get('segundos')
+        ahora = medicion['segundos']
+        if antes and ahora > antes * (1 + tolerancia):
+            regresiones.append(f"arranque {nombre}: {antes} -> {ahora} s ({(ahora - antes) / antes:+.0%})")
+
+    anteriores = {(r['variante'], r['placeholders'], r['filas']): r['etapas'] for r in base['resultados']}
+    for resultado in nuevo['resultados']:
+        etapas = anteriores.get((resultado['variante'], resultado['placeholders'], resultado['filas']))
+        if etapas is None:
+            continue
+        for etapa, medicion in resultado['etapas'].items():
+            antes = etapas.get(etapa, {}).get('filas_por_segundo')
+            ahora = medicion['filas_por_segundo']
+            if antes and ahora is not None and ahora < antes * (1 - tolerancia):
+                regresiones.append(f"{resultado['variante']} ({resultado['filas']} filas) {etapa}: "
+                                   f"{antes} -> {ahora} filas/s ({(ahora - antes) / antes:+.0%})")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de generación con datos sintéticos")
+    parser.add_argument('--filas', default='10,1000,10000',
+                        help="Tamaños de Excel a medir, separados por comas (por defecto 10,1000,10000)")
+    parser.add_argument('--variantes', default=','.join(VARIANTES),
+                        help=f"Plantillas sintéticas a medir: {', '.join(VARIANTES)}")
+    parser.add_argument('--placeholders', type=int, default=10, help="Placeholders de cada plantilla")
+    parser.add_argument('--max-filas-docx', type=int, default=1000,
+                        help="Filas que se miden con python-docx, que es mucho más lento")
+    parser.add_argument('--salida', help="Archivo donde guardar el JSON (por defecto se imprime)")
+    parser.add_argument('--comparar', metavar='JSON', help="Resultado anterior contra el que buscar regresiones")
+    parser.add_argument('--tolerancia', type=float, default=0.15,
+                        help="Caída de filas por segundo que se acepta antes de informar una regresión")
+    parser.add_argument('--arranque', action='store_true',
+                        help="Mide el arranque del servidor y del CLI en procesos nuevos, en vez del pipeline")
+    parser.add_argument('--repeticiones', type=int, default=5, help="Procesos por medición de arranque")
+    args = parser.parse_args()
+
+    variantes = args.variantes.split(',')
+    for variante in variantes:
+        if variante not in VARIANTES:
+            parser.error(f"Variante no válida: {variante}")
+    tamanos = [int(filas) for filas in args.filas.split(',')]
+
+    reporte = {
+        'version': 1,
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'cpus': os.cpu_count(),
+        'resultados': [],
+    }
+    if args.arranque:
+        print("Midiendo el arranque...", file=sys.stderr)
+        reporte['arranque'] = medir_arranque(args.repeticiones)
+        tamanos = []
+    with tempfile.TemporaryDirectory(prefix='diplomas_benchmark_') as carpeta:
+        for filas in tamanos:
+            for variante in variantes:
+                print(f"Midiendo {variante} con {filas} filas...", file=sys.stderr)
+                reporte['resultados'].append(ejecutar(variante, args.placeholders, filas, carpeta,
+                                                      args.max_filas_docx))
+
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+        print(f"✔ Resultados guardados en {args.salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regresiones = comparar(json.load(f), reporte, args.tolerancia)
+        for regresion in regresiones:
+            print(f"✗ Regresión: {regresion}", file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
+        print("✔ Sin regresiones", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
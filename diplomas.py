@@ -1,240 +1,309 @@
-import pandas as pd
-from docx import Document
-from docx.oxml.text.paragraph import CT_P
-from docx.oxml.table import CT_Tbl
-from docx.table import _Cell, Table
-from docx.text.paragraph import Paragraph
+import argparse
+import itertools
+import json
 import os
-from openpyxl import load_workbook
+import sys
+import time
+
+# pandas, openpyxl y python-docx se importan en generar_diplomas: --help, --reconstruir y --combinar no los cargan
+from generador import (
+    FORMATOS,
+    MANIFIESTO_PARTE,
+    CacheDiplomas,
+    CacheMedios,
+    ConvertidorPDF,
+    Particion,
+    ParticionIncompleta,
+    RegistroEtapas,
+    combinar_partes,
+    huella_contenido,
+    reconstruir_combinado,
+    renderizar_diplomas,
+    unir_pdfs,
+)
 
 TEMPLATE_PATH = "Diploma  nuevo 2025.docx"
 EXCEL_PATH = "INFORMACIÓN DIPLOMAS.xlsx"
 OUTPUT_FOLDER = "DIPLOMAS_GENERADOS"
+# Avance de una ejecución con --bloque, para continuarla si se interrumpe
+ARCHIVO_AVANCE = os.path.join(OUTPUT_FOLDER, '.avance.json')
+# Cada cuánto (segundos) se actualiza la línea de avance
+INTERVALO_AVANCE = 0.5
 
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-def replace_text_in_paragraph(paragraph, search, replace):
-    """Reemplaza texto en un párrafo, incluso si está dividido en múltiples runs"""
-    # Combinar todo el texto del párrafo
-    full_text = ''.join(run.text for run in paragraph.runs)
-    
-    if search in full_text:
-        # Limpiar todos los runs pero mantener el primero para preservar formato
-        nuevo_texto = full_text.replace(search, replace)
-        
-        # Si hay runs, limpiar todos y poner el nuevo texto en el primero
-        if paragraph.runs:
-            for i, run in enumerate(paragraph.runs):
-                if i == 0:
-                    run.text = nuevo_texto
-                else:
-                    run.text = ''
-        else:
-            # Si no hay runs, crear uno nuevo
-            paragraph.add_run(nuevo_texto)
-
-def replace_text_in_cell(cell, search, replace):
-    """Reemplaza texto en una celda, buscando en todos sus párrafos"""
-    for paragraph in cell.paragraphs:
-        replace_text_in_paragraph(paragraph, search, replace)
-
-def replace_text_in_xml_elements(element, search, replace):
-    """Función recursiva para buscar y reemplazar en elementos XML"""
-    from docx.oxml.ns import qn
-    
-    # Buscar en todos los elementos de texto (w:t)
-    for t_elem in element.iter(qn('w:t')):
-        if t_elem.text and search in t_elem.text:
-            t_elem.text = t_elem.text.replace(search, replace)
+def main():
+    parser = argparse.ArgumentParser(description="Genera los diplomas a partir de la plantilla de Word y el Excel")
+    parser.add_argument('--datos', metavar='ARCHIVO', default=EXCEL_PATH,
+                        help=f"Archivo con las filas: Excel, CSV, Parquet o Arrow (por defecto '{EXCEL_PATH}')")
+    parser.add_argument('--imagenes', metavar='CARPETA',
+                        help="Carpeta (o ZIP) con las fotos y firmas de los placeholders {IMG:COLUMNA} "
+                             "(por defecto, la carpeta del archivo de datos)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos para generar diplomas en paralelo (1 = secuencial)")
+    parser.add_argument('--reconstruir', metavar='ZIP',
+                        help="Arma en DIPLOMAS_GENERADOS los .docx de un ZIP descargado en modo 'combinado'")
+    parser.add_argument('--formato', choices=FORMATOS, default='docx',
+                        help="Formato de los diplomas (pdf necesita LibreOffice instalado)")
+    parser.add_argument('--unir', action='store_true',
+                        help="Une todos los diplomas en DIPLOMAS_GENERADOS/diplomas.docx (una sección por fila) "
+                             "o, con --formato pdf, en DIPLOMAS_GENERADOS/diplomas.pdf")
+    parser.add_argument('--convertidores', type=int, default=2,
+                        help="Procesos de LibreOffice que convierten a PDF en paralelo")
+    parser.add_argument('--metricas', metavar='JSON',
+                        help="Guarda en JSON el tiempo de cada etapa y los contadores ('-' para imprimirlos)")
+    parser.add_argument('--cache', metavar='CARPETA',
+                        help="Guarda los diplomas generados en CARPETA y, en las siguientes ejecuciones, "
+                             "solo vuelve a generar las filas nuevas o cambiadas")
+    parser.add_argument('--bloque', type=int, metavar='FILAS',
+                        help="Modo para hojas muy grandes: muestra una línea de avance en vez de cada reemplazo y "
+                             "guarda el avance cada FILAS diplomas; si se interrumpe, la siguiente ejecución "
+                             "continúa desde la última fila guardada")
+    parser.add_argument('--shard', type=leer_parte, metavar='I/N',
+                        help="Genera solo la parte I de N de las filas (de 1/N a N/N) en DIPLOMAS_GENERADOS/parte_I_de_N; "
+                             "cada fila va siempre a la misma parte, así N máquinas generan partes disjuntas")
+    parser.add_argument('--combinar', nargs='?', const=OUTPUT_FOLDER, metavar='CARPETA',
+                        help="Verifica que las partes de CARPETA (por defecto DIPLOMAS_GENERADOS) cubren todas las filas "
+                             "una sola vez y las une en CARPETA/diplomas.zip con su manifiesto diplomas.json")
+    args = parser.parse_args()
+    if args.bloque is not None and (args.bloque < 1 or args.unir):
+        parser.error("--bloque necesita un número de filas mayor que 0 y no se puede usar con --unir")
+    if args.shard is not None and args.unir:
+        parser.error("--shard no se puede usar con --unir: las partes se unen después con --combinar")
     
-    # Buscar en elementos de texto alternativos (pueden estar en diferentes namespaces)
-    for t_elem in element.iter():
-        if t_elem.tag.endswith('}t') and hasattr(t_elem, 'text') and t_elem.text:
-            if search in t_elem.text:
-                t_elem.text = t_elem.text.replace(search, replace)
-
-def replace_text(doc, search, replace):
-    """Reemplaza texto en todo el documento de forma exhaustiva"""
-    # Reemplazar en párrafos del cuerpo del documento
-    for paragraph in doc.paragraphs:
-        replace_text_in_paragraph(paragraph, search, replace)
+    if args.combinar:
+        try:
+            total = combinar_partes(args.combinar, os.path.join(args.combinar, 'diplomas.zip'),
+                                    os.path.join(args.combinar, 'diplomas.json'))
+        except ParticionIncompleta as e:
+            print("✘ No se combinaron las partes:")
+            for problema in e.problemas:
+                print(f"  - {problema}")
+            sys.exit(1)
+        print(f"✔ {total} diplomas combinados en {os.path.join(args.combinar, 'diplomas.zip')}")
+        return
     
-    # Reemplazar en tablas
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                replace_text_in_cell(cell, search, replace)
+    if args.reconstruir:
+        total = reconstruir_combinado(args.reconstruir, OUTPUT_FOLDER)
+        print(f"✔ {total} diplomas reconstruidos en la carpeta {OUTPUT_FOLDER}")
+        return
     
-    # Reemplazar en encabezados
-    for section in doc.sections:
-        for header in [section.header, section.first_page_header, section.even_page_header]:
-            for paragraph in header.paragraphs:
-                replace_text_in_paragraph(paragraph, search, replace)
-            for table in header.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        replace_text_in_cell(cell, search, replace)
+    # Tiempos por etapa y contadores de esta ejecución, para --metricas
+    registro = RegistroEtapas()
+    fallo = True
+    try:
+        generar_diplomas(args, registro)
+        fallo = False
+    finally:
+        if args.metricas:
+            guardar_metricas(registro, args.metricas, fallo)
+
+def leer_parte(texto):
+    try:
+        return Particion.desde_texto(texto)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def generar_diplomas(args, registro):
+    from generador import abrir_hoja, abrir_imagenes, compilar_plantilla, docx_unico_en_streaming
+
+    # Con --shard, los diplomas y el avance de la parte quedan en su propia carpeta
+    parte = args.shard
+    carpeta = OUTPUT_FOLDER if parte is None else os.path.join(OUTPUT_FOLDER, parte.nombre)
+    archivo_avance = ARCHIVO_AVANCE if parte is None else os.path.join(carpeta, '.avance.json')
+    os.makedirs(carpeta, exist_ok=True)
+    if parte is not None:
+        print(f"Generando la parte {parte.indice} de {parte.total} en {carpeta}")
+        # El manifiesto de una ejecución anterior se reemplaza recién cuando esta termina
+        if os.path.exists(os.path.join(carpeta, MANIFIESTO_PARTE)):
+            os.remove(os.path.join(carpeta, MANIFIESTO_PARTE))
+
+    # Abrir el Excel: las filas se leen una sola vez, a medida que se generan los diplomas
+    print(f"Leyendo valores formateados de {args.datos}...")
+    with registro.etapa('leer_excel'):
+        hoja = abrir_hoja(args.datos)
+    with hoja:
+        print(f"Columnas encontradas en Excel: {hoja.columnas}")
+        if hoja.total_estimado is not None:
+            print(f"Total de registros: {hoja.total_estimado}")
+
+        # Compilar la plantilla una sola vez: se analiza el .docx y se ubican los placeholders
+        # (el .docx único se arma sobre la ruta rápida)
+        unir_docx = args.unir and args.formato == 'docx'
+        with registro.etapa('plantilla'):
+            plantilla = compilar_plantilla(TEMPLATE_PATH, hoja.columnas, modo='rapido' if unir_docx else 'auto')
+        por_fila = {'filas_generadas': 1, 'placeholders_reemplazados': plantilla.placeholders}
         
-        # Reemplazar en pies de página
-        for footer in [section.footer, section.first_page_footer, section.even_page_footer]:
-            for paragraph in footer.paragraphs:
-                replace_text_in_paragraph(paragraph, search, replace)
-            for table in footer.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        replace_text_in_cell(cell, search, replace)
-    
-    # Reemplazar en TODOS los elementos XML del documento (cuadros de texto, formas, etc.)
-    # Buscar recursivamente en todo el cuerpo del documento
-    replace_text_in_xml_elements(doc.element.body, search, replace)
+        # Fotos y códigos QR: se preparan en hilos aparte, unas filas antes de generar cada diploma
+        medios = CacheMedios()
+        origen = None
+        if plantilla.imagenes:
+            medios.comprobar(plantilla.imagenes)
+            origen = abrir_imagenes(args.imagenes or os.path.dirname(os.path.abspath(args.datos)))
 
-# Leer Excel usando pandas primero para obtener estructura
-df = pd.read_excel(EXCEL_PATH, dtype=str, keep_default_na=False)
+        # Archivos de entrada: el avance de --bloque y las partes de --shard solo valen con los mismos
+        identidad = None
+        if args.bloque or parte is not None:
+            identidad = {
+                'excel': huella_archivo(args.datos),
+                'plantilla': huella_archivo(TEMPLATE_PATH),
+                'formato': args.formato,
+            }
 
-# Convertir columnas a MAYÚSCULAS para que coincidan con el Word
-df.columns = df.columns.str.upper()
+        # Con --bloque se saltan las filas que ya se guardaron en una ejecución anterior con los mismos archivos
+        completadas = 0
+        if args.bloque:
+            completadas = leer_avance(identidad, archivo_avance)
+            if completadas:
+                print(f"Continuando después de los {completadas} diplomas ya generados")
 
-# Leer el Excel con openpyxl para obtener los valores formateados (con puntos)
-print("Leyendo valores formateados del Excel...")
-wb = load_workbook(EXCEL_PATH, data_only=False)
-ws = wb.active
+        def filas():
+            # En el .docx único no hay diplomas sueltos: las filas se cuentan al leerlas
+            leidas = registro.iterar('leer_excel', hoja.filas(), por_fila if unir_docx else None)
+            if parte is not None:
+                leidas = parte.filtrar(leidas, extension='.' + args.formato)
+            for nombre_archivo, valores in itertools.islice(leidas, completadas, None):
+                if not args.bloque:
+                    for col, valor in valores.items():
+                        print(f"  Reemplazando {{{col}}} con '{valor}'")
+                yield os.path.join(carpeta, nombre_archivo), valores
 
-# Obtener nombres de columnas del Excel (primera fila)
-excel_headers = []
-for cell in ws[1]:
-    header_val = str(cell.value).upper().strip() if cell.value else ''
-    excel_headers.append(header_val)
+        def filas_con_imagenes():
+            return registro.iterar('preparar_imagenes', medios.preparar(filas(), plantilla.imagenes, origen))
 
-print(f"Columnas encontradas en Excel: {excel_headers}")
-print(f"Total de registros: {len(df)}")
+        if unir_docx:
+            output_path = os.path.join(OUTPUT_FOLDER, 'diplomas.docx')
+            try:
+                with open(output_path, 'wb') as f:
+                    valores = (valores for _, valores in filas_con_imagenes())
+                    for trozo in registro.iterar('documento_unico', docx_unico_en_streaming(plantilla, valores)):
+                        f.write(trozo)
+                        registro.contar('bytes_escritos', len(trozo))
+            finally:
+                if origen is not None:
+                    origen.cerrar()
+            print(f"✓ Documento con todos los diplomas guardado: {output_path}")
+            print("✔ Diplomas generados correctamente en la carpeta DIPLOMAS_GENERADOS")
+            return
+
+        # Para PDF, los LibreOffice del pool se abren una vez y convierten todos los diplomas
+        convertidor = ConvertidorPDF(procesos=args.convertidores) if args.formato == 'pdf' else None
+
+        def generar(filas):
+            # Generar los diplomas, repartiendo las filas entre args.workers procesos
+            diplomas = registro.iterar('renderizar', renderizar_diplomas(plantilla, filas, workers=args.workers),
+                                       por_fila)
+            if convertidor is not None:
+                diplomas = registro.iterar('convertir_pdf', convertidor.convertir_diplomas(diplomas))
+            return diplomas
 
-# Si existe la columna N_DOCUMENTO, leer los valores formateados
-if 'N_DOCUMENTO' in excel_headers:
-    n_doc_col_idx = excel_headers.index('N_DOCUMENTO')
-    
-    # Función para formatear número con puntos como separador de miles
-    def formatear_numero_con_puntos(numero):
-        """Formatea un número con puntos como separadores de miles (formato colombiano)"""
-        if numero is None:
-            return ''
-        
-        # Convertir a string primero
-        num_str = str(numero).strip()
-        
-        if num_str == '' or num_str.lower() == 'nan':
-            return ''
-        
-        # Si ya tiene puntos, mantenerlo tal cual
-        if '.' in num_str and not num_str.startswith('.'):
-            # Verificar que los puntos estén en posiciones válidas (separadores de miles)
-            # Si tiene puntos y parece un formato válido, mantenerlo
-            partes = num_str.split('.')
-            # Si todas las partes excepto la última tienen 3 dígitos, es formato válido
-            es_formato_valido = all(len(p) == 3 for p in partes[:-1]) and len(partes[-1]) <= 3
-            if es_formato_valido:
-                return num_str
-        
         try:
-            # Si es numérico (int o float) o es un string de solo dígitos
-            if isinstance(numero, (int, float)):
-                num_int = int(numero)
-            elif num_str.replace('.', '').isdigit():
-                # Remover puntos existentes y convertir
-                num_int = int(num_str.replace('.', ''))
+            # Con --cache, las filas que no cambiaron desde la ejecución anterior se toman de la carpeta
+            cache = None
+            if args.cache:
+                cache = CacheDiplomas(args.cache).para(huella_archivo(TEMPLATE_PATH), plantilla, args.formato)
+                diplomas = registro.iterar('cache_diplomas', cache.generar(filas_con_imagenes(), generar))
             else:
-                # Si no es numérico, devolver tal cual
-                return num_str
-            
-            # Formatear agregando puntos cada 3 dígitos desde la derecha
-            num_str_formateado = ''
-            num_str_sin_puntos = str(num_int)
+                diplomas = generar(filas_con_imagenes())
             
-            # Agregar puntos de derecha a izquierda
-            for i, digito in enumerate(reversed(num_str_sin_puntos)):
-                if i > 0 and i % 3 == 0:
-                    num_str_formateado = '.' + num_str_formateado
-                num_str_formateado = digito + num_str_formateado
-            
-            return num_str_formateado
-        except (ValueError, TypeError):
-            # Si no se puede convertir, devolver el valor original
-            return num_str
-    
-    # Leer cada valor de N_DOCUMENTO y formatearlo
-    for idx in range(len(df)):
-        cell = ws.cell(row=idx + 2, column=n_doc_col_idx + 1)  # +2 porque fila 1 es header, +1 porque openpyxl es base 1
-        
-        if cell.value is not None:
-            # Obtener el valor de la celda
-            valor_crudo = cell.value
-            
-            # Formatear el número con puntos
-            valor_formateado = formatear_numero_con_puntos(valor_crudo)
-            
-            # Actualizar en el dataframe
-            df.iloc[idx, df.columns.get_loc('N_DOCUMENTO')] = valor_formateado
-            print(f"  Fila {idx + 1}: N_DOCUMENTO formateado como '{valor_formateado}'")
-
-# Leer LUGAR_EXPEDICION directamente del Excel para preservar el formato exacto
-lugar_expedicion_valores = {}
-if 'LUGAR_EXPEDICION' in excel_headers:
-    lugar_exp_col_idx = excel_headers.index('LUGAR_EXPEDICION')
-    for idx in range(len(df)):
-        cell = ws.cell(row=idx + 2, column=lugar_exp_col_idx + 1)  # +2 porque fila 1 es header, +1 porque openpyxl es base 1
-        # Leer el valor exacto tal como está en el Excel (sin modificaciones, sin strip)
-        if cell.value is not None:
-            # Mantener el valor tal cual como está en el Excel, sin ninguna modificación
-            # Usar str() directamente sin strip para preservar formato exacto
-            valor_exacto = str(cell.value)
-            lugar_expedicion_valores[idx] = valor_exacto
-            print(f"  Fila {idx + 1}: LUGAR_EXPEDICION leído exactamente como: '{valor_exacto}'")
-        else:
-            lugar_expedicion_valores[idx] = ''
-
-# Actualizar LUGAR_EXPEDICION en el DataFrame con valores exactos del Excel
-if 'LUGAR_EXPEDICION' in df.columns and lugar_expedicion_valores:
-    for idx in range(len(df)):
-        if idx in lugar_expedicion_valores:
-            df.iloc[idx, df.columns.get_loc('LUGAR_EXPEDICION')] = lugar_expedicion_valores[idx]
-
-# Limpiar valores vacíos que pandas podría haber marcado como 'nan' string
-# PERO no afectar LUGAR_EXPEDICION que ya tiene su valor preservado
-for col in df.columns:
-    if col != 'LUGAR_EXPEDICION':  # No modificar LUGAR_EXPEDICION
-        df[col] = df[col].replace(['nan', 'NaN'], '')
-    
-wb.close()
-
-for idx, (index, row) in enumerate(df.iterrows()):
-    
-    doc = Document(TEMPLATE_PATH)
-    
-    # Reemplazar cada campo
-    for col in df.columns:
-        placeholder = "{" + col + "}"   # Ej: {N_DOCUMENTO}
-        
-        # Manejo especial para LUGAR_EXPEDICION: mantener exactamente como está (sin modificaciones)
-        if col == 'LUGAR_EXPEDICION':
-            # Usar el índice de posición (idx) en lugar del índice del DataFrame para acceso directo
-            valor = lugar_expedicion_valores.get(idx, '')
-            # NO aplicar strip ni ninguna modificación al valor de LUGAR_EXPEDICION
-        else:
-            valor_raw = row[col]
-            # Para otros campos, limpiar pero mantener el valor
-            if pd.isna(valor_raw) or str(valor_raw).strip() == '' or str(valor_raw).strip().lower() == 'nan':
-                valor = ""
+            if args.unir:
+                output_path = os.path.join(OUTPUT_FOLDER, 'diplomas.pdf')
+                with registro.etapa('empaquetar'):
+                    unir_pdfs((contenido for _, contenido in diplomas), output_path)
+                registro.contar('bytes_escritos', os.path.getsize(output_path))
+                print(f"✓ PDF con todos los diplomas guardado: {output_path}")
             else:
-                valor = str(valor_raw).strip()
-        
-        replace_text(doc, placeholder, valor)
-        print(f"  Reemplazando {placeholder} con '{valor}'")
+                # El total de la hoja no sirve para una parte: solo se muestran las generadas
+                total = hoja.total_estimado if parte is None else None
+                avance = Avance(total, completadas) if args.bloque else None
+                for output_path, contenido in diplomas:
+                    with registro.etapa('guardar_archivos'):
+                        with open(output_path, 'wb') as f:
+                            f.write(contenido)
+                    registro.contar('bytes_escritos', len(contenido))
+                    if avance is None:
+                        print(f"✓ Diploma guardado: {output_path}")
+                        continue
+                    # El avance se guarda al completar cada bloque: lo que quede a medias se vuelve a generar
+                    avance.actualizar()
+                    if avance.hechas % args.bloque == 0:
+                        guardar_avance(identidad, avance.hechas, archivo_avance)
+                if avance is not None:
+                    avance.terminar()
+                    if os.path.exists(archivo_avance):
+                        os.remove(archivo_avance)
+                # Ya se leyeron todas las filas: el manifiesto marca la parte como terminada
+                if parte is not None:
+                    parte.guardar_manifiesto(carpeta, identidad)
+                    print(f"✓ Parte {parte.indice}/{parte.total}: {len(parte.filas)} de {parte.leidas} filas. "
+                          f"Cuando terminen todas, únelas con: python diplomas.py --combinar")
+        finally:
+            if convertidor is not None:
+                convertidor.cerrar()
+            if origen is not None:
+                origen.cerrar()
+        if cache is not None:
+            registro.contar('filas_en_cache', cache.aciertos)
+            print(f"✔ {cache.aciertos} diplomas sin cambios tomados del caché, {cache.fallos} generados")
+
+    print("✔ Diplomas generados correctamente en la carpeta DIPLOMAS_GENERADOS")
+
+def huella_archivo(ruta):
+    with open(ruta, 'rb') as f:
+        return huella_contenido(f.read())
+
+def leer_avance(identidad, archivo=ARCHIVO_AVANCE):
+    """Diplomas ya guardados por una ejecución interrumpida con el mismo Excel, plantilla y formato"""
+    try:
+        with open(archivo, encoding='utf-8') as f:
+            avance = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    return avance['completadas'] if avance.get('identidad') == identidad else 0
+
+def guardar_avance(identidad, completadas, archivo=ARCHIVO_AVANCE):
+    temporal = archivo + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump({'identidad': identidad, 'completadas': completadas}, f)
+    os.replace(temporal, archivo)
+
+class Avance:
+    """Línea de avance que se actualiza como máximo una vez por INTERVALO_AVANCE"""
+
+    def __init__(self, total, hechas=0):
+        self.total = total
+        self.hechas = hechas
+        self._iniciales = hechas
+        self._inicio = self._ultima = time.monotonic()
+        # En una terminal la línea se reescribe; redirigida, se agrega una línea por actualización
+        self._fin_linea = '\r' if sys.stdout.isatty() else '\n'
+
+    def actualizar(self):
+        self.hechas += 1
+        ahora = time.monotonic()
+        if ahora - self._ultima >= INTERVALO_AVANCE:
+            self._ultima = ahora
+            self._mostrar(ahora)
+
+    def _mostrar(self, ahora):
+        velocidad = (self.hechas - self._iniciales) / max(ahora - self._inicio, 1e-6)
+        total = f"/{self.total}" if self.total else ''
+        print(f"  {self.hechas}{total} diplomas ({velocidad:.1f} filas/s)", end=self._fin_linea, flush=True)
 
-    # Nombre del archivo
-    nombre_raw = row.get("NOMBRE_COMPLETO", f"SinNombre_{index+1}")
-    nombre = str(nombre_raw).replace(" ", "_")
+    def terminar(self):
+        self._mostrar(time.monotonic())
+        if self._fin_linea == '\r':
+            print()
 
-    output_path = os.path.join(OUTPUT_FOLDER, f"Diploma_{nombre}.docx")
-    doc.save(output_path)
-    print(f"✓ Diploma guardado: {output_path}")
+def guardar_metricas(registro, destino, fallo):
+    """Escribe el resumen de tiempos y contadores como JSON en destino ('-' para la salida estándar)"""
+    resumen = registro.resumen()
+    resumen['error'] = fallo
+    texto = json.dumps(resumen, indent=2, ensure_ascii=False)
+    if destino == '-':
+        print(texto)
+    else:
+        with open(destino, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+        print(f"✔ Métricas guardadas en {destino}")
 
-print("✔ Diplomas generados correctamente en la carpeta DIPLOMAS_GENERADOS")
+if __name__ == '__main__':
+    main()
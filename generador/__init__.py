@@ -0,0 +1,146 @@
+"""Motor de generación de diplomas compartido por app.py y diplomas.py
+
+Cada submódulo se importa la primera vez que se usa uno de sus nombres, así
+pandas, openpyxl y python-docx solo se cargan cuando de verdad hacen falta
+(importar generador o servir una página estática no los necesita).
+"""
+import importlib
+
+# Nombres públicos de cada submódulo
+_NOMBRES = {
+    'agrupar': (
+        'COLUMNA_PLANTILLA',
+        'FilaSinPlantilla',
+        'FilasAgrupadas',
+        'clave_plantilla',
+    ),
+    'archivo_zip': (
+        'MODOS_ARCHIVO',
+        'generar_archivo',
+        'nombre_unico',
+        'reconstruir_combinado',
+        'zip_combinado_en_streaming',
+        'zip_en_streaming',
+    ),
+    'cache': (
+        'CacheDiplomas',
+        'CacheFilas',
+        'CachePlantillas',
+        'huella_contenido',
+    ),
+    'documento_unico': (
+        'DocumentoUnico',
+        'docx_unico_en_streaming',
+    ),
+    'excel': (
+        'COLUMNA_DOCUMENTO',
+        'COLUMNA_LUGAR',
+        'COLUMNA_NOMBRE',
+        'FILAS_POR_BLOQUE',
+        'NORMALIZADORES',
+        'HojaExcel',
+        'bloques_de_filas',
+        'buscar_encabezados',
+        'filas_de_bloques',
+        'formatear_documentos',
+        'formatear_numero_con_puntos',
+        'limpiar_texto',
+        'normalizar_bloque',
+        'preservar_exacto',
+    ),
+    'imagenes': (
+        'CLAVE_IMAGENES',
+        'CacheMedios',
+        'CarpetaImagenes',
+        'Imagen',
+        'ImagenNoDisponible',
+        'PlaceholderImagen',
+        'ZipImagenes',
+        'abrir_imagenes',
+        'placeholder_imagen',
+        'placeholders_imagen',
+    ),
+    'lectores': (
+        'EXTENSIONES_DATOS',
+        'FILAS_EN_ESPERA',
+        'LECTORES',
+        'FilaInvalida',
+        'FormatoNoSoportado',
+        'HojaArrow',
+        'HojaCSV',
+        'HojaNDJSON',
+        'HojaParquet',
+        'abrir_hoja',
+    ),
+    'metricas': (
+        'ETAPAS',
+        'Metricas',
+        'RegistroEtapas',
+    ),
+    'ooxml': (
+        'PlantillaNoSoportada',
+        'PlantillaOOXML',
+    ),
+    'paralelo': (
+        'TAMANO_LOTE',
+        'renderizar_diplomas',
+        'renderizar_filas',
+    ),
+    'particion': (
+        'MANIFIESTO_PARTE',
+        'Particion',
+        'ParticionIncompleta',
+        'clave_fila',
+        'combinar_partes',
+        'verificar_partes',
+    ),
+    'pdf': (
+        'DIPLOMAS_POR_LOTE',
+        'FORMATOS',
+        'ConvertidorPDF',
+        'ErrorConversionPDF',
+        'unir_pdfs',
+    ),
+    'plantilla': (
+        'MODOS_RENDER',
+        'PlantillaCompilada',
+        'compilar_plantilla',
+    ),
+    'reemplazo': (
+        'PATRON_PLACEHOLDER',
+        'iter_paragraphs',
+        'reemplazar_en_runs',
+        'reemplazar_placeholders',
+        'replace_text',
+        'replace_text_in_cell',
+        'replace_text_in_paragraph',
+        'replace_text_in_xml_elements',
+        'sustituir_placeholders',
+    ),
+    'trabajos': (
+        'COMPLETADO',
+        'ERROR',
+        'GestorTrabajos',
+        'PENDIENTE',
+        'PROCESANDO',
+        'Trabajo',
+        'resumen_trabajo',
+    ),
+}
+_MODULOS = {nombre: modulo for modulo, nombres in _NOMBRES.items() for nombre in nombres}
+
+__all__ = sorted(_MODULOS)
+
+
+def __getattr__(nombre):
+    modulo = _MODULOS.get(nombre)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
+    valor = getattr(importlib.import_module(f'.{modulo}', __name__), nombre)
+    # Queda en el paquete: los siguientes accesos no pasan por __getattr__
+    globals()[nombre] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,70 @@
+import os
+import pickle
+
+# Columna del Excel que indica la plantilla de cada fila cuando se envían varias
+COLUMNA_PLANTILLA = 'PLANTILLA'
+
+
+class FilaSinPlantilla(ValueError):
+    """Una fila pide una plantilla que no se envió (o el Excel no tiene la columna)"""
+
+
+def clave_plantilla(nombre):
+    """Nombre de plantilla comparable: sin espacios alrededor, sin .docx y sin distinguir mayúsculas"""
+    nombre = nombre.strip()
+    if nombre.lower().endswith('.docx'):
+        nombre = nombre[:-len('.docx')]
+    return nombre.strip().casefold()
+
+
+class FilasAgrupadas:
+    """Filas del Excel repartidas por plantilla según una columna.
+
+    Se leen todas en una pasada y las de cada plantilla se guardan en su
+    propio archivo de directorio, en el orden del Excel, así cada plantilla
+    se compila una vez y sus filas se generan juntas sin tener el Excel en
+    memoria. nombres son los nombres de las plantillas enviadas.
+    """
+
+    def __init__(self, filas, columna, nombres, directorio):
+        self.columna = columna
+        self.directorio = directorio
+        self._nombres = {clave_plantilla(nombre): nombre for nombre in nombres}
+        self.totales = dict.fromkeys(self._nombres.values(), 0)
+
+        archivos = {}
+        try:
+            for numero, (nombre_archivo, valores) in enumerate(filas, 1):
+                nombre = self._nombres.get(clave_plantilla(valores.get(columna, '')))
+                if nombre is None:
+                    raise FilaSinPlantilla(
+                        f'La fila {numero} ({nombre_archivo}) pide la plantilla "{valores.get(columna, "")}", '
+                        f'que no se envió. Plantillas enviadas: {", ".join(self.totales)}')
+                archivo = archivos.get(nombre)
+                if archivo is None:
+                    archivo = archivos[nombre] = open(self._ruta(nombre), 'wb')
+                pickle.dump((nombre_archivo, valores), archivo, protocol=pickle.HIGHEST_PROTOCOL)
+                self.totales[nombre] += 1
+        finally:
+            for archivo in archivos.values():
+                archivo.close()
+
+    def _ruta(self, nombre):
+        indice = list(self.totales).index(nombre)
+        return os.path.join(self.directorio, f'filas_{indice}.pickle')
+
+    def usadas(self):
+        """Plantillas con al menos una fila, en el orden en que se enviaron"""
+        return [nombre for nombre, total in self.totales.items() if total]
+
+    def filas(self, nombre):
+        """Genera (nombre del archivo, valores) de las filas de una plantilla y después borra su archivo"""
+        if not self.totales[nombre]:
+            return
+        ruta = self._ruta(nombre)
+        try:
+            with open(ruta, 'rb') as archivo:
+                for _ in range(self.totales[nombre]):
+                    yield pickle.load(archivo)
+        finally:
+            os.remove(ruta)
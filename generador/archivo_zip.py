@@ -0,0 +1,303 @@
+import hashlib
+import io
+import json
+import os
+import posixpath
+import struct
+import time
+import zipfile
+import zlib
+
+# Cómo se empaqueta el lote: los .docx ya vienen comprimidos, así que por defecto se guardan sin recomprimir
+MODOS_ARCHIVO = ('stored', 'deflated', 'combinado')
+
+MANIFIESTO_COMBINADO = 'manifiesto.json'
+CARPETA_PARTES = 'partes'
+
+# Cabeceras ZIP (mismo formato que zipfile)
+_CABECERA_LOCAL = struct.Struct('<4s2B4HL2L2H')
+_CABECERA_CENTRAL = struct.Struct('<4s4B4HL2L5H2L')
+_FIN_ARCHIVO = struct.Struct('<4s4H2LH')
+_DESCRIPTOR = struct.Struct('<4s3L')
+# ZIP64: fin de archivo, su localizador y el campo extra con los tamaños y el offset que no caben en 32 bits
+_FIN_ARCHIVO64 = struct.Struct('<4sQ2H2L4Q')
+_LOCALIZADOR64 = struct.Struct('<4sLQL')
+_MAXIMO_32 = 0xFFFFFFFF
+_MAXIMO_16 = 0xFFFF
+
+
+def _fecha_dos(dt):
+    return dt[3] << 11 | dt[4] << 5 | (dt[5] // 2), (dt[0] - 1980) << 9 | dt[1] << 5 | dt[2]
+
+
+def _extra_zip64(*valores):
+    return struct.pack(f'<2H{len(valores)}Q', 1, 8 * len(valores), *valores)
+
+
+class MiembroZip:
+    """Miembro de un ZIP con sus datos ya comprimidos, listo para copiarse tal cual"""
+
+    __slots__ = ('nombre', 'date_time', 'compress_type', 'crc', 'datos', 'file_size', 'external_attr')
+
+    def __init__(self, nombre, date_time, compress_type, crc, datos, file_size, external_attr=0o600 << 16):
+        self.nombre = nombre
+        self.date_time = date_time
+        self.compress_type = compress_type
+        self.crc = crc
+        self.datos = datos
+        self.file_size = file_size
+        self.external_attr = external_attr
+
+    @classmethod
+    def comprimir(cls, nombre, contenido, date_time, external_attr=0o600 << 16, nivel=None):
+        """Miembro nuevo con el contenido comprimido con deflate"""
+        compresor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if nivel is None else nivel, zlib.DEFLATED, -15)
+        datos = compresor.compress(contenido) + compresor.flush()
+        return cls(nombre, date_time, zipfile.ZIP_DEFLATED, zlib.crc32(contenido), datos, len(contenido), external_attr)
+
+    def contenido(self):
+        """Datos del miembro descomprimidos"""
+        if self.compress_type == zipfile.ZIP_STORED:
+            return self.datos
+        return zlib.decompress(self.datos, -15)
+
+    def reemplazar(self, contenido):
+        """Copia del miembro con contenido nuevo, comprimido con deflate"""
+        return MiembroZip.comprimir(self.nombre, contenido, self.date_time, self.external_attr)
+
+    def renombrar(self, nombre):
+        """Copia del miembro con otro nombre y los mismos datos comprimidos"""
+        return MiembroZip(nombre, self.date_time, self.compress_type, self.crc, self.datos,
+                          self.file_size, self.external_attr)
+
+
+def leer_miembros(contenido):
+    """Lee los miembros de un ZIP en memoria sin descomprimirlos"""
+    miembros = []
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+        for info in zf.infolist():
+            if info.flag_bits & 0x1:
+                raise zipfile.BadZipFile(f'miembro cifrado: {info.filename}')
+            if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+                raise zipfile.BadZipFile(f'compresión no soportada: {info.filename}')
+            cabecera = _CABECERA_LOCAL.unpack_from(contenido, info.header_offset)
+            inicio = info.header_offset + _CABECERA_LOCAL.size + cabecera[10] + cabecera[11]
+            miembros.append(MiembroZip(info.filename, info.date_time, info.compress_type, info.CRC,
+                                       contenido[inicio:inicio + info.compress_size],
+                                       info.file_size, info.external_attr))
+    return miembros
+
+
+class EscritorZipCrudo:
+    """Escribe un ZIP copiando los datos comprimidos de cada miembro sin recomprimirlos.
+
+    Solo escribe hacia adelante, así que sirve también para salidas no posicionables.
+    """
+
+    def __init__(self, salida):
+        self._salida = salida
+        self._centrales = []
+        self._offset = 0
+
+    def _central(self, version, flags, compress_type, dostime, dosdate, crc, comprimido, tamano, nombre,
+                 external_attr):
+        """Anota la cabecera central del miembro que empieza en el offset actual, con ZIP64 si hace falta"""
+        # Solo van en el extra ZIP64 los valores que no caben, en este orden
+        grandes = [valor for valor in (tamano, comprimido, self._offset) if valor > zipfile.ZIP64_LIMIT]
+        extra = _extra_zip64(*grandes) if grandes else b''
+        if grandes:
+            version = max(version, 45)
+        tamano, comprimido, offset = (_MAXIMO_32 if valor > zipfile.ZIP64_LIMIT else valor
+                                      for valor in (tamano, comprimido, self._offset))
+        self._centrales.append(_CABECERA_CENTRAL.pack(
+            b'PK\001\002', version, 0, version, 0, flags, compress_type, dostime, dosdate,
+            crc, comprimido, tamano, len(nombre), len(extra), 0, 0, 0, external_attr, offset) + nombre + extra)
+
+    def agregar(self, miembro):
+        nombre = miembro.nombre.encode('utf-8')
+        flags = 0x800 if not miembro.nombre.isascii() else 0
+        dostime, dosdate = _fecha_dos(miembro.date_time)
+        version = 20 if miembro.compress_type == zipfile.ZIP_DEFLATED else 10
+        comprimido, tamano = len(miembro.datos), miembro.file_size
+        extra = b''
+        if comprimido > zipfile.ZIP64_LIMIT or tamano > zipfile.ZIP64_LIMIT:
+            # En la cabecera local el extra ZIP64 lleva siempre los dos tamaños
+            extra = _extra_zip64(tamano, comprimido)
+            comprimido = tamano = _MAXIMO_32
+            version = 45
+        self._salida.write(_CABECERA_LOCAL.pack(
+            b'PK\003\004', version, 0, flags, miembro.compress_type, dostime, dosdate,
+            miembro.crc, comprimido, tamano, len(nombre), len(extra)))
+        self._salida.write(nombre)
+        self._salida.write(extra)
+        self._salida.write(miembro.datos)
+        self._central(version, flags, miembro.compress_type, dostime, dosdate, miembro.crc,
+                      len(miembro.datos), miembro.file_size, nombre, miembro.external_attr)
+        self._offset += _CABECERA_LOCAL.size + len(nombre) + len(extra) + len(miembro.datos)
+
+    def agregar_por_partes(self, nombre, trozos, date_time, external_attr=0o600 << 16, nivel=None):
+        """Agrega un miembro comprimido con deflate a medida que llegan sus trozos.
+
+        El CRC y los tamaños van en un descriptor al final de los datos, así
+        que el contenido nunca está completo en memoria. Es un generador que
+        entrega None después de cada trozo, para vaciar la salida mientras tanto.
+        Sin los tamaños de antemano la cabecera local no lleva ZIP64: el
+        miembro no puede pasar de 2 GB, aunque el archivo sí.
+        """
+        nombre_bytes = nombre.encode('utf-8')
+        flags = 0x08 | (0x800 if not nombre.isascii() else 0)
+        dostime, dosdate = _fecha_dos(date_time)
+        self._salida.write(_CABECERA_LOCAL.pack(
+            b'PK\003\004', 20, 0, flags, zipfile.ZIP_DEFLATED, dostime, dosdate, 0, 0, 0, len(nombre_bytes), 0))
+        self._salida.write(nombre_bytes)
+
+        compresor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if nivel is None else nivel, zlib.DEFLATED, -15)
+        crc = tamano = comprimido = 0
+        for trozo in trozos:
+            crc = zlib.crc32(trozo, crc)
+            tamano += len(trozo)
+            datos = compresor.compress(trozo)
+            comprimido += len(datos)
+            self._salida.write(datos)
+            yield
+        datos = compresor.flush()
+        comprimido += len(datos)
+        self._salida.write(datos)
+        if tamano > zipfile.ZIP64_LIMIT or comprimido > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f'{nombre} supera el tamaño de un ZIP sin ZIP64')
+        self._salida.write(_DESCRIPTOR.pack(b'PK\007\010', crc, comprimido, tamano))
+
+        self._central(20, flags, zipfile.ZIP_DEFLATED, dostime, dosdate, crc, comprimido, tamano, nombre_bytes,
+                      external_attr)
+        self._offset += _CABECERA_LOCAL.size + len(nombre_bytes) + comprimido + _DESCRIPTOR.size
+
+    def cerrar(self):
+        directorio = b''.join(self._centrales)
+        self._salida.write(directorio)
+        total, tamano, offset = len(self._centrales), len(directorio), self._offset
+        if total > zipfile.ZIP_FILECOUNT_LIMIT or tamano > zipfile.ZIP64_LIMIT or offset > zipfile.ZIP64_LIMIT:
+            # Más de 65535 miembros o más de 2 GB: los valores reales van en el fin de archivo ZIP64
+            self._salida.write(_FIN_ARCHIVO64.pack(
+                b'PK\006\006', _FIN_ARCHIVO64.size - 12, 45, 45, 0, 0, total, total, tamano, offset))
+            self._salida.write(_LOCALIZADOR64.pack(b'PK\006\007', 0, offset + tamano, 1))
+            total = min(total, _MAXIMO_16)
+            tamano = min(tamano, _MAXIMO_32)
+            offset = min(offset, _MAXIMO_32)
+        self._salida.write(_FIN_ARCHIVO.pack(b'PK\005\006', 0, 0, total, total, tamano, offset, 0))
+
+
+def escribir_zip(salida, miembros):
+    """Escribe un ZIP completo con los miembros dados, sin recomprimirlos"""
+    escritor = EscritorZipCrudo(salida)
+    for miembro in miembros:
+        escritor.agregar(miembro)
+    escritor.cerrar()
+
+
+class _BufferSalida(io.RawIOBase):
+    """Destino no posicionable para zipfile: acumula lo escrito hasta que se vacía"""
+
+    def __init__(self):
+        self._trozos = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._trozos.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._trozos)
+        self._trozos.clear()
+        return datos
+
+
+def nombre_unico(nombre, usados):
+    """Agrega _2, _3, ... al nombre si ya se usó en el mismo ZIP"""
+    base, extension = os.path.splitext(nombre)
+    candidato = nombre
+    n = 1
+    while candidato in usados:
+        n += 1
+        candidato = f"{base}_{n}{extension}"
+    usados.add(candidato)
+    return candidato
+
+
+def zip_en_streaming(archivos, compresion=zipfile.ZIP_STORED, nivel=None):
+    """Genera los bytes de un ZIP a medida que llegan los archivos (nombre, contenido).
+
+    Cada archivo se escribe desde memoria y sus bytes se entregan enseguida, sin
+    pasar por disco ni esperar a que termine el lote.
+    """
+    buffer = _BufferSalida()
+    usados = set()
+    with zipfile.ZipFile(buffer, 'w', compresion, compresslevel=nivel) as zipf:
+        for nombre, contenido in archivos:
+            zipf.writestr(nombre_unico(nombre, usados), contenido)
+            yield buffer.vaciar()
+    yield buffer.vaciar()
+
+
+def zip_combinado_en_streaming(archivos, nivel=None):
+    """ZIP único que guarda una sola vez las partes idénticas de todos los diplomas.
+
+    Cada parte distinta (estilos, tema, imágenes, document.xml de cada fila...)
+    queda en partes/ con sus datos comprimidos originales, y manifiesto.json
+    indica qué partes forman cada diploma. reconstruir_combinado vuelve a armar
+    los .docx.
+    """
+    buffer = _BufferSalida()
+    escritor = EscritorZipCrudo(buffer)
+    usados = set()
+    partes = {}
+    diplomas = {}
+    for nombre, contenido in archivos:
+        miembros = []
+        for miembro in leer_miembros(contenido):
+            huella = hashlib.sha1(bytes([miembro.compress_type]))
+            huella.update(miembro.datos)
+            clave = huella.hexdigest()
+            if clave not in partes:
+                partes[clave] = posixpath.join(CARPETA_PARTES, f"{clave}_{posixpath.basename(miembro.nombre)}")
+                escritor.agregar(miembro.renombrar(partes[clave]))
+            miembros.append([miembro.nombre, partes[clave]])
+        diplomas[nombre_unico(nombre, usados)] = miembros
+        yield buffer.vaciar()
+
+    manifiesto = json.dumps({'version': 1, 'diplomas': diplomas}, ensure_ascii=False).encode('utf-8')
+    escritor.agregar(MiembroZip.comprimir(MANIFIESTO_COMBINADO, manifiesto, time.localtime()[:6], nivel=nivel))
+    escritor.cerrar()
+    yield buffer.vaciar()
+
+
+def generar_archivo(archivos, modo='stored', nivel=None):
+    """Empaqueta los diplomas (nombre, contenido) según el modo de archivo"""
+    if modo not in MODOS_ARCHIVO:
+        raise ValueError(f"Modo de archivo no válido: {modo}")
+    if modo == 'combinado':
+        return zip_combinado_en_streaming(archivos, nivel=nivel)
+    compresion = zipfile.ZIP_DEFLATED if modo == 'deflated' else zipfile.ZIP_STORED
+    return zip_en_streaming(archivos, compresion=compresion, nivel=nivel)
+
+
+def reconstruir_combinado(origen, carpeta):
+    """Arma en carpeta los .docx de un ZIP combinado, sin recomprimir sus partes"""
+    with open(origen, 'rb') as f:
+        miembros = {miembro.nombre: miembro for miembro in leer_miembros(f.read())}
+    manifiesto = json.loads(zlib.decompress(miembros[MANIFIESTO_COMBINADO].datos, -15))
+
+    os.makedirs(carpeta, exist_ok=True)
+    raiz = os.path.realpath(carpeta)
+    for nombre, partes in manifiesto['diplomas'].items():
+        # Los nombres vienen del archivo: uno absoluto o con .. no puede escribir fuera de carpeta
+        relativo = posixpath.normpath(nombre.replace('\\', '/'))
+        ruta = os.path.realpath(os.path.join(raiz, *relativo.split('/')))
+        if posixpath.isabs(relativo) or os.path.commonpath([raiz, ruta]) != raiz or ruta == raiz:
+            raise zipfile.BadZipFile(f'nombre no válido en el manifiesto: {nombre}')
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, 'wb') as salida:
+            escribir_zip(salida, [miembros[parte].renombrar(nombre_parte) for nombre_parte, parte in partes])
+    return len(manifiesto['diplomas'])
+
@@ -0,0 +1,356 @@
+import collections
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_PATRON_HUELLA = re.compile(r'^[0-9a-f]{64}$')
+
+
+def huella_contenido(contenido):
+    """SHA-256 (hex) del contenido de una plantilla"""
+    return hashlib.sha256(contenido).hexdigest()
+
+
+class CachePlantillas:
+    """Plantillas identificadas por el hash de su contenido y compiladas una sola vez.
+
+    Cada .docx recibido se guarda en directorio con su SHA-256 como nombre,
+    así un cliente puede volver a usarlo enviando solo el hash. Las plantillas
+    compiladas (partes analizadas e índice de placeholders) se guardan en
+    memoria en un LRU limitado a max_bytes; en disco se conservan las
+    max_archivos usadas más recientemente.
+    """
+
+    def __init__(self, directorio, max_bytes=64 * 1024 * 1024, max_archivos=200):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_archivos = max_archivos
+        self.aciertos = 0
+        self.fallos = 0
+        self._compiladas = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Huella de archivos locales ya leídos, por (ruta, tamaño, fecha de modificación)
+        self._huellas_locales = {}
+        os.makedirs(directorio, exist_ok=True)
+
+    def ruta(self, huella):
+        """Ruta del .docx guardado con esa huella, o None si no existe"""
+        if not _PATRON_HUELLA.match(huella):
+            return None
+        ruta = os.path.join(self.directorio, huella + '.docx')
+        try:
+            # Marca el uso para que la limpieza conserve las más recientes
+            os.utime(ruta)
+        except FileNotFoundError:
+            return None
+        return ruta
+
+    def guardar(self, contenido):
+        """Guarda el contenido de una plantilla (si no estaba) y devuelve su huella"""
+        huella = huella_contenido(contenido)
+        if self.ruta(huella) is None:
+            ruta = os.path.join(self.directorio, huella + '.docx')
+            temporal = f"{ruta}.{threading.get_ident()}.tmp"
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+            os.replace(temporal, ruta)
+            self._limpiar_disco()
+        return huella
+
+    def guardar_ruta(self, ruta):
+        """Como guardar, para un archivo local; solo lo vuelve a leer si cambió"""
+        estado = os.stat(ruta)
+        clave = (os.path.abspath(ruta), estado.st_size, estado.st_mtime_ns)
+        huella = self._huellas_locales.get(clave)
+        if huella is None or self.ruta(huella) is None:
+            with open(ruta, 'rb') as f:
+                huella = self.guardar(f.read())
+            self._huellas_locales[clave] = huella
+        return huella
+
+    def obtener(self, huella, columnas, modo='auto'):
+        """Plantilla compilada para esas columnas; KeyError si la huella no está guardada"""
+        ruta = self.ruta(huella)
+        if ruta is None:
+            raise KeyError(huella)
+
+        # Las columnas deciden qué párrafos se plantillan, así que forman parte de la clave
+        clave = (huella, frozenset(columnas), modo)
+        with self._lock:
+            if clave in self._compiladas:
+                self._compiladas.move_to_end(clave)
+                self.aciertos += 1
+                return self._compiladas[clave][0]
+            self.fallos += 1
+
+        # python-docx se importa recién al compilar la primera plantilla
+        from .plantilla import compilar_plantilla
+        plantilla = compilar_plantilla(ruta, columnas, modo=modo)
+        tamano = plantilla.tamano
+
+        with self._lock:
+            if clave not in self._compiladas and tamano <= self.max_bytes:
+                self._compiladas[clave] = (plantilla, tamano)
+                self._bytes += tamano
+                while self._bytes > self.max_bytes:
+                    _, (_, liberado) = self._compiladas.popitem(last=False)
+                    self._bytes -= liberado
+        return plantilla
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'plantillas': len(self._compiladas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
+
+    def _limpiar_disco(self):
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.docx'):
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    archivos.append((os.path.getmtime(ruta), ruta))
+                except FileNotFoundError:
+                    continue
+        archivos.sort()
+        for _, ruta in archivos[:max(len(archivos) - self.max_archivos, 0)]:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+
+class CacheDiplomas:
+    """Diplomas ya generados, guardados en disco por plantilla y por contenido de la fila.
+
+    Cada diploma queda en directorio/<hash de la plantilla>/<hash de la fila>
+    y un índice SQLite (indice.sqlite3) guarda su tamaño y su último uso.
+    Así, al volver a subir el mismo Excel con unas pocas correcciones, solo
+    las filas nuevas o cambiadas se vuelven a generar. Se borran los diplomas
+    sin usar hace más de max_edad segundos y, después, los usados hace más
+    tiempo hasta que el total queda por debajo de max_bytes.
+    """
+
+    def __init__(self, directorio, max_bytes=512 * 1024 * 1024, max_edad=7 * 24 * 3600):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.max_edad = max_edad
+        self.aciertos = 0
+        self.fallos = 0
+        self._ruta_indice = os.path.join(directorio, 'indice.sqlite3')
+        self._local = threading.local()
+        os.makedirs(directorio, exist_ok=True)
+        with self._conexion() as conexion:
+            conexion.execute(
+                'CREATE TABLE IF NOT EXISTS diplomas ('
+                'plantilla TEXT NOT NULL, fila TEXT NOT NULL, tamano INTEGER NOT NULL, usado REAL NOT NULL, '
+                'PRIMARY KEY (plantilla, fila))')
+            conexion.execute('CREATE INDEX IF NOT EXISTS diplomas_usado ON diplomas (usado)')
+
+    def _conexion(self):
+        # Una conexión por hilo y por proceso (las conexiones no sobreviven a un fork)
+        conexion = getattr(self._local, 'conexion', None)
+        if conexion is None or self._local.pid != os.getpid():
+            conexion = sqlite3.connect(self._ruta_indice, timeout=30)
+            self._local.conexion, self._local.pid = conexion, os.getpid()
+        return conexion
+
+    def ruta(self, plantilla, fila):
+        return os.path.join(self.directorio, plantilla, fila)
+
+    def contiene(self, plantilla, fila):
+        cursor = self._conexion().execute(
+            'SELECT 1 FROM diplomas WHERE plantilla = ? AND fila = ?', (plantilla, fila))
+        return cursor.fetchone() is not None
+
+    def leer(self, plantilla, fila):
+        """Contenido guardado, o None si se borró"""
+        try:
+            with open(self.ruta(plantilla, fila), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def escribir(self, plantilla, fila, contenido):
+        ruta = self.ruta(plantilla, fila)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, ruta)
+
+    def registrar(self, usados, nuevos):
+        """Anota en el índice los diplomas usados (plantilla, fila) y los nuevos (plantilla, fila, tamaño)"""
+        ahora = time.time()
+        with self._conexion() as conexion:
+            conexion.executemany('UPDATE diplomas SET usado = ? WHERE plantilla = ? AND fila = ?',
+                                 [(ahora, plantilla, fila) for plantilla, fila in usados])
+            conexion.executemany('INSERT OR REPLACE INTO diplomas VALUES (?, ?, ?, ?)',
+                                 [(plantilla, fila, tamano, ahora) for plantilla, fila, tamano in nuevos])
+
+    def limpiar(self):
+        """Borra los diplomas vencidos y, si el total supera max_bytes, los usados hace más tiempo"""
+        limite = time.time() - self.max_edad
+        conexion = self._conexion()
+        with conexion:
+            borrados = conexion.execute('SELECT plantilla, fila FROM diplomas WHERE usado < ?', (limite,)).fetchall()
+            total = conexion.execute('SELECT COALESCE(SUM(tamano), 0) FROM diplomas WHERE usado >= ?',
+                                     (limite,)).fetchone()[0]
+            if total > self.max_bytes:
+                for plantilla, fila, tamano in conexion.execute(
+                        'SELECT plantilla, fila, tamano FROM diplomas WHERE usado >= ? ORDER BY usado',
+                        (limite,)).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    borrados.append((plantilla, fila))
+                    total -= tamano
+            conexion.executemany('DELETE FROM diplomas WHERE plantilla = ? AND fila = ?', borrados)
+        for plantilla, fila in borrados:
+            try:
+                os.remove(self.ruta(plantilla, fila))
+            except FileNotFoundError:
+                pass
+        return len(borrados)
+
+    def estadisticas(self):
+        cantidad, total = self._conexion().execute(
+            'SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM diplomas').fetchone()
+        return {
+            'diplomas': cantidad,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+        }
+
+    def para(self, huella, plantilla, formato='docx'):
+        """Caché de las filas de una plantilla compilada (huella de su .docx) en un formato"""
+        return CacheFilas(self, huella, f'{formato}:{type(plantilla).__name__}', '.' + formato)
+
+
+class CacheFilas:
+    """Caché de diplomas de una generación: la plantilla y el formato ya están fijos.
+
+    Los usos y los diplomas nuevos se anotan en el índice por lotes y al terminar.
+    """
+
+    # Diplomas nuevos que se acumulan antes de anotarlos en el índice
+    POR_LOTE = 100
+
+    def __init__(self, cache, huella, tipo, extension):
+        self.cache = cache
+        self.huella = huella
+        self.tipo = tipo
+        self.extension = extension
+        self.aciertos = 0
+        self.fallos = 0
+        self._usados = []
+        self._nuevos = []
+
+    def clave(self, valores):
+        """Hash del contenido de la fila (y del tipo de diploma)"""
+        texto = json.dumps([self.tipo, valores], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def guardar(self, clave, contenido):
+        self.cache.escribir(self.huella, clave, contenido)
+        self._nuevos.append((self.huella, clave, len(contenido)))
+        if len(self._nuevos) >= self.POR_LOTE:
+            self.confirmar()
+
+    def confirmar(self):
+        self.cache.registrar(self._usados, self._nuevos)
+        self._usados, self._nuevos = [], []
+
+    def generar(self, filas, generar):
+        """Diplomas (nombre, contenido) de las filas (nombre, valores), en el mismo orden.
+
+        Las filas que ya están en el caché se leen de disco; solo las demás
+        pasan por generar, que recibe y devuelve filas en el formato de
+        renderizar_diplomas. Una fila del caché sale apenas se lee si no hay
+        filas antes que ella generándose, así las filas que llegan de a poco
+        no esperan a la siguiente que falta.
+        """
+        filas = iter(filas)
+        # Filas en orden de llegada: (nombre, clave, contenido si está en el caché)
+        pendientes = collections.deque()
+        # Filas que faltan leídas aquí, antes de pasarlas a generar
+        por_generar = collections.deque()
+        faltan = 0
+
+        def leer():
+            """Lee la próxima fila y la anota en pendientes; devuelve la fila si falta, o None"""
+            nonlocal faltan
+            nombre, valores = next(filas)
+            clave = self.clave(valores)
+            # El contenido se lee ya: si se borró después de anotarlo, la fila falta como cualquier otra.
+            # Solo esperan en memoria las filas del caché que llegan detrás de una que se está generando
+            if self.cache.contiene(self.huella, clave):
+                contenido = self.cache.leer(self.huella, clave)
+                if contenido is not None:
+                    pendientes.append((nombre, clave, contenido))
+                    return None
+            pendientes.append((nombre, clave, None))
+            faltan += 1
+            return nombre, valores
+
+        def faltantes():
+            while True:
+                if por_generar:
+                    yield por_generar.popleft()
+                    continue
+                try:
+                    fila = leer()
+                except StopIteration:
+                    return
+                if fila is not None:
+                    yield fila
+
+        def desde_cache():
+            while pendientes and pendientes[0][2] is not None:
+                nombre, clave, contenido = pendientes.popleft()
+                self._usados.append((self.huella, clave))
+                self.aciertos += 1
+                yield os.path.splitext(nombre)[0] + self.extension, contenido
+
+        # generar se empieza con la primera fila que falta: si están todas en el caché, no se usa
+        generados = None
+        try:
+            while True:
+                if not faltan:
+                    # Nada generándose: la próxima fila se lee aquí y, si está en el caché, sale enseguida
+                    try:
+                        fila = leer()
+                    except StopIteration:
+                        break
+                    if fila is None:
+                        yield from desde_cache()
+                        continue
+                    por_generar.append(fila)
+                    if generados is None:
+                        generados = iter(generar(faltantes()))
+                nombre, contenido = next(generados)
+                yield from desde_cache()
+                _, clave, _ = pendientes.popleft()
+                faltan -= 1
+                self.guardar(clave, contenido)
+                self.fallos += 1
+                yield nombre, contenido
+                yield from desde_cache()
+        finally:
+            # Termina el pipeline de generar (y su pool de procesos) si la salida se cortó antes
+            if hasattr(generados, 'close'):
+                generados.close()
+            self.confirmar()
+            self.cache.aciertos += self.aciertos
+            self.cache.fallos += self.fallos
+            self.cache.limpiar()
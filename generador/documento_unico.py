@@ -0,0 +1,252 @@
+import posixpath
+import re
+import time
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsmap, qn
+from lxml import etree
+
+from .archivo_zip import EscritorZipCrudo, MiembroZip, _BufferSalida, nombre_unico
+from .ooxml import (_CONTENT_TYPES, _NS_CONTENT_TYPES, PlantillaNoSoportada, PlantillaOOXML, _ParteSegmentada,
+                    _rels_con, _ruta_rels, _segmentar, _xml_relacion, id_relacion, xml_dibujo)
+
+# Marca del lugar, en el último párrafo de cada fila, donde va el salto de sección
+_MARCA_SECCION = ('diploma-seccion', 'fin')
+_BYTES_SECCION = etree.tostring(etree.ProcessingInstruction(*_MARCA_SECCION))
+
+_NS_RELACIONES = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+# Identificadores que deben ser únicos en todo el documento: dibujos y marcadores
+_PATRON_IDS = re.compile(rb'(<(?:wp:docPr|w:bookmarkStart|w:bookmarkEnd)\s[^>]*?\b(?:w:)?id=")(\d+)"')
+_PATRON_BODY = re.compile(rb'<w:body(?:\s[^>]*)?>')
+_PATRON_SECTPR = re.compile(rb'<w:sectPr[\s/>]')
+
+
+def _renumerar(xml, desplazamiento):
+    """Suma desplazamiento a los id de dibujos y marcadores"""
+    return _PATRON_IDS.sub(lambda m: m.group(1) + str(int(m.group(2)) + desplazamiento).encode() + b'"', xml)
+
+
+class DocumentoUnico:
+    """Todas las filas en un solo .docx, una sección (y una página nueva) por fila.
+
+    Se arma sobre la ruta rápida: el cuerpo de word/document.xml se parte una
+    vez en segmentos y cada fila agrega su fragmento al mismo document.xml,
+    que se comprime mientras se escribe. Estilos, numeración, imágenes y
+    relaciones quedan una sola vez; solo los encabezados y pies de página
+    con placeholders se copian, uno por cada contenido distinto. Cada imagen
+    por fila distinta (una foto, un QR) se guarda una vez aunque la usen
+    muchas filas.
+    """
+
+    def __init__(self, plantilla):
+        if not isinstance(plantilla, PlantillaOOXML):
+            raise PlantillaNoSoportada('el documento único necesita una plantilla de la ruta rápida')
+        self.plantilla = plantilla
+        self.documento = documento = plantilla.documento
+        miembros = {miembro.nombre: miembro for miembro in plantilla._miembros}
+
+        raiz = parse_xml(miembros[documento].contenido())
+        body = raiz.find(qn('w:body'))
+        if body is None:
+            raise PlantillaNoSoportada('documento sin w:body')
+        if len(body) == 0 or body[-1].tag != qn('w:sectPr'):
+            body.append(OxmlElement('w:sectPr'))
+
+        # El salto de sección de cada fila va en su último párrafo, sin agregar párrafos que muevan el diseño
+        ultimo = body[-2] if len(body) > 1 else None
+        if ultimo is None or ultimo.tag != qn('w:p') or (ultimo.pPr is not None and ultimo.pPr.sectPr is not None):
+            ultimo = OxmlElement('w:p')
+            body[-1].addprevious(ultimo)
+        pPr = ultimo.get_or_add_pPr()
+        marca = etree.ProcessingInstruction(*_MARCA_SECCION)
+        cambio = pPr.find(qn('w:pPrChange'))
+        if cambio is not None:
+            cambio.addprevious(marca)
+        else:
+            pPr.append(marca)
+
+        xml = etree.tostring(raiz, encoding='UTF-8', standalone=True)
+        segmentada = _segmentar(xml, plantilla.columnas, True) or _ParteSegmentada([xml], [])
+
+        # Cabecera hasta <w:body>, cuerpo de cada fila, y sectPr final con el cierre
+        segmentos = list(segmentada.segmentos)
+        inicio = _PATRON_BODY.search(segmentos[0]).end()
+        self._cabecera = segmentos[0][:inicio]
+        segmentos[0] = segmentos[0][inicio:]
+        fin = list(_PATRON_SECTPR.finditer(segmentos[-1]))[-1].start()
+        final = segmentos[-1][fin:]
+        segmentos[-1] = segmentos[-1][:fin]
+        cierre = final.rindex(b'</w:body>')
+        self._seccion = final[:cierre]
+        self._cierre = final[cierre:]
+        self._cuerpo = _ParteSegmentada(segmentos, segmentada.slots)
+
+        # Encabezados y pies de página con placeholders, con las relaciones que los usan
+        relaciones = etree.fromstring(miembros[_ruta_rels(documento)].contenido())
+        carpeta = posixpath.dirname(documento)
+        self._dinamicas = {}
+        partes_xml = [miembros[documento].contenido()]
+        for rel in relaciones:
+            if rel.get('Type') not in (RT.HEADER, RT.FOOTER) or rel.get('TargetMode') == 'External':
+                continue
+            destino = rel.get('Target')
+            ruta = destino.lstrip('/') if destino.startswith('/') else posixpath.normpath(
+                posixpath.join(carpeta, destino))
+            partes_xml.append(miembros[ruta].contenido())
+            if ruta in plantilla._partes:
+                self._dinamicas.setdefault(ruta, []).append(rel)
+        if self._dinamicas and raiz.nsmap.get('r') != nsmap['r']:
+            raise PlantillaNoSoportada('prefijo r: no estándar')
+        # Encabezados con imágenes por fila: cada copia lleva sus propias relaciones a las imágenes
+        self._con_imagenes = {ruta for ruta in self._dinamicas if plantilla._partes[ruta].imagenes}
+
+        # Los id de cada copia se corren en múltiplos de un valor mayor que todos los de la plantilla:
+        # múltiplos pares para el cuerpo de cada fila e impares para las copias de encabezados
+        self._desplazamiento = 1 + max(
+            (int(m.group(2)) for xml in partes_xml for m in _PATRON_IDS.finditer(xml)), default=-1)
+        # Los dibujos de las imágenes de una fila toman id desde plantilla._primer_id, uno por placeholder
+        dibujos = len(self._cuerpo.imagenes) + sum(len(plantilla._partes[ruta].imagenes) for ruta in self._dinamicas)
+        if dibujos:
+            self._desplazamiento = max(self._desplazamiento, plantilla._primer_id + dibujos)
+        self._con_ids = self._desplazamiento > 0
+
+        self._miembros = plantilla._miembros
+        self._reescritos = {documento, _CONTENT_TYPES, _ruta_rels(documento), *self._dinamicas,
+                            *(_ruta_rels(ruta) for ruta in self._con_imagenes)}
+
+    def _dibujar(self, siguiente, imagenes):
+        """Función dibujar que anota en imagenes las de una parte; siguiente da los id de los dibujos de la fila"""
+        def dibujar(imagen, ancho):
+            imagenes[imagen.huella] = imagen
+            self._medios[imagen.huella] = imagen
+            return xml_dibujo(next(siguiente), id_relacion(imagen), imagen.nombre, *imagen.tamano(ancho))
+        return dibujar
+
+    def _renderizar_partes(self, valores, copias, fecha, nivel, siguiente):
+        """Renderiza los encabezados de una fila y devuelve el cambio de r:id que necesita su sección"""
+        cambios = []
+        for ruta, rels in self._dinamicas.items():
+            imagenes = {}
+            contenido = self.plantilla._partes[ruta].renderizar(valores, self._dibujar(siguiente, imagenes))
+            vistas = copias[ruta]
+            if contenido not in vistas:
+                n = len(vistas)
+                contenido_copia, nombre = contenido, ruta
+                if n:
+                    base, extension = posixpath.splitext(ruta)
+                    nombre = nombre_unico(f'{base}_{n + 1}{extension}', self._usados)
+                    if self._con_ids:
+                        contenido_copia = _renumerar(contenido, (2 * n - 1) * self._desplazamiento)
+                vistas[contenido] = (n, nombre, imagenes)
+                self._nuevos.append(MiembroZip.comprimir(nombre, contenido_copia, fecha, nivel=nivel))
+            n, _, _ = vistas[contenido]
+            if n:
+                for rel in rels:
+                    cambios.append((f'r:id="{rel.get("Id")}"'.encode(), f'r:id="{rel.get("Id")}_{n + 1}"'.encode()))
+        return cambios
+
+    def _fila(self, k, valores, copias, fecha, nivel):
+        """Fragmento del cuerpo de la fila k (con la marca de sección) y su sectPr"""
+        siguiente = iter(range(self.plantilla._primer_id, self._desplazamiento))
+        fragmento = self._cuerpo.renderizar(valores, self._dibujar(siguiente, self._imagenes))
+        if k and self._con_ids:
+            fragmento = _renumerar(fragmento, 2 * k * self._desplazamiento)
+        seccion = self._seccion
+        for anterior, nuevo in self._renderizar_partes(valores, copias, fecha, nivel, siguiente):
+            fragmento = fragmento.replace(anterior, nuevo)
+            seccion = seccion.replace(anterior, nuevo)
+        return fragmento, seccion
+
+    def en_streaming(self, filas, nivel=None):
+        """Genera los bytes del .docx a medida que llegan los valores de cada fila"""
+        buffer = _BufferSalida()
+        escritor = EscritorZipCrudo(buffer)
+        fecha = time.localtime()[:6]
+        self._usados = {miembro.nombre for miembro in self._miembros}
+        self._nuevos = []
+        # Imágenes del cuerpo (relacionadas con el documento) y todas las del paquete, guardadas una vez
+        self._imagenes = {}
+        self._medios = {}
+        copias = {ruta: {} for ruta in self._dinamicas}
+
+        miembros = {}
+        for miembro in self._miembros:
+            miembros[miembro.nombre] = miembro
+            if miembro.nombre not in self._reescritos:
+                escritor.agregar(miembro)
+        yield buffer.vaciar()
+
+        def cuerpo():
+            yield self._cabecera
+            pendiente = None
+            for k, valores in enumerate(filas):
+                fila = self._fila(k, valores, copias, fecha, nivel)
+                # La sección de cada fila se cierra con su propio sectPr; la última usa el del cuerpo
+                if pendiente is not None:
+                    yield pendiente[0].replace(_BYTES_SECCION, pendiente[1])
+                pendiente = fila
+            if pendiente is None:
+                yield self._seccion
+            else:
+                yield pendiente[0].replace(_BYTES_SECCION, b'')
+                yield pendiente[1]
+            yield self._cierre
+
+        for _ in escritor.agregar_por_partes(self.documento, cuerpo(), fecha, nivel=nivel):
+            datos = buffer.vaciar()
+            if datos:
+                yield datos
+
+        # Encabezados usados, con sus relaciones propias, y las relaciones y tipos de las copias
+        relaciones = etree.fromstring(miembros[_ruta_rels(self.documento)].contenido())
+        tipos = etree.fromstring(miembros[_CONTENT_TYPES].contenido())
+        sobrescritos = {o.get('PartName'): o.get('ContentType') for o in tipos.iter(f'{{{_NS_CONTENT_TYPES}}}Override')}
+        for ruta, vistas in copias.items():
+            rels_parte = miembros.get(_ruta_rels(ruta))
+            con_imagenes = ruta in self._con_imagenes
+            if not vistas:
+                escritor.agregar(miembros[ruta])
+                if con_imagenes and rels_parte is not None:
+                    escritor.agregar(rels_parte)
+            for n, nombre, imagenes in vistas.values():
+                if con_imagenes:
+                    # Relaciones de la copia: las de la plantilla más las de sus imágenes
+                    carpeta_copia = posixpath.dirname(nombre)
+                    contenido = _rels_con(rels_parte.contenido() if rels_parte is not None else None, [
+                        _xml_relacion(imagen, posixpath.relpath(self.plantilla.ruta_imagen(imagen), carpeta_copia))
+                        for imagen in imagenes.values()])
+                    escritor.agregar(MiembroZip.comprimir(_ruta_rels(nombre), contenido, fecha, nivel=nivel))
+                if not n:
+                    continue
+                if rels_parte is not None and not con_imagenes:
+                    escritor.agregar(rels_parte.renombrar(_ruta_rels(nombre)))
+                for rel in self._dinamicas[ruta]:
+                    etree.SubElement(relaciones, f'{{{_NS_RELACIONES}}}Relationship', {
+                        'Id': f'{rel.get("Id")}_{n + 1}',
+                        'Type': rel.get('Type'),
+                        'Target': posixpath.join(posixpath.dirname(rel.get('Target')), posixpath.basename(nombre)),
+                    })
+                tipo = sobrescritos.get('/' + ruta)
+                if tipo is not None:
+                    etree.SubElement(tipos, f'{{{_NS_CONTENT_TYPES}}}Override',
+                                     {'PartName': '/' + nombre, 'ContentType': tipo})
+        for miembro in self._nuevos:
+            escritor.agregar(miembro)
+        carpeta = posixpath.dirname(self.documento)
+        for imagen in self._imagenes.values():
+            etree.SubElement(relaciones, f'{{{_NS_RELACIONES}}}Relationship', {
+                'Id': id_relacion(imagen), 'Type': RT.IMAGE,
+                'Target': posixpath.relpath(self.plantilla.ruta_imagen(imagen), carpeta)})
+        for imagen in self._medios.values():
+            escritor.agregar(imagen.miembro(self.plantilla.ruta_imagen(imagen)))
+        for nombre, xml in ((_ruta_rels(self.documento), relaciones), (_CONTENT_TYPES, tipos)):
+            escritor.agregar(miembros[nombre].reemplazar(etree.tostring(xml, encoding='UTF-8', standalone=True)))
+        escritor.cerrar()
+        yield buffer.vaciar()
+
+
+def docx_unico_en_streaming(plantilla, filas, nivel=None):
+    """Bytes de un solo .docx con una sección por cada fila (valores)"""
+    return DocumentoUnico(plantilla).en_streaming(filas, nivel=nivel)
@@ -0,0 +1,253 @@
+import itertools
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Columnas con tratamiento especial
+COLUMNA_DOCUMENTO = 'N_DOCUMENTO'
+COLUMNA_LUGAR = 'LUGAR_EXPEDICION'
+COLUMNA_NOMBRE = 'NOMBRE_COMPLETO'
+
+# Filas que se normalizan juntas; acota la memoria sin perder la vectorización
+FILAS_POR_BLOQUE = 10000
+
+# 'nan' en cualquier combinación de mayúsculas y minúsculas, que se trata como celda vacía
+_TEXTOS_NAN = {''.join(letras) for letras in itertools.product('nN', 'aA', 'nN')}
+
+# Separadores de miles ya puestos: grupos de 3 caracteres separados por puntos (1.234.567)
+_PATRON_CON_PUNTOS = r'(?:[^.]{3}\.)+[^.]{0,3}'
+
+
+def formatear_numero_con_puntos(numero):
+    """Formatea un número con puntos como separadores de miles (formato colombiano)"""
+    if numero is None:
+        return ''
+
+    num_str = str(numero).strip()
+
+    if num_str == '' or num_str.lower() == 'nan':
+        return ''
+
+    if '.' in num_str and not num_str.startswith('.'):
+        partes = num_str.split('.')
+        es_formato_valido = all(len(p) == 3 for p in partes[:-1]) and len(partes[-1]) <= 3
+        if es_formato_valido:
+            return num_str
+
+    try:
+        if isinstance(numero, (int, float)):
+            num_int = int(numero)
+        elif num_str.replace('.', '').isdigit():
+            num_int = int(num_str.replace('.', ''))
+        else:
+            return num_str
+
+        return f'{num_int:,}'.replace(',', '.')
+    except (ValueError, TypeError):
+        return num_str
+
+
+def _texto_celda(valor):
+    """Texto de una celda como lo entrega pandas con dtype=str (enteros sin .0, vacías como '')"""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+
+def _texto_columna(crudo):
+    """Versión vectorizada de _texto_celda para una columna cruda (dtype object)"""
+    # Solo texto y vacías (lo habitual en CSV, Parquet y Arrow): no hace falta mirar cada celda
+    if pd.api.types.infer_dtype(crudo, skipna=True) in ('string', 'empty'):
+        return crudo.fillna('') if crudo.hasnans else crudo
+
+    tipos = crudo.map(type)
+    es_texto = tipos == str
+    if es_texto.all():
+        return crudo
+
+    texto = crudo.where(es_texto | crudo.isna(), crudo.map(str)).fillna('')
+    flotantes = crudo[tipos == float]
+    if len(flotantes):
+        enteros = flotantes[flotantes.astype(float) % 1 == 0]
+        texto[enteros.index] = enteros.map(int).map(str)
+    return texto
+
+
+def _con_puntos(enteros):
+    """Agrega puntos cada 3 dígitos desde la derecha a una columna de enteros"""
+    return enteros.map('{:,}'.format).str.replace(',', '.', regex=False)
+
+
+def limpiar_texto(crudo, texto):
+    """Normalizador por defecto: sin espacios alrededor y 'nan' como vacío"""
+    texto = texto.str.strip()
+    return texto.where(~texto.isin(_TEXTOS_NAN), '')
+
+
+def preservar_exacto(crudo, texto):
+    """Valor exacto de la celda, sin strip ni conversión de enteros"""
+    return crudo.fillna('').map(str)
+
+
+def formatear_documentos(crudo, texto):
+    """formatear_numero_con_puntos aplicado a toda una columna a la vez"""
+    resultado = pd.Series('', index=crudo.index, dtype=object)
+    tipos = crudo.map(type)
+
+    # Celdas enteras: solo falta agregar los puntos. Un booleano queda como 1 o 0, igual que int(celda)
+    enteros = tipos.isin((int, bool))
+    resultado[enteros] = _con_puntos(crudo[enteros].map(int))
+
+    # Texto y decimales: se decide por el texto de la celda
+    otros = crudo[~enteros & crudo.notna()]
+    if not len(otros):
+        return resultado
+    num_str = otros.map(str).str.strip()
+    pendientes = (num_str != '') & ~num_str.isin(_TEXTOS_NAN)
+
+    # Ya tiene los puntos bien puestos: se mantiene tal cual
+    validos = pendientes & num_str.str.fullmatch(_PATRON_CON_PUNTOS)
+    pendientes &= ~validos
+
+    # Decimales: se truncan a entero
+    decimales = pendientes & (tipos[otros.index] == float)
+    resultado[decimales[decimales].index] = _con_puntos(otros[decimales].map(int))
+    pendientes &= ~decimales
+
+    # Texto de solo dígitos, con o sin puntos mal puestos
+    sin_puntos = num_str[pendientes].str.replace('.', '', regex=False)
+    digitos = sin_puntos[sin_puntos.str.fullmatch(r'\d+')]
+    resultado[digitos.index] = _con_puntos(digitos.map(int))
+    pendientes[digitos.index] = False
+
+    # Lo demás (texto con formato válido o que no es un número) queda sin cambios
+    sin_cambios = validos | pendientes
+    resultado[sin_cambios[sin_cambios].index] = num_str[sin_cambios]
+    return resultado
+
+
+# Normalizador de cada columna especial: recibe la columna cruda y su texto, y devuelve los valores finales.
+# Las columnas que no están aquí usan limpiar_texto.
+NORMALIZADORES = {
+    COLUMNA_DOCUMENTO: formatear_documentos,
+    COLUMNA_LUGAR: preservar_exacto,
+}
+
+
+def _encabezados(fila):
+    """Nombres de columna en MAYÚSCULAS, con los mismos nombres que pandas para vacías y repetidas"""
+    valores = list(fila)
+    while valores and _texto_celda(valores[-1]) == '':
+        valores.pop()
+    columnas = []
+    for i, valor in enumerate(valores):
+        nombre = _texto_celda(valor).upper() or f'UNNAMED: {i}'
+        candidato = nombre
+        n = 0
+        while candidato in columnas:
+            n += 1
+            candidato = f'{nombre}.{n}'
+        columnas.append(candidato)
+    return columnas
+
+
+def normalizar_bloque(crudo, inicio=0):
+    """Normaliza un bloque de filas crudas (DataFrame de dtype object) columna por columna.
+
+    Devuelve los nombres de archivo de las filas con datos y la lista de
+    valores de cada columna. Las filas vacías se saltan todas; pd.read_excel
+    solo saltaba las del final y por cada vacía intermedia salía un
+    Diploma_.docx en blanco. inicio es el número de filas con datos de los
+    bloques anteriores, para los nombres SinNombre_N.
+    """
+    columnas = list(crudo.columns)
+    textos = [_texto_columna(crudo[columna]) for columna in columnas]
+
+    con_datos = pd.Series(False, index=crudo.index)
+    for texto in textos:
+        con_datos |= texto != ''
+    crudo = crudo[con_datos]
+    textos = [texto[con_datos] for texto in textos]
+
+    valores = [
+        NORMALIZADORES.get(columna, limpiar_texto)(crudo[columna], texto).tolist()
+        for columna, texto in zip(columnas, textos)
+    ]
+
+    if COLUMNA_NOMBRE in columnas:
+        nombres = textos[columnas.index(COLUMNA_NOMBRE)]
+        nombres = nombres.where(~nombres.isin(('nan', 'NaN')), '')
+    else:
+        nombres = pd.Series([f"SinNombre_{inicio + i + 1}" for i in range(len(crudo))], dtype=object)
+    nombres = ('Diploma_' + nombres.str.replace(' ', '_', regex=False) + '.docx').tolist()
+    return nombres, valores
+
+
+def bloques_de_filas(filas, columnas):
+    """Agrupa filas (tuplas de celdas) en bloques crudos de FILAS_POR_BLOQUE, recortadas o completadas al ancho"""
+    ancho = len(columnas)
+    while True:
+        bloque = list(itertools.islice(filas, FILAS_POR_BLOQUE))
+        if not bloque:
+            return
+        if any(len(fila) != ancho for fila in bloque):
+            bloque = [tuple(fila[:ancho]) + (None,) * (ancho - len(fila)) for fila in bloque]
+        yield pd.DataFrame(bloque, columns=columnas, dtype=object)
+
+
+def filas_de_bloques(bloques, columnas):
+    """Genera (nombre del archivo, valores) de cada fila con datos de los bloques crudos ya normalizados"""
+    numero = 0
+    for crudo in bloques:
+        nombres, valores = normalizar_bloque(crudo, inicio=numero)
+        numero += len(nombres)
+        yield from zip(nombres, [dict(zip(columnas, fila)) for fila in zip(*valores)])
+
+
+def buscar_encabezados(filas):
+    """Nombres de las columnas (la primera fila con datos) y filas leídas hasta encontrarlos"""
+    leidas = 0
+    for fila in filas:
+        leidas += 1
+        if any(_texto_celda(valor) != '' for valor in fila):
+            return _encabezados(fila), leidas
+    return [], leidas
+
+
+class HojaExcel:
+    """Primera hoja del Excel leída en una sola pasada, en modo de solo lectura.
+
+    Las filas se leen por bloques de FILAS_POR_BLOQUE y cada bloque se
+    normaliza columna por columna según NORMALIZADORES (N_DOCUMENTO con
+    puntos, LUGAR_EXPEDICION exacto, el resto sin espacios ni 'nan'), así que
+    la memoria no depende del tamaño del Excel.
+    """
+
+    def __init__(self, excel_path):
+        self._wb = load_workbook(excel_path, read_only=True, data_only=True)
+        ws = self._wb.worksheets[0]
+        self._filas = ws.iter_rows(values_only=True)
+
+        # La primera fila con datos tiene los nombres de las columnas
+        self.columnas, filas_leidas = buscar_encabezados(self._filas)
+
+        # Según la dimensión guardada en el archivo; puede no estar o incluir filas vacías
+        if not self.columnas:
+            self.total_estimado = 0
+        else:
+            self.total_estimado = max(ws.max_row - filas_leidas, 0) if ws.max_row else None
+
+    def filas(self):
+        """Genera (nombre del archivo, valores) de cada fila con datos"""
+        return filas_de_bloques(bloques_de_filas(self._filas, self.columnas), self.columnas)
+
+    def cerrar(self):
+        self._wb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
@@ -0,0 +1,386 @@
+import base64
+import binascii
+import collections
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .archivo_zip import MiembroZip
+
+# Clave de los valores de una fila donde quedan sus imágenes ya preparadas ({placeholder: Imagen});
+# lleva llaves, así que nunca coincide con un placeholder de texto
+CLAVE_IMAGENES = '{imagenes}'
+
+# Placeholders de imagen: {IMG:COLUMNA} (foto o firma) y {QR:COLUMNA}, con un ancho opcional como {IMG:FOTO:4cm}
+_PATRON_IMAGEN = re.compile(r'^(IMG|QR):([^:]+?)(?::(\d+(?:[.,]\d+)?)\s*(cm|mm))?$')
+_EMU_POR_UNIDAD = {'cm': 360000, 'mm': 36000}
+# Ancho por defecto de cada tipo de imagen (EMU)
+ANCHO_POR_DEFECTO = {'IMG': 3 * 360000, 'QR': 25 * 36000}
+
+# Lado mayor (píxeles) de las fotos dentro del diploma: con 3 cm de ancho, 1000 px superan los 300 ppp
+LADO_MAXIMO = 1000
+# Módulos del QR en píxeles y margen en módulos
+_ESCALA_QR = 10
+_MARGEN_QR = 2
+
+# Fecha fija de los miembros de imagen: el mismo contenido da siempre los mismos bytes
+_FECHA_MEDIOS = (1980, 1, 1, 0, 0, 0)
+
+
+class ImagenNoDisponible(ValueError):
+    """La imagen de una fila no se encuentra, no se puede leer o falta la librería para prepararla"""
+
+
+def _pillow():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise ImagenNoDisponible('Para insertar fotos ({IMG:...}) hace falta instalar Pillow')
+    return Image, ImageOps
+
+
+def _segno():
+    try:
+        import segno
+    except ImportError:
+        raise ImagenNoDisponible('Para insertar códigos QR ({QR:...}) hace falta instalar segno')
+    return segno
+
+
+class PlaceholderImagen:
+    """Placeholder de imagen de la plantilla: tipo (IMG o QR), columna de la fila y ancho en EMU"""
+
+    __slots__ = ('nombre', 'tipo', 'columna', 'ancho')
+
+    def __init__(self, nombre, tipo, columna, ancho):
+        self.nombre = nombre
+        self.tipo = tipo
+        self.columna = columna
+        self.ancho = ancho
+
+    def __repr__(self):
+        return f'PlaceholderImagen({self.nombre!r})'
+
+
+def placeholder_imagen(nombre):
+    """PlaceholderImagen del texto entre llaves, o None si es un placeholder de texto"""
+    coincidencia = _PATRON_IMAGEN.match(nombre)
+    if coincidencia is None:
+        return None
+    tipo, columna, medida, unidad = coincidencia.groups()
+    ancho = ANCHO_POR_DEFECTO[tipo]
+    if medida:
+        ancho = round(float(medida.replace(',', '.')) * _EMU_POR_UNIDAD[unidad])
+    return PlaceholderImagen(nombre, tipo, columna.strip(), ancho)
+
+
+def placeholders_imagen(nombres, columnas):
+    """Placeholders de imagen entre nombres cuya columna está en columnas, por nombre"""
+    imagenes = {}
+    for nombre in nombres:
+        placeholder = placeholder_imagen(nombre)
+        if placeholder is not None and placeholder.columna in columnas:
+            imagenes[nombre] = placeholder
+    return imagenes
+
+
+class Imagen:
+    """Imagen lista para el diploma (PNG o JPEG), identificada por el hash de su origen"""
+
+    __slots__ = ('huella', 'datos', 'extension', 'ancho_px', 'alto_px', '_miembro')
+
+    def __init__(self, huella, datos, extension, ancho_px, alto_px):
+        self.huella = huella
+        self.datos = datos
+        self.extension = extension
+        self.ancho_px = ancho_px
+        self.alto_px = alto_px
+        self._miembro = None
+
+    def __str__(self):
+        # Es lo que entra en la clave del caché de diplomas: cambia si cambia la imagen
+        return f'imagen:{self.huella}'
+
+    __repr__ = __str__
+
+    def __getstate__(self):
+        return self.huella, self.datos, self.extension, self.ancho_px, self.alto_px
+
+    def __setstate__(self, estado):
+        self.huella, self.datos, self.extension, self.ancho_px, self.alto_px = estado
+        self._miembro = None
+
+    @property
+    def nombre(self):
+        """Nombre de la parte del paquete: el mismo contenido usa siempre la misma"""
+        return f'diploma_{self.huella[:16]}.{self.extension}'
+
+    @property
+    def tipo_contenido(self):
+        return 'image/png' if self.extension == 'png' else 'image/jpeg'
+
+    def tamano(self, ancho):
+        """(ancho, alto) en EMU para ese ancho, conservando la proporción"""
+        return ancho, round(ancho * self.alto_px / self.ancho_px)
+
+    def miembro(self, ruta):
+        """Miembro del ZIP con la imagen, sin comprimir (PNG y JPEG ya vienen comprimidos).
+
+        Se arma una vez: cada diploma que usa la imagen copia los mismos bytes.
+        """
+        if self._miembro is None or self._miembro.nombre != ruta:
+            self._miembro = MiembroZip(ruta, _FECHA_MEDIOS, zipfile.ZIP_STORED, zlib.crc32(self.datos),
+                                       self.datos, len(self.datos))
+        return self._miembro
+
+
+def _codificar(imagen, formato, **opciones):
+    salida = io.BytesIO()
+    imagen.save(salida, formato, **opciones)
+    return salida.getvalue()
+
+
+def preparar_foto(contenido, huella, lado_maximo=LADO_MAXIMO):
+    """Imagen de una foto: se gira según su EXIF y se reduce si supera lado_maximo.
+
+    Un PNG o JPEG que ya tiene el tamaño y la orientación correctos se usa tal
+    cual, sin decodificarlo ni volver a comprimirlo.
+    """
+    Image, ImageOps = _pillow()
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        formato = imagen.format
+        orientacion = imagen.getexif().get(0x0112, 1)
+        if formato in ('PNG', 'JPEG') and orientacion == 1 and max(imagen.size) <= lado_maximo:
+            return Imagen(huella, contenido, 'png' if formato == 'PNG' else 'jpeg', *imagen.size)
+
+        # Un JPEG grande se decodifica directamente a una escala menor
+        imagen.draft('RGB', (lado_maximo, lado_maximo))
+        imagen = ImageOps.exif_transpose(imagen)
+        imagen.thumbnail((lado_maximo, lado_maximo), Image.LANCZOS)
+        # Firmas y logos en PNG (o con transparencia) siguen en PNG; las fotos pasan a JPEG
+        if formato == 'PNG' or imagen.mode in ('RGBA', 'LA') or 'transparency' in imagen.info:
+            datos, extension = _codificar(imagen, 'PNG'), 'png'
+        else:
+            datos, extension = _codificar(imagen.convert('RGB'), 'JPEG', quality=88), 'jpeg'
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise ImagenNoDisponible(f'La imagen no se puede leer: {e}')
+    return Imagen(huella, datos, extension, *imagen.size)
+
+
+def preparar_qr(texto, huella):
+    """Imagen PNG del código QR con el texto"""
+    segno = _segno()
+    codigo = segno.make(texto, error='m', micro=False)
+    salida = io.BytesIO()
+    codigo.save(salida, kind='png', scale=_ESCALA_QR, border=_MARGEN_QR)
+    return Imagen(huella, salida.getvalue(), 'png', *codigo.symbol_size(scale=_ESCALA_QR, border=_MARGEN_QR))
+
+
+class CarpetaImagenes:
+    """Fotos en una carpeta: el valor de la celda es la ruta del archivo dentro de ella"""
+
+    def __init__(self, ruta):
+        self.ruta = os.path.abspath(ruta)
+
+    def leer(self, nombre):
+        ruta = os.path.abspath(os.path.join(self.ruta, nombre))
+        if os.path.commonpath([ruta, self.ruta]) != self.ruta:
+            raise ImagenNoDisponible(f'La imagen está fuera de la carpeta de imágenes: {nombre}')
+        try:
+            with open(ruta, 'rb') as f:
+                return f.read()
+        except OSError:
+            raise ImagenNoDisponible(f'No se encontró la imagen {nombre} en {self.ruta}')
+
+    def cerrar(self):
+        pass
+
+
+class ZipImagenes:
+    """Fotos dentro de un ZIP: se buscan por su ruta en el ZIP o, si no, solo por el nombre del archivo"""
+
+    def __init__(self, ruta):
+        try:
+            self._zip = zipfile.ZipFile(ruta)
+        except zipfile.BadZipFile:
+            raise ImagenNoDisponible('El archivo de imágenes no es un ZIP válido')
+        self._nombres = {}
+        for info in self._zip.infolist():
+            if not info.is_dir():
+                self._nombres.setdefault(info.filename.casefold(), info.filename)
+                self._nombres.setdefault(os.path.basename(info.filename).casefold(), info.filename)
+
+    def leer(self, nombre):
+        clave = nombre.replace('\\', '/').strip('/').casefold()
+        miembro = self._nombres.get(clave) or self._nombres.get(os.path.basename(clave))
+        if miembro is None:
+            raise ImagenNoDisponible(f'No se encontró la imagen {nombre} en el ZIP de imágenes')
+        return self._zip.read(miembro)
+
+    def cerrar(self):
+        self._zip.close()
+
+
+def abrir_imagenes(ruta):
+    """Origen de las fotos: una carpeta o un ZIP"""
+    return CarpetaImagenes(ruta) if os.path.isdir(ruta) else ZipImagenes(ruta)
+
+
+def _datos_uri(valor):
+    """Contenido de una imagen escrita en la celda como data:image/...;base64,..."""
+    cabecera, _, datos = valor.partition(',')
+    if not cabecera.endswith(';base64'):
+        raise ImagenNoDisponible('Las imágenes en la celda deben venir en base64 (data:image/...;base64,...)')
+    try:
+        return base64.b64decode(datos, validate=True)
+    except binascii.Error:
+        raise ImagenNoDisponible('La imagen en base64 de la celda no es válida')
+
+
+class CacheMedios:
+    """Fotos y códigos QR ya preparados, por el hash de su origen, en un LRU limitado a max_bytes.
+
+    Cada imagen distinta (una firma que se repite, el QR de un documento) se
+    decodifica, reduce o genera una sola vez por proceso; después las filas
+    reciben el mismo objeto Imagen y cada diploma copia sus bytes.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, lado_maximo=LADO_MAXIMO):
+        self.max_bytes = max_bytes
+        self.lado_maximo = lado_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._imagenes = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _obtener(self, huella, preparar):
+        with self._lock:
+            imagen = self._imagenes.get(huella)
+            if imagen is not None:
+                self._imagenes.move_to_end(huella)
+                self.aciertos += 1
+                return imagen
+            self.fallos += 1
+
+        imagen = preparar()
+        with self._lock:
+            if huella not in self._imagenes and len(imagen.datos) <= self.max_bytes:
+                self._imagenes[huella] = imagen
+                self._bytes += len(imagen.datos)
+                while self._bytes > self.max_bytes:
+                    _, liberada = self._imagenes.popitem(last=False)
+                    self._bytes -= len(liberada.datos)
+        return imagen
+
+    def qr(self, texto):
+        huella = hashlib.sha256(b'qr\0' + texto.encode('utf-8')).hexdigest()
+        return self._obtener(huella, lambda: preparar_qr(texto, huella))
+
+    def foto(self, valor, origen=None):
+        """Imagen de la celda: un archivo del origen (carpeta o ZIP) o una imagen en base64 (data:)"""
+        if valor.startswith('data:'):
+            contenido = _datos_uri(valor)
+        elif origen is None:
+            raise ImagenNoDisponible(f'No se enviaron imágenes para buscar {valor}')
+        else:
+            contenido = origen.leer(valor)
+        huella = hashlib.sha256(contenido).hexdigest()
+        return self._obtener(huella, lambda: preparar_foto(contenido, huella, self.lado_maximo))
+
+    def comprobar(self, imagenes):
+        """Falla enseguida si falta la librería que necesitan los placeholders de la plantilla"""
+        tipos = {placeholder.tipo for placeholder in imagenes.values()}
+        if 'IMG' in tipos:
+            _pillow()
+        if 'QR' in tipos:
+            _segno()
+
+    def _imagen(self, tipo, valor, origen):
+        if tipo == 'QR':
+            return self.qr(valor)
+        return self.foto(valor, origen)
+
+    def preparar(self, filas, imagenes, origen=None, hilos=2, adelanto=64, al_fallar=None):
+        """Deja pasar las filas (nombre, valores) con sus imágenes ya preparadas en valores[CLAVE_IMAGENES].
+
+        Las imágenes se preparan en hilos aparte mientras se generan los
+        diplomas; decodificar y reducir con Pillow libera el GIL, así que no
+        frena el render. Cada fila sale en cuanto sus imágenes están listas y
+        se leen filas por delante mientras no lo estén, hasta adelanto. Con
+        al_fallar, una fila sin su imagen no corta la generación: se llama
+        al_fallar(nombre, valores, error) y la fila se salta.
+        """
+        if not imagenes:
+            yield from filas
+            return
+        self.comprobar(imagenes)
+        # Imágenes de las filas en espera por valor de celda: [futuro, filas que la usan]. Una firma repetida
+        # en filas cercanas se prepara una vez; las repeticiones más lejanas salen del LRU. Solo se usa
+        # desde este hilo; los del pool reciben el valor ya resuelto
+        vistas = {}
+        pendientes = collections.deque()
+        pool = ThreadPoolExecutor(max_workers=max(hilos, 1), thread_name_prefix='imagenes')
+
+        def enviar(valores):
+            claves = {}
+            for placeholder in imagenes.values():
+                valor = valores.get(placeholder.columna)
+                if valor is None or not valor.strip():
+                    continue
+                clave = (placeholder.tipo, valor.strip())
+                if clave not in vistas:
+                    vistas[clave] = [pool.submit(self._imagen, *clave, origen), 0]
+                vistas[clave][1] += 1
+                claves[placeholder.nombre] = clave
+            return claves
+
+        def lista():
+            return all(vistas[clave][0].done() for clave in pendientes[0][2].values())
+
+        def siguiente():
+            nombre, valores, claves = pendientes.popleft()
+            try:
+                preparadas = {placeholder: vistas[clave][0].result() for placeholder, clave in claves.items()}
+            except ImagenNoDisponible as e:
+                error = ImagenNoDisponible(f'{nombre}: {e}')
+                if al_fallar is None:
+                    raise error from None
+                al_fallar(nombre, valores, error)
+                return None
+            finally:
+                for clave in claves.values():
+                    vistas[clave][1] -= 1
+                    if not vistas[clave][1]:
+                        del vistas[clave]
+            return nombre, {**valores, CLAVE_IMAGENES: preparadas}
+
+        try:
+            for nombre, valores in filas:
+                pendientes.append((nombre, valores, enviar(valores)))
+                while pendientes and (lista() or len(pendientes) >= adelanto):
+                    fila = siguiente()
+                    if fila is not None:
+                        yield fila
+            while pendientes:
+                fila = siguiente()
+                if fila is not None:
+                    yield fila
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'imagenes': len(self._imagenes),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+            }
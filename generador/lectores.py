@@ -0,0 +1,418 @@
+import collections
+import csv
+import io
+import json
+import os
+import queue
+import threading
+
+import pandas as pd
+
+from .excel import (FILAS_POR_BLOQUE, HojaExcel, _encabezados, bloques_de_filas, buscar_encabezados,
+                    filas_de_bloques, normalizar_bloque)
+
+# Bytes que se miran al principio del CSV para decidir la codificación y el separador
+_MUESTRA_CSV = 64 * 1024
+_SEPARADORES_CSV = ',;\t|'
+
+# Bytes que se leen a la vez de un flujo NDJSON
+_TROZO_NDJSON = 16 * 1024
+# Filas NDJSON ya decodificadas que esperan su bloque; con la cola llena se deja de leer el flujo
+FILAS_EN_ESPERA = 1000
+
+
+class FormatoNoSoportado(ValueError):
+    """El archivo de datos no tiene un formato conocido o falta la librería para leerlo"""
+
+
+class FilaInvalida(FormatoNoSoportado):
+    """Una línea NDJSON no es un objeto JSON con valores simples de las columnas conocidas"""
+
+    def __init__(self, linea, mensaje):
+        super().__init__(f'Línea {linea}: {mensaje}')
+        self.linea = linea
+        self.mensaje = mensaje
+
+
+def _pyarrow(formato):
+    try:
+        import pyarrow
+    except ImportError:
+        raise FormatoNoSoportado(f'Para leer archivos {formato} hace falta instalar pyarrow')
+    return pyarrow
+
+
+class HojaCSV:
+    """CSV leído por bloques con el módulo csv, con la misma normalización que HojaExcel.
+
+    Cada celda llega como texto (igual que una celda de texto en Excel). La
+    codificación (UTF-8, con o sin BOM, o Windows-1252) se decide con el
+    principio del archivo, y el separador (coma, punto y coma, tabulador o
+    barra) con la línea de los encabezados.
+    """
+
+    def __init__(self, ruta):
+        with open(ruta, 'rb') as f:
+            muestra = f.read(_MUESTRA_CSV)
+        try:
+            # La muestra puede cortar un carácter de varios bytes al final
+            texto = muestra.decode('utf-8-sig', errors='strict' if len(muestra) < _MUESTRA_CSV else 'ignore')
+            codificacion = 'utf-8-sig'
+        except UnicodeDecodeError:
+            texto = muestra.decode('cp1252', errors='replace')
+            codificacion = 'cp1252'
+        # El separador es el que más aparece en la primera línea con datos (la de los encabezados)
+        primera = next((linea for linea in texto.splitlines() if linea.strip(_SEPARADORES_CSV + ' ')), '')
+        separador = max(_SEPARADORES_CSV, key=primera.count)
+        if not primera.count(separador):
+            separador = ','
+
+        self._archivo = open(ruta, newline='', encoding=codificacion, errors='replace')
+        self._filas = csv.reader(self._archivo, delimiter=separador)
+        self.columnas, filas_leidas = buscar_encabezados(self._filas)
+
+        # Líneas del archivo; los saltos de línea dentro de comillas cuentan de más
+        if not self.columnas:
+            self.total_estimado = 0
+        else:
+            lineas = ultimo = 0
+            with open(ruta, 'rb') as f:
+                for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                    lineas += bloque.count(b'\n')
+                    ultimo = bloque[-1]
+            if ultimo != ord('\n'):
+                lineas += 1
+            self.total_estimado = max(lineas - filas_leidas, 0)
+
+    def filas(self):
+        """Genera (nombre del archivo, valores) de cada fila con datos"""
+        return filas_de_bloques(bloques_de_filas(self._filas, self.columnas), self.columnas)
+
+    def cerrar(self):
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class _HojaColumnar:
+    """Base de los formatos por columnas (Parquet, Arrow): cada lote de registros pasa a un bloque crudo.
+
+    lotes es una función sin argumentos que devuelve los lotes (RecordBatch) del archivo.
+    """
+
+    def __init__(self, nombres, total, lotes):
+        self.columnas = _encabezados(nombres)
+        self.total_estimado = total if self.columnas else 0
+        self._lotes = lotes
+
+    def _bloques(self):
+        for lote in self._lotes():
+            for inicio in range(0, lote.num_rows, FILAS_POR_BLOQUE):
+                parte = lote.slice(inicio, FILAS_POR_BLOQUE)
+                # dtype object deja enteros y flotantes de Python, como las celdas de openpyxl
+                yield pd.DataFrame({
+                    columna: parte.column(i).to_pandas().astype(object)
+                    for i, columna in enumerate(self.columnas)
+                })
+
+    def filas(self):
+        """Genera (nombre del archivo, valores) de cada fila con datos"""
+        if not self.columnas:
+            return iter(())
+        return filas_de_bloques(self._bloques(), self.columnas)
+
+    def cerrar(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class HojaParquet(_HojaColumnar):
+    """Parquet leído por grupos de filas con pyarrow (mapeado en memoria), sin cargarlo completo"""
+
+    def __init__(self, ruta):
+        pyarrow = _pyarrow('Parquet')
+        import pyarrow.parquet
+
+        try:
+            self._archivo = pyarrow.parquet.ParquetFile(ruta, memory_map=True)
+        except pyarrow.ArrowException as e:
+            raise FormatoNoSoportado(f'El archivo Parquet no es válido: {e}')
+        super().__init__(self._archivo.schema_arrow.names, self._archivo.metadata.num_rows,
+                         lambda: self._archivo.iter_batches(batch_size=FILAS_POR_BLOQUE))
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+class HojaArrow(_HojaColumnar):
+    """Arrow IPC (archivo .arrow/.feather o stream) mapeado en memoria con pyarrow"""
+
+    def __init__(self, ruta):
+        pyarrow = _pyarrow('Arrow')
+        import pyarrow.ipc
+
+        self._mapa = pyarrow.memory_map(ruta)
+        try:
+            try:
+                self._lector = pyarrow.ipc.open_file(self._mapa)
+                self._lotes_archivo = [self._lector.get_batch(i) for i in range(self._lector.num_record_batches)]
+                total = sum(lote.num_rows for lote in self._lotes_archivo)
+            except pyarrow.ArrowInvalid:
+                # No es el formato de archivo: se intenta como stream, que no permite contar las filas
+                self._mapa.seek(0)
+                self._lector = pyarrow.ipc.open_stream(self._mapa)
+                self._lotes_archivo = None
+                total = None
+        except pyarrow.ArrowException as e:
+            self._mapa.close()
+            raise FormatoNoSoportado(f'El archivo Arrow no es válido: {e}')
+        # Los lotes del formato de archivo son vistas sobre el mapa en memoria: no copian datos
+        super().__init__(self._lector.schema.names, total,
+                         lambda: iter(self._lotes_archivo) if self._lotes_archivo is not None else iter(self._lector))
+
+    def cerrar(self):
+        self._mapa.close()
+
+
+def _constante_json(nombre):
+    raise ValueError(f'{nombre} no es un número válido')
+
+
+class _FilaRecibida:
+    """Línea NDJSON ya leída: su número, dónde empieza en el flujo y su error (None si llegó a generarse)"""
+
+    __slots__ = ('linea', 'desplazamiento', 'error', 'valores')
+
+    def __init__(self, linea, desplazamiento, error=None):
+        self.linea = linea
+        self.desplazamiento = desplazamiento
+        self.error = error
+        self.valores = None
+
+
+class HojaNDJSON:
+    """Filas NDJSON (un objeto JSON por línea) de un archivo o de un flujo, como el cuerpo de una solicitud
+
+    Un hilo lee (de a _TROZO_NDJSON bytes) y decodifica las líneas mientras
+    se generan los diplomas, y cada bloque que se normaliza junta todas las
+    filas que ya llegaron (hasta FILAS_POR_BLOQUE): si llegan rápido, los
+    bloques son grandes y se aprovecha la vectorización de normalizar_bloque;
+    si llegan de a poco, pasan a generarse apenas se leen, sin esperar a las
+    siguientes. Las columnas son las claves del primer objeto, salvo que se
+    indiquen.
+
+    Con estricta, una línea inválida lanza FilaInvalida al llegar a ella. Si
+    no, la fila se salta y resultados() la informa en su lugar, junto a los
+    diplomas de las demás.
+    """
+
+    def __init__(self, origen, columnas=None, estricta=True):
+        if isinstance(origen, (str, os.PathLike)):
+            origen = open(origen, 'rb')
+            self._propio = origen
+        else:
+            self._propio = None
+        if isinstance(origen, io.RawIOBase):
+            origen = io.BufferedReader(origen, _TROZO_NDJSON)
+        self._estricta = estricta
+        self._lineas = self._leer_lineas(origen)
+        self._cola = queue.Queue(FILAS_EN_ESPERA)
+        self._cerrada = threading.Event()
+        self._recibidas = collections.deque()
+        self._numero = 0
+        self.total_estimado = None
+
+        # Sin columnas indicadas, la primera línea con datos las define (y se decodifica aquí, antes de empezar)
+        self._indicar_columnas(columnas or [])
+        if not columnas:
+            for linea, desplazamiento, texto in self._lineas:
+                objeto, error = self._objeto(texto)
+                if error is None:
+                    self._indicar_columnas(objeto)
+                    fila, error = self._fila(objeto)
+                if error is not None:
+                    self.cerrar()
+                    raise FilaInvalida(linea, error)
+                self._cola.put((linea, desplazamiento, fila, None))
+                break
+
+        self._lector = threading.Thread(target=self._leer, name='lector_ndjson', daemon=True)
+        self._lector.start()
+
+    def _indicar_columnas(self, nombres):
+        self.columnas = _encabezados(nombres)
+        self._indices = {columna: i for i, columna in enumerate(self.columnas)}
+
+    @staticmethod
+    def _leer_lineas(origen):
+        """(número, desplazamiento en bytes, texto) de cada línea que no está en blanco"""
+        desplazamiento = 0
+        for numero, linea in enumerate(origen, start=1):
+            if linea.strip():
+                yield numero, desplazamiento, linea
+            desplazamiento += len(linea)
+
+    @staticmethod
+    def _objeto(texto):
+        try:
+            objeto = json.loads(texto, parse_constant=_constante_json)
+        except ValueError as e:
+            return None, f'JSON no válido: {e}'
+        if not isinstance(objeto, dict):
+            return None, 'cada línea debe ser un objeto JSON'
+        return objeto, None
+
+    def _fila(self, objeto):
+        """(celdas en el orden de las columnas, None) o (None, error) de un objeto decodificado"""
+        fila = [None] * len(self.columnas)
+        for clave, valor in objeto.items():
+            indice = self._indices.get(clave.upper())
+            if indice is None:
+                return None, f'columna desconocida: {clave}'
+            if isinstance(valor, (dict, list)):
+                return None, f'{clave}: solo se admiten textos, números, true, false o null'
+            fila[indice] = valor
+        if all(valor is None or valor == '' for valor in fila):
+            return None, 'la fila no tiene datos'
+        return fila, None
+
+    def _leer(self):
+        """Hilo lector: pasa a la cola cada línea decodificada y al final el fin del flujo (o su error)"""
+        try:
+            for linea, desplazamiento, texto in self._lineas:
+                objeto, error = self._objeto(texto)
+                fila, error = (None, error) if error is not None else self._fila(objeto)
+                if not self._poner((linea, desplazamiento, fila, error)):
+                    return
+            fin = None
+        except Exception as e:
+            fin = e
+        self._poner(fin)
+
+    def _poner(self, elemento):
+        # Con la cola llena se espera a que se generen filas, salvo que la hoja ya se haya cerrado
+        while not self._cerrada.is_set():
+            try:
+                self._cola.put(elemento, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _bloques(self):
+        """Listas de líneas decodificadas: la primera espera a que llegue alguna, el resto ya estaba en la cola"""
+        while True:
+            bloque = [self._cola.get()]
+            while bloque[-1] is not None and not isinstance(bloque[-1], Exception) and \
+                    len(bloque) < FILAS_POR_BLOQUE:
+                try:
+                    bloque.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            fin = bloque.pop() if bloque[-1] is None or isinstance(bloque[-1], Exception) else False
+            if bloque:
+                yield bloque
+            if fin is None:
+                return
+            if fin is not False:
+                raise fin
+
+    def filas(self):
+        """Genera (nombre del archivo, valores) de cada fila con datos, a medida que llegan"""
+        if not self.columnas:
+            return
+        for bloque in self._bloques():
+            if self._estricta:
+                invalida = next((elemento for elemento in bloque if elemento[3] is not None), None)
+                if invalida is not None:
+                    bloque = bloque[:bloque.index(invalida)]
+            validas = [fila for _, _, fila, error in bloque if error is None]
+            if validas:
+                nombres, valores = normalizar_bloque(pd.DataFrame(validas, columns=self.columnas, dtype=object),
+                                                     inicio=self._numero)
+                self._numero += len(nombres)
+                filas = zip(nombres, [dict(zip(self.columnas, fila)) for fila in zip(*valores)])
+            for linea, desplazamiento, _, error in bloque:
+                recibida = _FilaRecibida(linea, desplazamiento, error)
+                if not self._estricta:
+                    self._recibidas.append(recibida)
+                if error is None:
+                    nombre, recibida.valores = next(filas)
+                    yield nombre, recibida.valores
+            if self._estricta and invalida is not None:
+                raise FilaInvalida(invalida[0], invalida[3])
+
+    def fallo(self, nombre, valores, error):
+        """Marca con su error una fila que ya salió de filas() pero no llegó a generarse (sin estricta)"""
+        for recibida in self._recibidas:
+            if recibida.valores is valores:
+                recibida.error = str(error)
+                return
+
+    def resultados(self, diplomas):
+        """Une los diplomas generados (nombre, contenido) de filas() con las filas que fallaron.
+
+        Genera (estado, contenido) de cada línea en el orden del flujo: estado
+        es un dict con la línea, su desplazamiento en bytes y el nombre del
+        diploma (contenido son sus bytes) o el error (contenido es None).
+        Requiere que los diplomas salgan en el mismo orden que las filas.
+        """
+        def con_error(recibida):
+            return {'linea': recibida.linea, 'desplazamiento': recibida.desplazamiento, 'estado': 'error',
+                    'error': recibida.error}, None
+
+        for nombre, contenido in diplomas:
+            while self._recibidas[0].error is not None:
+                yield con_error(self._recibidas.popleft())
+            recibida = self._recibidas.popleft()
+            yield {'linea': recibida.linea, 'desplazamiento': recibida.desplazamiento, 'estado': 'ok',
+                   'nombre': nombre}, contenido
+        while self._recibidas:
+            yield con_error(self._recibidas.popleft())
+
+    def cerrar(self):
+        self._cerrada.set()
+        if self._propio is not None:
+            self._propio.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+# Lector de cada extensión de archivo de datos
+LECTORES = {
+    'xlsx': HojaExcel,
+    'xls': HojaExcel,
+    'csv': HojaCSV,
+    'txt': HojaCSV,
+    'parquet': HojaParquet,
+    'arrow': HojaArrow,
+    'feather': HojaArrow,
+    'ipc': HojaArrow,
+    'ndjson': HojaNDJSON,
+    'jsonl': HojaNDJSON,
+}
+
+EXTENSIONES_DATOS = set(LECTORES)
+
+
+def abrir_hoja(ruta):
+    """Abre el archivo de datos con el lector de su extensión (Excel, CSV, Parquet, Arrow o NDJSON)"""
+    extension = os.path.splitext(ruta)[1].lower().lstrip('.')
+    lector = LECTORES.get(extension)
+    if lector is None:
+        raise FormatoNoSoportado(f'Formato de datos no soportado: .{extension}. '
+                                 f'Usa uno de: {", ".join(sorted(EXTENSIONES_DATOS))}')
+    return lector(ruta)
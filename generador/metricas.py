@@ -0,0 +1,201 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# Límites (segundos) de los histogramas de latencia
+LIMITES_SEGUNDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Etapas del pipeline, en el orden en que ocurren
+ETAPAS = (
+    'guardar_subida',
+    'plantilla',
+    'leer_excel',
+    'agrupar_filas',
+    'preparar_imagenes',
+    'cache_diplomas',
+    'renderizar',
+    'convertir_pdf',
+    'documento_unico',
+    'empaquetar',
+    'guardar_archivos',
+)
+
+# Descripción (HELP) y tipo de cada métrica exportada
+DESCRIPCIONES = {
+    'diplomas_filas_generadas_total': ('counter', 'Filas del Excel convertidas en diplomas (sin contar las del caché de filas)'),
+    'diplomas_filas_en_cache_total': ('counter', 'Diplomas tomados del caché de filas sin volver a generarlos'),
+    'diplomas_placeholders_reemplazados_total': ('counter', 'Placeholders reemplazados en los diplomas generados'),
+    'diplomas_bytes_escritos_total': ('counter', 'Bytes entregados (ZIP, .docx o PDF)'),
+    'diplomas_fallos_total': ('counter', 'Generaciones que terminaron con error'),
+    'diplomas_generaciones_total': ('counter', 'Generaciones terminadas, con o sin error'),
+    'diplomas_etapa_segundos': ('histogram', 'Tiempo propio de cada etapa en una generación'),
+    'diplomas_generacion_segundos': ('histogram', 'Duración total de cada generación'),
+}
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+def _formatear_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ''
+    texto = ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for k, v in pares)
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class RegistroEtapas:
+    """Tiempos y contadores de una sola generación (una solicitud, un trabajo o una ejecución del CLI).
+
+    Cada etapa acumula solo su tiempo propio: si una etapa consume otra (el
+    ZIP pide diplomas, que piden filas del Excel), el tiempo de la interna se
+    descuenta de la externa. Se usa desde un solo hilo.
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.contadores = {}
+        self._pila = []
+
+    @contextlib.contextmanager
+    def etapa(self, nombre):
+        inicio = time.perf_counter()
+        self._pila.append(0.0)
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - inicio
+            internas = self._pila.pop()
+            if self._pila:
+                self._pila[-1] += total
+            datos = self.etapas.setdefault(nombre, {'segundos': 0.0, 'llamadas': 0})
+            datos['segundos'] += total - internas
+            datos['llamadas'] += 1
+
+    def iterar(self, nombre, iterable, por_elemento=None):
+        """Deja pasar los elementos de iterable y cuenta en la etapa el tiempo de producir cada uno.
+
+        por_elemento es un dict {contador: valor} que se suma por cada elemento.
+        """
+        iterador = iter(iterable)
+        while True:
+            with self.etapa(nombre):
+                try:
+                    elemento = next(iterador)
+                except StopIteration:
+                    return
+            if por_elemento:
+                for contador, valor in por_elemento.items():
+                    self.contar(contador, valor)
+            yield elemento
+
+    def contar(self, nombre, valor=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + valor
+
+    def resumen(self):
+        """Tiempos por etapa y contadores, listos para JSON"""
+        return {
+            'segundos': round(time.perf_counter() - self.inicio, 4),
+            'etapas': {
+                nombre: {'segundos': round(datos['segundos'], 4), 'llamadas': datos['llamadas']}
+                for nombre, datos in sorted(self.etapas.items(), key=lambda e: _orden_etapa(e[0]))
+            },
+            'contadores': dict(self.contadores),
+        }
+
+
+def _orden_etapa(nombre):
+    return ETAPAS.index(nombre) if nombre in ETAPAS else len(ETAPAS)
+
+
+class Metricas:
+    """Contadores e histogramas acumulados del proceso, exportables en el formato de texto de Prometheus.
+
+    Son de cada proceso: con varios procesos del servidor, Prometheus suma lo
+    que informa cada uno.
+    """
+
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = tuple(limites)
+        self._contadores = {}
+        self._histogramas = {}
+        self._medidores = []
+        self._lock = threading.Lock()
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = {'cubetas': [0] * len(self.limites), 'suma': 0.0,
+                                                          'cuenta': 0}
+            i = bisect.bisect_left(self.limites, valor)
+            if i < len(self.limites):
+                histograma['cubetas'][i] += 1
+            histograma['suma'] += valor
+            histograma['cuenta'] += 1
+
+    def agregar_medidor(self, nombre, tipo, descripcion, funcion):
+        """Valor que se lee al exportar (por ejemplo, estadísticas del caché de plantillas)"""
+        self._medidores.append((nombre, tipo, descripcion, funcion))
+
+    def registrar(self, registro, error=False, **etiquetas):
+        """Suma a las métricas del proceso una generación terminada"""
+        for etapa, datos in registro.etapas.items():
+            self.observar('diplomas_etapa_segundos', datos['segundos'], etapa=etapa, **etiquetas)
+        self.observar('diplomas_generacion_segundos', time.perf_counter() - registro.inicio, **etiquetas)
+        for nombre, valor in registro.contadores.items():
+            self.incrementar(f'diplomas_{nombre}_total', valor, **etiquetas)
+        self.incrementar('diplomas_generaciones_total', **etiquetas)
+        if error:
+            self.incrementar('diplomas_fallos_total', **etiquetas)
+
+    def exportar(self):
+        """Texto para GET /metrics (formato de exposición 0.0.4 de Prometheus)"""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {clave: {'cubetas': list(h['cubetas']), 'suma': h['suma'], 'cuenta': h['cuenta']}
+                           for clave, h in self._histogramas.items()}
+
+        por_nombre = {}
+        for (nombre, etiquetas), valor in contadores.items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+        for (nombre, etiquetas), histograma in histogramas.items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, histograma))
+
+        lineas = []
+        for nombre in sorted(por_nombre):
+            tipo, descripcion = DESCRIPCIONES.get(nombre, ('counter', ''))
+            lineas.append(f'# HELP {nombre} {descripcion}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            for etiquetas, valor in sorted(por_nombre[nombre], key=lambda e: e[0]):
+                if tipo != 'histogram':
+                    lineas.append(f'{nombre}{_formatear_etiquetas(etiquetas)} {_numero(valor)}')
+                    continue
+                acumulado = 0
+                for limite, cuenta in zip(self.limites, valor['cubetas']):
+                    acumulado += cuenta
+                    lineas.append(f'{nombre}_bucket{_formatear_etiquetas(etiquetas, [("le", _numero(float(limite)))])} '
+                                  f'{acumulado}')
+                lineas.append(f'{nombre}_bucket{_formatear_etiquetas(etiquetas, [("le", "+Inf")])} {valor["cuenta"]}')
+                lineas.append(f'{nombre}_sum{_formatear_etiquetas(etiquetas)} {_numero(valor["suma"])}')
+                lineas.append(f'{nombre}_count{_formatear_etiquetas(etiquetas)} {valor["cuenta"]}')
+
+        for nombre, tipo, descripcion, funcion in self._medidores:
+            lineas.append(f'# HELP {nombre} {descripcion}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            lineas.append(f'{nombre} {_numero(funcion())}')
+        return '\n'.join(lineas) + '\n'
@@ -0,0 +1,389 @@
+import io
+import os
+import posixpath
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsmap, qn
+from lxml import etree
+
+from .archivo_zip import MiembroZip, escribir_zip, leer_miembros
+from .imagenes import CLAVE_IMAGENES, placeholder_imagen, placeholders_imagen
+from .reemplazo import PATRON_PLACEHOLDER, sustituir_placeholders
+
+# Marca temporal que separa los segmentos fijos de cada parte XML
+_MARCA = 'diploma-slot'
+_PATRON_MARCA = re.compile(rb'<\?' + _MARCA.encode() + rb' (\d+)\?>')
+
+# Mismos caracteres que lxml rechaza al asignar texto a un elemento
+_CARACTERES_INVALIDOS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+# Párrafos que recorre replace_text: directos del contenedor y de sus tablas
+# (las celdas en continuación de una combinación vertical se omiten, igual que row.cells)
+_XPATH_PARRAFOS = (
+    './w:p'
+    ' | ./w:tbl/w:tr/w:tc[not(w:tcPr/w:vMerge[not(@w:val) or @w:val="continue"])]/w:p'
+)
+
+_SLOT_PARRAFO = 0
+_SLOT_TEXTO = 1
+_SLOT_IMAGENES = 2
+
+_CONTENT_TYPES = '[Content_Types].xml'
+_NS_CONTENT_TYPES = 'http://schemas.openxmlformats.org/package/2006/content-types'
+_PATRON_DOCPR = re.compile(rb'<wp:docPr\s[^>]*?\bid="(\d+)"')
+
+# Imagen en línea, como la que python-docx arma con add_picture (cada prefijo se declara en el mismo dibujo)
+_XML_DIBUJO = (
+    '<w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0" xmlns:wp="{wp}">'
+    '<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{id}" name="Imagen {id}"/>'
+    '<wp:cNvGraphicFramePr><a:graphicFrameLocks xmlns:a="{a}" noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+    '<a:graphic xmlns:a="{a}"><a:graphicData uri="{pic}">'
+    '<pic:pic xmlns:pic="{pic}"><pic:nvPicPr><pic:cNvPr id="0" name="{nombre}"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill><a:blip xmlns:r="{r}" r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+    '</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing>'
+)
+
+
+class PlantillaNoSoportada(Exception):
+    """La plantilla usa algo que la ruta rápida no sabe plantillar"""
+
+
+def _texto_xml(texto):
+    if _CARACTERES_INVALIDOS.search(texto):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+    return escape(texto).replace('\r', '&#13;')
+
+
+def _contenido_run(texto):
+    """XML que python-docx escribe al asignar run.text (w:t, w:tab y w:br)"""
+    partes = []
+    for trozo in re.split(r'([\t\r\n])', texto):
+        if trozo == '\t':
+            partes.append('<w:tab/>')
+        elif trozo in ('\r', '\n'):
+            partes.append('<w:br/>')
+        elif trozo:
+            if len(trozo.strip()) < len(trozo):
+                partes.append('<w:t xml:space="preserve">')
+            else:
+                partes.append('<w:t>')
+            partes.append(_texto_xml(trozo))
+            partes.append('</w:t>')
+    return ''.join(partes)
+
+
+def xml_dibujo(id_dibujo, rid, nombre, cx, cy):
+    """w:drawing de una imagen en línea de cx por cy EMU, con la imagen de la relación rid"""
+    return _XML_DIBUJO.format(wp=nsmap['wp'], a=nsmap['a'], pic=nsmap['pic'], r=nsmap['r'],
+                              id=id_dibujo, rid=rid, nombre=escape(nombre, {'"': '&quot;'}), cx=cx, cy=cy)
+
+
+def contenido_con_imagenes(texto, valores, dibujar):
+    """Contenido del run de un párrafo con placeholders de imagen: el texto sustituido y cada imagen en su lugar.
+
+    dibujar(imagen, ancho) devuelve el w:drawing de una imagen. Un placeholder
+    de imagen cuya columna está vacía en la fila desaparece, igual que uno de texto.
+    """
+    imagenes = valores.get(CLAVE_IMAGENES, {})
+    partes = []
+    trozos = PATRON_PLACEHOLDER.split(texto)
+    pendiente = [trozos[0]]
+    # split deja [texto, nombre, texto, nombre, ..., texto]
+    for nombre, siguiente in zip(trozos[1::2], trozos[2::2]):
+        placeholder = placeholder_imagen(nombre)
+        if placeholder is None or placeholder.columna not in valores:
+            pendiente.append('{' + nombre + '}')
+        else:
+            partes.append(_contenido_run(sustituir_placeholders(''.join(pendiente), valores)))
+            pendiente = []
+            imagen = imagenes.get(nombre)
+            if imagen is not None:
+                partes.append(dibujar(imagen, placeholder.ancho))
+        pendiente.append(siguiente)
+    partes.append(_contenido_run(sustituir_placeholders(''.join(pendiente), valores)))
+    return ''.join(partes)
+
+
+def _plantillable(nombres, columnas):
+    """Algún placeholder es una columna de la fila, o una imagen de una columna"""
+    return not columnas.isdisjoint(nombres) or bool(placeholders_imagen(nombres, columnas))
+
+
+def _ruta_rels(parte):
+    carpeta, nombre = posixpath.split(parte)
+    return posixpath.join(carpeta, '_rels', nombre + '.rels')
+
+
+def _relaciones(zf, parte):
+    """Relaciones (tipo, ruta) de una parte del paquete"""
+    carpeta = posixpath.dirname(parte)
+    try:
+        rels = etree.fromstring(zf.read(_ruta_rels(parte)))
+    except KeyError:
+        return []
+    relaciones = []
+    for rel in rels:
+        if rel.get('TargetMode') == 'External':
+            continue
+        destino = rel.get('Target')
+        if destino.startswith('/'):
+            ruta = destino.lstrip('/')
+        else:
+            ruta = posixpath.normpath(posixpath.join(carpeta, destino))
+        relaciones.append((rel.get('Type'), ruta))
+    return relaciones
+
+
+def id_relacion(imagen):
+    """r:id de una imagen por fila: el mismo en todas las partes que la usan"""
+    return f'rIdDiploma{imagen.huella[:16]}'
+
+
+def _xml_relacion(imagen, destino):
+    return (f'<Relationship Id="{id_relacion(imagen)}" Type="{RT.IMAGE}" '
+            f'Target="{escape(destino, {chr(34): "&quot;"})}"/>').encode('utf-8')
+
+
+def _rels_con(rels, relaciones):
+    """Contenido de un .rels con las relaciones agregadas (rels None: la parte no tenía)"""
+    if rels is None:
+        rels = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"></Relationships>')
+    cierre = rels.rindex(b'</Relationships>')
+    return rels[:cierre] + b''.join(relaciones) + rels[cierre:]
+
+
+class _Dibujos:
+    """Imágenes que usa un diploma, por parte, con un id nuevo para cada dibujo"""
+
+    def __init__(self, primer_id):
+        self.siguiente_id = primer_id
+        self.por_parte = {}
+
+    def para(self, parte):
+        """Función dibujar (ver contenido_con_imagenes) para las imágenes de una parte"""
+        def dibujar(imagen, ancho):
+            self.por_parte.setdefault(parte, {})[imagen.huella] = imagen
+            id_dibujo, self.siguiente_id = self.siguiente_id, self.siguiente_id + 1
+            return xml_dibujo(id_dibujo, id_relacion(imagen), imagen.nombre, *imagen.tamano(ancho))
+        return dibujar
+
+
+class _ParteSegmentada:
+    """Parte XML partida en segmentos fijos y huecos para los valores de cada fila"""
+
+    def __init__(self, segmentos, slots):
+        self.segmentos = segmentos
+        self.slots = slots
+
+    def renderizar(self, valores, dibujar=None):
+        """Bytes de la parte con los valores de una fila; dibujar arma las imágenes (ver contenido_con_imagenes)"""
+        partes = [self.segmentos[0]]
+        for (tipo, texto), segmento in zip(self.slots, self.segmentos[1:]):
+            if tipo == _SLOT_IMAGENES:
+                partes.append(contenido_con_imagenes(texto, valores, dibujar).encode('utf-8'))
+            elif tipo == _SLOT_PARRAFO:
+                partes.append(_contenido_run(sustituir_placeholders(texto, valores)).encode('utf-8'))
+            else:
+                partes.append(_texto_xml(sustituir_placeholders(texto, valores)).encode('utf-8'))
+            partes.append(segmento)
+        return b''.join(partes)
+
+    @property
+    def imagenes(self):
+        """Nombres de los placeholders de imagen de la parte (con repeticiones)"""
+        return [nombre for tipo, texto in self.slots if tipo == _SLOT_IMAGENES
+                for nombre in PATRON_PLACEHOLDER.findall(texto) if placeholder_imagen(nombre)]
+
+
+def _segmentar(xml, columnas, es_documento):
+    """Normaliza los párrafos con placeholders y parte el XML en segmentos y huecos"""
+    if _MARCA.encode() in xml:
+        raise PlantillaNoSoportada('la plantilla ya contiene marcas de la ruta rápida')
+    raiz = parse_xml(xml)
+    if raiz.nsmap.get('w') != nsmap['w']:
+        raise PlantillaNoSoportada('prefijo w: no estándar')
+
+    contenedor = raiz.find(qn('w:body')) if es_documento else raiz
+    if contenedor is None:
+        raise PlantillaNoSoportada('documento sin w:body')
+
+    slots = []
+
+    def marcar(elemento, tipo, texto):
+        elemento.append(etree.ProcessingInstruction(_MARCA, str(len(slots))))
+        slots.append((tipo, texto))
+
+    # Párrafos: todo el texto queda en el primer run y los demás se vacían, como replace_text_in_paragraph
+    for p in contenedor.xpath(_XPATH_PARRAFOS):
+        runs = p.r_lst
+        texto = ''.join(r.text for r in runs)
+        nombres = PATRON_PLACEHOLDER.findall(texto)
+        if _plantillable(nombres, columnas):
+            for r in runs:
+                r.clear_content()
+            # Las imágenes van en el mismo run que el texto, en el lugar de su placeholder
+            marcar(runs[0], _SLOT_IMAGENES if placeholders_imagen(nombres, columnas) else _SLOT_PARRAFO, texto)
+
+    # Cuadros de texto y formas del cuerpo: reemplazo dentro de cada elemento de texto
+    if es_documento:
+        textos = [
+            t_elem for t_elem in contenedor.iter()
+            if isinstance(t_elem.tag, str) and t_elem.tag.endswith('}t') and t_elem.text
+            and not columnas.isdisjoint(PATRON_PLACEHOLDER.findall(t_elem.text))
+        ]
+        for t_elem in textos:
+            texto = t_elem.text
+            t_elem.text = None
+            marcar(t_elem, _SLOT_TEXTO, texto)
+
+    if not slots:
+        return None
+
+    serializado = etree.tostring(raiz, encoding='UTF-8', standalone=True)
+    trozos = _PATRON_MARCA.split(serializado)
+    # split deja [segmento, índice, segmento, índice, ...]; los índices salen en orden de documento
+    segmentos = trozos[0::2]
+    orden = [int(i) for i in trozos[1::2]]
+    return _ParteSegmentada(segmentos, [slots[i] for i in orden])
+
+
+class PlantillaOOXML:
+    """Ruta rápida: plantilla tratada como ZIP y plantillada a nivel de bytes.
+
+    word/document.xml y los encabezados y pies de página se parten una sola
+    vez en segmentos fijos y huecos para los placeholders, después de unificar
+    los runs igual que replace_text. Cada diploma se escribe copiando tal cual
+    los miembros que no cambian y uniendo los bytes de las partes con
+    placeholders, sin construir el documento de python-docx.
+    """
+
+    def __init__(self, template_path, columnas):
+        self.template_path = template_path
+        self.columnas = columnas = set(columnas)
+
+        with open(template_path, 'rb') as f:
+            contenido = f.read()
+        try:
+            self._miembros = leer_miembros(contenido)
+            zf = zipfile.ZipFile(io.BytesIO(contenido))
+        except zipfile.BadZipFile as e:
+            raise PlantillaNoSoportada(str(e))
+
+        principales = [ruta for tipo, ruta in _relaciones(zf, '') if tipo == RT.OFFICE_DOCUMENT]
+        if len(principales) != 1:
+            raise PlantillaNoSoportada('no se encontró el documento principal')
+        self.documento = documento = principales[0]
+        partes = {documento: True}
+        for tipo, ruta in _relaciones(zf, documento):
+            if tipo in (RT.HEADER, RT.FOOTER):
+                partes[ruta] = False
+
+        self._partes = {}
+        nombres = {miembro.nombre for miembro in self._miembros}
+        ids_dibujos = []
+        for ruta, es_documento in partes.items():
+            if ruta not in nombres:
+                raise PlantillaNoSoportada(f'parte no encontrada: {ruta}')
+            xml = zf.read(ruta)
+            ids_dibujos.extend(int(m.group(1)) for m in _PATRON_DOCPR.finditer(xml))
+            segmentada = _segmentar(xml, columnas, es_documento)
+            if segmentada is not None:
+                self._partes[ruta] = segmentada
+
+        # Imágenes por fila: cada parte que las usa lleva sus relaciones a las imágenes de ese diploma
+        self.imagenes = placeholders_imagen(
+            [nombre for parte in self._partes.values() for nombre in parte.imagenes], columnas)
+        self._rels = {}
+        if self.imagenes:
+            for ruta, parte in self._partes.items():
+                if parte.imagenes:
+                    ruta_rels = _ruta_rels(ruta)
+                    self._rels[ruta] = (ruta_rels, zf.read(ruta_rels) if ruta_rels in nombres else None)
+            self._agregar_tipos_imagen()
+        # Los dibujos nuevos usan id mayores que los de la plantilla
+        self._primer_id = max(ids_dibujos, default=0) + 1
+        self._carpeta_medios = posixpath.join(posixpath.dirname(documento), 'media')
+        zf.close()
+
+        # Placeholders que se reemplazan en cada diploma, para las métricas
+        self.placeholders = sum(
+            sum(1 for columna in PATRON_PLACEHOLDER.findall(texto) if columna in columnas or columna in self.imagenes)
+            for parte in self._partes.values() for _, texto in parte.slots
+        )
+
+        # Memoria aproximada: miembros comprimidos más los segmentos de las partes con placeholders
+        self.tamano = sum(len(miembro.datos) for miembro in self._miembros) + sum(
+            len(segmento) for parte in self._partes.values() for segmento in parte.segmentos)
+
+    def _agregar_tipos_imagen(self):
+        """Declara en [Content_Types].xml las extensiones de las imágenes por fila (png y jpeg)"""
+        for i, miembro in enumerate(self._miembros):
+            if miembro.nombre != _CONTENT_TYPES:
+                continue
+            tipos = etree.fromstring(miembro.contenido())
+            extensiones = {d.get('Extension', '').lower() for d in tipos.iter(f'{{{_NS_CONTENT_TYPES}}}Default')}
+            faltantes = [(e, t) for e, t in (('png', 'image/png'), ('jpeg', 'image/jpeg')) if e not in extensiones]
+            for extension, tipo in reversed(faltantes):
+                tipos.insert(0, etree.Element(f'{{{_NS_CONTENT_TYPES}}}Default',
+                                              {'Extension': extension, 'ContentType': tipo}))
+            if faltantes:
+                self._miembros[i] = miembro.reemplazar(etree.tostring(tipos, encoding='UTF-8', standalone=True))
+            return
+        raise PlantillaNoSoportada('falta [Content_Types].xml')
+
+    def ruta_imagen(self, imagen):
+        """Ruta en el paquete de una imagen por fila"""
+        return posixpath.join(self._carpeta_medios, imagen.nombre)
+
+    def _miembros_imagenes(self, miembros, dibujos):
+        """Agrega las relaciones de cada parte con sus imágenes y una sola copia de cada imagen"""
+        nuevos = {}
+        medios = {}
+        for ruta, imagenes in dibujos.por_parte.items():
+            ruta_rels, rels = self._rels[ruta]
+            carpeta = posixpath.dirname(ruta)
+            relaciones = []
+            for imagen in imagenes.values():
+                ruta_imagen = self.ruta_imagen(imagen)
+                medios[ruta_imagen] = imagen
+                relaciones.append(_xml_relacion(imagen, posixpath.relpath(ruta_imagen, carpeta)))
+            nuevos[ruta_rels] = _rels_con(rels, relaciones)
+
+        fecha = self._miembros[0].date_time
+        resultado = []
+        for miembro in miembros:
+            if miembro.nombre in nuevos:
+                miembro = miembro.reemplazar(nuevos.pop(miembro.nombre))
+            resultado.append(miembro)
+        # Partes que no tenían relaciones propias
+        for ruta_rels, contenido in nuevos.items():
+            resultado.append(MiembroZip.comprimir(ruta_rels, contenido, fecha))
+        resultado.extend(imagen.miembro(ruta) for ruta, imagen in medios.items())
+        return resultado
+
+    def renderizar(self, valores, destino):
+        """Genera un diploma con los valores de una fila y lo guarda en destino (ruta o stream).
+
+        Las imágenes de la fila salen de valores[CLAVE_IMAGENES] (ver CacheMedios.preparar).
+        """
+        dibujos = _Dibujos(self._primer_id) if self.imagenes else None
+        miembros = [
+            miembro.reemplazar(self._partes[miembro.nombre].renderizar(
+                valores, dibujos.para(miembro.nombre) if dibujos else None))
+            if miembro.nombre in self._partes else miembro
+            for miembro in self._miembros
+        ]
+        if dibujos is not None and dibujos.por_parte:
+            miembros = self._miembros_imagenes(miembros, dibujos)
+        if isinstance(destino, (str, os.PathLike)):
+            with open(destino, 'wb') as salida:
+                escribir_zip(salida, miembros)
+        else:
+            escribir_zip(destino, miembros)
@@ -0,0 +1,81 @@
+import collections
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Filas que cada worker genera por tarea
+TAMANO_LOTE = 32
+
+# Los workers no se crean con fork: el proceso que genera ya tiene otros hilos (solicitudes, trabajos, pools de
+# LibreOffice e imágenes) y un fork mientras alguno tiene un lock tomado puede dejar al hijo bloqueado. La
+# plantilla llega serializada (PlantillaCompilada se recompila desde su ruta con __reduce__)
+_INICIO_WORKERS = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Plantilla compilada de cada proceso del pool (se recibe una sola vez al arrancar)
+_plantilla_worker = None
+
+
+def _inicializar_worker(plantilla):
+    global _plantilla_worker
+    _plantilla_worker = plantilla
+
+
+def _renderizar(plantilla, valores):
+    salida = io.BytesIO()
+    plantilla.renderizar(valores, salida)
+    return salida.getvalue()
+
+
+def _renderizar_lote(lote):
+    return [_renderizar(_plantilla_worker, valores) for valores in lote]
+
+
+def _lotes(filas, tamano):
+    lote = []
+    for valores in filas:
+        lote.append(valores)
+        if len(lote) == tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def renderizar_filas(plantilla, filas, workers=1, tamano_lote=TAMANO_LOTE):
+    """Genera los diplomas de las filas y devuelve el .docx (bytes) de cada una en el mismo orden.
+
+    Con workers > 1 las filas se reparten por lotes en un pool de procesos; cada
+    worker recibe la plantilla compilada una vez. Solo se mantienen en vuelo
+    2 lotes por worker, así que la memoria no crece con el tamaño del Excel.
+    """
+    if workers <= 1:
+        for valores in filas:
+            yield _renderizar(plantilla, valores)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(_INICIO_WORKERS),
+                               initializer=_inicializar_worker, initargs=(plantilla,))
+    pendientes = collections.deque()
+    try:
+        for lote in _lotes(filas, tamano_lote):
+            pendientes.append(pool.submit(_renderizar_lote, lote))
+            if len(pendientes) >= workers * 2:
+                yield from pendientes.popleft().result()
+        while pendientes:
+            yield from pendientes.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def renderizar_diplomas(plantilla, filas, workers=1, tamano_lote=TAMANO_LOTE):
+    """Como renderizar_filas, pero con filas (nombre, valores) y devolviendo (nombre, .docx)"""
+    # Cada nombre se guarda al entregar su fila; los diplomas vuelven en ese mismo orden
+    nombres = collections.deque()
+
+    def valores_filas():
+        for nombre, valores in filas:
+            nombres.append(nombre)
+            yield valores
+
+    for contenido in renderizar_filas(plantilla, valores_filas(), workers=workers, tamano_lote=tamano_lote):
+        yield nombres.popleft(), contenido
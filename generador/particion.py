@@ -0,0 +1,196 @@
+import glob
+import hashlib
+import json
+import os
+import re
+
+from .archivo_zip import generar_archivo, nombre_unico
+
+# Manifiesto que cada parte escribe en su carpeta al terminar (su presencia indica que la parte está completa)
+MANIFIESTO_PARTE = 'parte.json'
+
+_PATRON_PARTE = re.compile(r'^(\d+)/(\d+)$')
+
+
+class ParticionIncompleta(Exception):
+    """Las partes a combinar no cubren todas las filas exactamente una vez"""
+
+    def __init__(self, problemas):
+        super().__init__('; '.join(problemas))
+        self.problemas = problemas
+
+
+def clave_fila(valores):
+    """Clave estable de una fila: el SHA-256 de sus valores, sin depender de su posición en la hoja"""
+    texto = json.dumps(valores, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+class Particion:
+    """Parte i de n (1 <= i <= n) de las filas, para generarlas en n máquinas independientes.
+
+    Cada fila va a la parte que indica su clave estable, así que todas las
+    máquinas (que leen la hoja completa) asignan las mismas filas a la misma
+    parte sin coordinarse. Los diplomas de la parte quedan en su carpeta con
+    el número de fila delante del nombre, y al terminar se escribe el
+    manifiesto que combinar_partes usa para verificar y unir las partes.
+    """
+
+    def __init__(self, indice, total):
+        if not 1 <= indice <= total:
+            raise ValueError(f'La parte debe estar entre 1 y {total}: {indice}')
+        self.indice = indice
+        self.total = total
+        self.filas = []
+        self.leidas = 0
+        self._huella = hashlib.sha256()
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """Particion a partir de 'i/n'"""
+        coincidencia = _PATRON_PARTE.match(texto.strip())
+        if coincidencia is None:
+            raise ValueError(f"La parte se indica como i/n, por ejemplo 2/8: {texto}")
+        return cls(int(coincidencia.group(1)), int(coincidencia.group(2)))
+
+    @property
+    def nombre(self):
+        return f'parte_{self.indice}_de_{self.total}'
+
+    def contiene(self, clave):
+        return int(clave[:16], 16) % self.total == self.indice - 1
+
+    def filtrar(self, filas, extension='.docx'):
+        """Deja pasar solo las filas (nombre, valores) de esta parte, con el número de fila delante del nombre.
+
+        Registra cada fila de la parte para el manifiesto, junto con la
+        huella de todas las claves leídas, que debe coincidir en todas las partes.
+        """
+        for numero, (nombre, valores) in enumerate(filas):
+            clave = clave_fila(valores)
+            self.leidas += 1
+            self._huella.update(clave.encode())
+            if not self.contiene(clave):
+                continue
+            nombre = os.path.splitext(nombre)[0] + extension
+            archivo = f'{numero + 1:07d}_{nombre}'
+            self.filas.append([numero, nombre, archivo])
+            yield archivo, valores
+
+    def guardar_manifiesto(self, carpeta, identidad):
+        """Escribe el manifiesto de la parte terminada; identidad describe los archivos de entrada"""
+        manifiesto = {
+            'version': 1,
+            'parte': self.indice,
+            'partes': self.total,
+            'identidad': identidad,
+            'leidas': self.leidas,
+            'huella_filas': self._huella.hexdigest(),
+            'filas': self.filas,
+        }
+        ruta = os.path.join(carpeta, MANIFIESTO_PARTE)
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f, ensure_ascii=False)
+        os.replace(ruta + '.tmp', ruta)
+
+
+def _leer_partes(carpeta):
+    """Manifiestos de las partes terminadas en carpeta, con la carpeta de cada una"""
+    partes = []
+    for ruta in sorted(glob.glob(os.path.join(glob.escape(carpeta), 'parte_*_de_*', MANIFIESTO_PARTE))):
+        with open(ruta, encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        manifiesto['carpeta'] = os.path.dirname(ruta)
+        partes.append(manifiesto)
+    return partes
+
+
+def verificar_partes(carpeta):
+    """Comprueba que las partes de carpeta cubren todas las filas una sola vez; devuelve (partes, filas).
+
+    filas es la lista (número, nombre, ruta, parte) en el orden de la hoja.
+    Lanza ParticionIncompleta con todos los problemas encontrados.
+    """
+    partes = _leer_partes(carpeta)
+    if not partes:
+        raise ParticionIncompleta([f'No hay partes terminadas en {carpeta}'])
+
+    problemas = []
+    divisiones = {parte['partes'] for parte in partes}
+    if len(divisiones) > 1:
+        raise ParticionIncompleta([f'Hay partes de divisiones distintas: {", ".join(map(str, sorted(divisiones)))}'])
+    total = divisiones.pop()
+    encontradas = [parte['parte'] for parte in partes]
+    faltantes = sorted(set(range(1, total + 1)) - set(encontradas))
+    if faltantes:
+        problemas.append(f'Faltan las partes {", ".join(f"{i}/{total}" for i in faltantes)}')
+
+    # Todas las partes tienen que haber leído los mismos archivos con las mismas filas
+    referencia = partes[0]
+    for parte in partes[1:]:
+        for campo in ('identidad', 'leidas', 'huella_filas'):
+            if parte[campo] != referencia[campo]:
+                problemas.append(f'La parte {parte["parte"]}/{total} se generó con otros datos, plantilla o '
+                                 f'formato que la parte {referencia["parte"]}/{total} ({campo})')
+                break
+
+    filas = {}
+    repetidas = set()
+    for parte in partes:
+        for numero, nombre, archivo in parte['filas']:
+            if numero in filas:
+                repetidas.add(numero)
+            filas[numero] = (numero, nombre, os.path.join(parte['carpeta'], archivo), parte['parte'])
+    if repetidas:
+        problemas.append(f'Filas repetidas en más de una parte: {_resumir(repetidas)}')
+    sin_parte = set(range(referencia['leidas'])) - set(filas)
+    if sin_parte and not faltantes:
+        problemas.append(f'Filas que no están en ninguna parte: {_resumir(sin_parte)}')
+    sin_archivo = [numero for numero, _, ruta, _ in filas.values() if not os.path.exists(ruta)]
+    if sin_archivo:
+        problemas.append(f'Filas sin su diploma en la carpeta de la parte: {_resumir(sin_archivo)}')
+
+    if problemas:
+        raise ParticionIncompleta(problemas)
+    return partes, [filas[numero] for numero in sorted(filas)]
+
+
+def _resumir(numeros, maximo=10):
+    """Números de fila (desde 1) para un mensaje, sin listar miles"""
+    numeros = sorted(numeros)
+    texto = ', '.join(str(numero + 1) for numero in numeros[:maximo])
+    return texto + (f' y {len(numeros) - maximo} más' if len(numeros) > maximo else '')
+
+
+def combinar_partes(carpeta, destino, manifiesto, modo='stored'):
+    """Verifica las partes de carpeta y las une en el ZIP destino, en el orden de la hoja, con su manifiesto.
+
+    Devuelve la cantidad de diplomas. El ZIP se escribe con otro nombre y se
+    renombra al final, así nunca queda uno a medias con el nombre definitivo.
+    """
+    partes, filas = verificar_partes(carpeta)
+
+    usados = set()
+    contenido = []
+    for numero, nombre, _, parte in filas:
+        contenido.append({'fila': numero + 1, 'nombre': nombre_unico(nombre, usados), 'parte': parte})
+
+    def diplomas():
+        for (_, _, ruta, _), fila in zip(filas, contenido):
+            with open(ruta, 'rb') as f:
+                yield fila['nombre'], f.read()
+
+    with open(destino + '.parcial', 'wb') as f:
+        for trozo in generar_archivo(diplomas(), modo=modo):
+            f.write(trozo)
+    os.replace(destino + '.parcial', destino)
+
+    with open(manifiesto, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': 1,
+            'partes': partes[0]['partes'],
+            'identidad': partes[0]['identidad'],
+            'total': len(filas),
+            'diplomas': contenido,
+        }, f, ensure_ascii=False, indent=1)
+    return len(filas)
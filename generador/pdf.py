@@ -0,0 +1,254 @@
+import collections
+import io
+import os
+import pathlib
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+
+from .paralelo import _lotes
+
+# UNO viene con LibreOffice (python3-uno). Sin él, cada instancia es un unoserver (pip install unoserver en el
+# Python de LibreOffice) al que se habla por XML-RPC; sin ninguno de los dos, cada lote lanza --convert-to
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+FORMATOS = ('docx', 'pdf')
+
+# Diplomas que cada LibreOffice convierte por tarea
+DIPLOMAS_POR_LOTE = 8
+
+# Segundos que puede tardar LibreOffice en arrancar o en convertir un lote
+TIEMPO_ARRANQUE = 60
+TIEMPO_LOTE = 300
+
+
+class ErrorConversionPDF(Exception):
+    """LibreOffice no está disponible o no pudo convertir un diploma"""
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _propiedades(**valores):
+    return tuple(PropertyValue(Name=nombre, Value=valor) for nombre, valor in valores.items())
+
+
+class _Instancia:
+    """LibreOffice sin interfaz con su propio perfil, abierto mientras dure el pool"""
+
+    def __init__(self, soffice, carpeta, unoserver=None):
+        self.soffice = soffice
+        self.unoserver = unoserver
+        self.carpeta_perfil = os.path.join(carpeta, 'perfil')
+        self.perfil = pathlib.Path(self.carpeta_perfil).as_uri()
+        self.proceso = None
+        self._escritorio = None
+        self._servidor = None
+        self.iniciar()
+
+    def _comando(self, *argumentos):
+        return [self.soffice, '--headless', '--invisible', '--nologo', '--norestore', '--nolockcheck',
+                f'-env:UserInstallation={self.perfil}', *argumentos]
+
+    def _iniciar_unoserver(self):
+        puerto = _puerto_libre()
+        self.proceso = subprocess.Popen(
+            [self.unoserver, '--interface', '127.0.0.1', '--port', str(puerto), '--uno-port', str(_puerto_libre()),
+             '--executable', self.soffice, '--user-installation', self.carpeta_perfil,
+             '--conversion-timeout', str(TIEMPO_LOTE)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self._servidor = xmlrpc.client.ServerProxy(f'http://127.0.0.1:{puerto}', allow_none=True)
+        limite = time.monotonic() + TIEMPO_ARRANQUE
+        while True:
+            try:
+                self._servidor.info()
+                return
+            except (OSError, xmlrpc.client.Error):
+                if self.proceso.poll() is not None or time.monotonic() > limite:
+                    self.cerrar()
+                    raise ErrorConversionPDF('unoserver no respondió al iniciar')
+                time.sleep(0.25)
+
+    def iniciar(self):
+        if uno is None and self.unoserver is not None:
+            self._iniciar_unoserver()
+            return
+        if uno is None:
+            # Sin UNO ni unoserver cada lote lanza LibreOffice; el perfil se crea ahora para no pagarlo en cada lote
+            try:
+                subprocess.run(self._comando('--terminate_after_init'), capture_output=True,
+                               timeout=TIEMPO_ARRANQUE)
+            except subprocess.TimeoutExpired:
+                raise ErrorConversionPDF('LibreOffice no respondió al iniciar') from None
+            return
+
+        puerto = _puerto_libre()
+        conexion = f'socket,host=127.0.0.1,port={puerto};urp;StarOffice.ComponentContext'
+        self.proceso = subprocess.Popen(self._comando(f'--accept={conexion}'),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        limite = time.monotonic() + TIEMPO_ARRANQUE
+        while True:
+            try:
+                contexto = resolver.resolve(f'uno:{conexion}')
+                break
+            except Exception:
+                if self.proceso.poll() is not None or time.monotonic() > limite:
+                    self.cerrar()
+                    raise ErrorConversionPDF('LibreOffice no respondió al iniciar')
+                time.sleep(0.25)
+        self._escritorio = contexto.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', contexto)
+
+    def convertir(self, rutas, carpeta_salida):
+        """Convierte los .docx a PDF, con el mismo nombre, en carpeta_salida"""
+        if self._servidor is not None:
+            for ruta in rutas:
+                nombre = os.path.splitext(os.path.basename(ruta))[0] + '.pdf'
+                try:
+                    self._servidor.convert(ruta, None, os.path.join(carpeta_salida, nombre))
+                except xmlrpc.client.Fault as e:
+                    raise ErrorConversionPDF(e.faultString) from None
+            return
+        if uno is None:
+            resultado = subprocess.run(self._comando('--convert-to', 'pdf', '--outdir', carpeta_salida, *rutas),
+                                       capture_output=True, timeout=TIEMPO_LOTE)
+            if resultado.returncode != 0:
+                raise ErrorConversionPDF(resultado.stderr.decode(errors='replace').strip() or 'LibreOffice falló')
+            return
+
+        for ruta in rutas:
+            nombre = os.path.splitext(os.path.basename(ruta))[0] + '.pdf'
+            documento = self._escritorio.loadComponentFromURL(pathlib.Path(ruta).as_uri(), '_blank', 0,
+                                                              _propiedades(Hidden=True))
+            try:
+                documento.storeToURL(pathlib.Path(carpeta_salida, nombre).as_uri(),
+                                     _propiedades(FilterName='writer_pdf_Export'))
+            finally:
+                documento.close(True)
+
+    def reiniciar(self):
+        self.cerrar()
+        self.iniciar()
+
+    def cerrar(self):
+        if self._escritorio is not None:
+            try:
+                self._escritorio.terminate()
+            except Exception:
+                pass
+            self._escritorio = None
+        self._servidor = None
+        if self.proceso is not None:
+            self.proceso.terminate()
+            try:
+                self.proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+            self.proceso = None
+
+
+class ConvertidorPDF:
+    """Pool de LibreOffice sin interfaz que quedan abiertos entre conversiones.
+
+    Cada proceso arranca una sola vez (con su propio perfil, ya preparado) y
+    recibe lotes de DIPLOMAS_POR_LOTE documentos; con UNO se le habla por un
+    socket local y, sin UNO, por el XML-RPC de unoserver, sin lanzar un
+    proceso nuevo por archivo. Sin ninguno de los dos cada lote lanza
+    LibreOffice con --convert-to, y se avisa al crear el pool.
+    """
+
+    def __init__(self, procesos=2, soffice='soffice', unoserver='unoserver'):
+        if shutil.which(soffice) is None:
+            raise ErrorConversionPDF(f'No se encontró LibreOffice ({soffice}); instálalo para generar PDF')
+        unoserver = shutil.which(unoserver) if uno is None else None
+        if uno is None and unoserver is None:
+            print('Aviso: sin UNO (python3-uno) ni unoserver, LibreOffice no queda abierto entre conversiones: '
+                  'cada lote de PDF lanza un proceso nuevo. Instala unoserver para mantenerlo abierto.')
+        self.procesos = procesos
+        self._carpeta = tempfile.mkdtemp(prefix='diplomas_pdf_')
+        self._instancias = []
+        self._libres = queue.Queue()
+        try:
+            for i in range(procesos):
+                instancia = _Instancia(soffice, os.path.join(self._carpeta, str(i)), unoserver)
+                self._instancias.append(instancia)
+                self._libres.put(instancia)
+        except Exception:
+            self.cerrar()
+            raise
+        self._executor = ThreadPoolExecutor(max_workers=procesos, thread_name_prefix='pdf')
+
+    def _convertir_lote(self, lote):
+        instancia = self._libres.get()
+        try:
+            with tempfile.TemporaryDirectory(dir=self._carpeta) as carpeta:
+                # Nombres simples en disco; el nombre del diploma se restaura al leer el PDF
+                rutas = []
+                for i, (_, contenido) in enumerate(lote):
+                    rutas.append(os.path.join(carpeta, f'{i}.docx'))
+                    with open(rutas[-1], 'wb') as f:
+                        f.write(contenido)
+                try:
+                    instancia.convertir(rutas, carpeta)
+                except ErrorConversionPDF:
+                    raise
+                except Exception:
+                    # El proceso pudo caerse: se reinicia y se reintenta una vez
+                    instancia.reiniciar()
+                    instancia.convertir(rutas, carpeta)
+
+                convertidos = []
+                for i, (nombre, _) in enumerate(lote):
+                    try:
+                        with open(os.path.join(carpeta, f'{i}.pdf'), 'rb') as f:
+                            convertidos.append((os.path.splitext(nombre)[0] + '.pdf', f.read()))
+                    except FileNotFoundError:
+                        raise ErrorConversionPDF(f'LibreOffice no generó el PDF de {nombre}')
+                return convertidos
+        finally:
+            self._libres.put(instancia)
+
+    def convertir_diplomas(self, diplomas, por_lote=DIPLOMAS_POR_LOTE):
+        """Convierte los diplomas (nombre, .docx) y devuelve (nombre .pdf, PDF) en el mismo orden"""
+        pendientes = collections.deque()
+        try:
+            for lote in _lotes(diplomas, por_lote):
+                pendientes.append(self._executor.submit(self._convertir_lote, lote))
+                if len(pendientes) >= self.procesos * 2:
+                    yield from pendientes.popleft().result()
+            while pendientes:
+                yield from pendientes.popleft().result()
+        finally:
+            for futuro in pendientes:
+                futuro.cancel()
+
+    def cerrar(self):
+        if hasattr(self, '_executor'):
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        for instancia in self._instancias:
+            instancia.cerrar()
+        shutil.rmtree(self._carpeta, ignore_errors=True)
+
+
+def unir_pdfs(pdfs, destino):
+    """Une los PDF (bytes) en un solo documento de varias páginas y lo escribe en destino (ruta o stream)"""
+    from pypdf import PdfWriter
+
+    escritor = PdfWriter()
+    for contenido in pdfs:
+        escritor.append(io.BytesIO(contenido))
+    escritor.write(destino)
+    escritor.close()
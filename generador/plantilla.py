@@ -0,0 +1,210 @@
+import contextlib
+import itertools
+import threading
+import zipfile
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.opc.packuri import PackURI
+from docx.opc.part import XmlPart
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from docx.parts.image import ImagePart
+
+from .imagenes import placeholder_imagen
+from .ooxml import PlantillaNoSoportada, PlantillaOOXML, contenido_con_imagenes, xml_dibujo
+from .reemplazo import PATRON_PLACEHOLDER, iter_paragraphs, reemplazar_en_runs, sustituir_placeholders
+
+MODOS_RENDER = ('auto', 'rapido', 'docx')
+
+
+class _ParrafoIndexado:
+    """Párrafo de la plantilla que contiene placeholders"""
+
+    def __init__(self, paragraph):
+        self.runs = [run._r for run in paragraph.runs]
+        self.texto = ''.join(r.text for r in self.runs)
+        self.columnas = set(PATRON_PLACEHOLDER.findall(self.texto))
+        # Placeholders de imagen: el párrafo se plantilla si la fila tiene su columna
+        self.imagenes = {}
+        for nombre in self.columnas:
+            placeholder = placeholder_imagen(nombre)
+            if placeholder is not None:
+                self.imagenes[nombre] = placeholder
+        self.columnas |= {placeholder.columna for placeholder in self.imagenes.values()}
+        # Parte (cuerpo, encabezado o pie) donde se relacionan sus imágenes
+        self.parte = paragraph.part
+        # Contenido original de cada run, para dejar la plantilla intacta después de renderizar
+        self.contenido = [list(r) for r in self.runs]
+
+    def restaurar(self):
+        for r, hijos in zip(self.runs, self.contenido):
+            r[:] = hijos
+
+
+class _TextoIndexado:
+    """Elemento de texto (w:t, a:t, ...) del cuerpo que contiene placeholders"""
+
+    def __init__(self, elemento):
+        self.elemento = elemento
+        self.texto = elemento.text
+        self.columnas = set(PATRON_PLACEHOLDER.findall(elemento.text))
+
+    def restaurar(self):
+        self.elemento.text = self.texto
+
+
+class _ImagenesDiploma:
+    """Imágenes que un diploma agrega al documento, para quitarlas después de guardarlo"""
+
+    def __init__(self, primer_id):
+        self._ids = itertools.count(primer_id)
+        # Una sola parte por imagen, aunque la usen el cuerpo y un encabezado
+        self._partes = {}
+        self._relaciones = set()
+
+    def para(self, parte):
+        """Función dibujar (ver contenido_con_imagenes) para las imágenes de una parte del documento"""
+        def dibujar(imagen, ancho):
+            parte_imagen = self._partes.get(imagen.huella)
+            if parte_imagen is None:
+                parte_imagen = self._partes[imagen.huella] = ImagePart(
+                    PackURI(f'/word/media/{imagen.nombre}'), imagen.tipo_contenido, imagen.datos)
+            rid = parte.relate_to(parte_imagen, RT.IMAGE)
+            self._relaciones.add((parte, rid))
+            return xml_dibujo(next(self._ids), rid, imagen.nombre, *imagen.tamano(ancho))
+        return dibujar
+
+    def quitar(self):
+        # Las imágenes de la fila no quedan en la plantilla para el próximo diploma
+        for parte, rid in self._relaciones:
+            del parte.rels[rid]
+
+
+class PlantillaCompilada:
+    """Plantilla de Word analizada una sola vez por trabajo.
+
+    Al compilar se ubican los párrafos (cuerpo, tablas, encabezados y pies de
+    página) y los elementos de texto del cuerpo (cuadros de texto, formas) que
+    contienen placeholders. Cada diploma se genera reemplazando solo en esas
+    posiciones y restaurando la plantilla después de guardarlo, así que el
+    .docx no se vuelve a descomprimir ni a analizar por cada fila.
+    """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self._doc = Document(template_path)
+        self._lock = threading.Lock()
+
+        # Memoria aproximada: el árbol XML ocupa al menos lo que las partes descomprimidas
+        with zipfile.ZipFile(template_path) as zf:
+            self.tamano = sum(info.file_size for info in zf.infolist())
+
+        # Un mismo párrafo puede aparecer varias veces (celdas combinadas, encabezados vinculados)
+        parrafos = {}
+        for paragraph in iter_paragraphs(self._doc):
+            if paragraph._p not in parrafos:
+                indexado = _ParrafoIndexado(paragraph)
+                if indexado.columnas:
+                    parrafos[paragraph._p] = indexado
+        self._parrafos = list(parrafos.values())
+
+        self._textos = [
+            _TextoIndexado(t_elem)
+            for t_elem in self._doc.element.body.iter()
+            if isinstance(t_elem.tag, str) and t_elem.tag.endswith('}t')
+            and t_elem.text and PATRON_PLACEHOLDER.search(t_elem.text)
+        ]
+
+        # Placeholders de la plantilla (reemplazados si el Excel tiene la columna), para las métricas
+        self.placeholders = sum(
+            len(PATRON_PLACEHOLDER.findall(indexado.texto)) for indexado in self._parrafos + self._textos)
+
+        # Imágenes por fila: los dibujos nuevos usan id mayores que los de la plantilla
+        self.imagenes = {nombre: placeholder for parrafo in self._parrafos
+                         for nombre, placeholder in parrafo.imagenes.items()}
+        self._primer_id = 1 + max((int(i) for parte in self._doc.part.package.iter_parts()
+                                   if isinstance(parte, XmlPart)
+                                   for i in parte.element.xpath('//wp:docPr/@id')), default=0)
+
+    def __reduce__(self):
+        # El documento de python-docx no se puede serializar: cada proceso del pool la recompila
+        return (PlantillaCompilada, (self.template_path,))
+
+    @property
+    def columnas(self):
+        """Nombres de todos los placeholders encontrados en la plantilla"""
+        columnas = set()
+        for indexado in self._parrafos + self._textos:
+            columnas |= indexado.columnas
+        return columnas
+
+    def _reemplazar(self, valores, imagenes):
+        # Cada posición indexada se visita una vez y resuelve todos sus placeholders juntos
+        for parrafo in self._parrafos:
+            if parrafo.columnas.isdisjoint(valores):
+                continue
+            if parrafo.imagenes:
+                self._reemplazar_con_imagenes(parrafo, valores, imagenes)
+            else:
+                reemplazar_en_runs(parrafo.runs, parrafo.texto, valores)
+
+        for texto in self._textos:
+            # Los w:t de un párrafo ya unificado quedan fuera del documento
+            if not texto.columnas.isdisjoint(valores) and texto.elemento.getparent() is not None:
+                texto.elemento.text = sustituir_placeholders(texto.texto, valores)
+
+    def _reemplazar_con_imagenes(self, parrafo, valores, imagenes):
+        """Como reemplazar_en_runs, con las imágenes de la fila en el primer run"""
+        contenido = contenido_con_imagenes(parrafo.texto, valores, imagenes.para(parrafo.parte))
+        contenido = parse_xml(f'<w:r {nsdecls("w")}>{contenido}</w:r>')
+        for i, r in enumerate(parrafo.runs):
+            r.text = ''
+            if i == 0:
+                r.clear_content()
+                r.extend(list(contenido))
+
+    def _restaurar(self):
+        for parrafo in self._parrafos:
+            parrafo.restaurar()
+        for texto in self._textos:
+            texto.restaurar()
+
+    @contextlib.contextmanager
+    def documento_con(self, valores):
+        """Documento de python-docx con los valores de una fila ya reemplazados; se restaura al salir.
+
+        El documento es el de la plantilla: solo vale dentro del with.
+        """
+        with self._lock:
+            imagenes = _ImagenesDiploma(self._primer_id)
+            try:
+                self._reemplazar(valores, imagenes)
+                yield self._doc
+            finally:
+                self._restaurar()
+                imagenes.quitar()
+
+    def renderizar(self, valores, destino):
+        """Genera un diploma con los valores de una fila y lo guarda en destino (ruta o stream)"""
+        with self.documento_con(valores) as doc:
+            doc.save(destino)
+
+
+def compilar_plantilla(template_path, columnas, modo='auto'):
+    """Compila la plantilla con la ruta rápida y, si no es compatible, con python-docx.
+
+    modo 'rapido' exige la ruta rápida y 'docx' usa siempre python-docx.
+    """
+    if modo not in MODOS_RENDER:
+        raise ValueError(f"Modo de render no válido: {modo}")
+
+    if modo != 'docx':
+        try:
+            return PlantillaOOXML(template_path, columnas)
+        except PlantillaNoSoportada as e:
+            if modo == 'rapido':
+                raise
+            print(f"Plantilla no compatible con la ruta rápida ({e}), se usa python-docx")
+
+    return PlantillaCompilada(template_path)
@@ -0,0 +1,93 @@
+import re
+
+from docx.oxml.ns import qn
+
+# Cualquier texto entre llaves puede ser un placeholder: {NOMBRE_COLUMNA}
+PATRON_PLACEHOLDER = re.compile(r'\{([^{}]+)\}')
+
+
+def replace_text_in_paragraph(paragraph, search, replace):
+    """Reemplaza texto en un párrafo, incluso si está dividido en múltiples runs"""
+    full_text = ''.join(run.text for run in paragraph.runs)
+    
+    if search in full_text:
+        nuevo_texto = full_text.replace(search, replace)
+        
+        if paragraph.runs:
+            for i, run in enumerate(paragraph.runs):
+                if i == 0:
+                    run.text = nuevo_texto
+                else:
+                    run.text = ''
+        else:
+            paragraph.add_run(nuevo_texto)
+
+def replace_text_in_cell(cell, search, replace):
+    """Reemplaza texto en una celda, buscando en todos sus párrafos"""
+    for paragraph in cell.paragraphs:
+        replace_text_in_paragraph(paragraph, search, replace)
+
+def replace_text_in_xml_elements(element, search, replace):
+    """Función recursiva para buscar y reemplazar en elementos XML"""
+    for t_elem in element.iter(qn('w:t')):
+        if t_elem.text and search in t_elem.text:
+            t_elem.text = t_elem.text.replace(search, replace)
+    
+    for t_elem in element.iter():
+        if t_elem.tag.endswith('}t') and hasattr(t_elem, 'text') and t_elem.text:
+            if search in t_elem.text:
+                t_elem.text = t_elem.text.replace(search, replace)
+
+def iter_paragraphs(doc):
+    """Recorre los párrafos que replace_text revisa: cuerpo, tablas, encabezados y pies"""
+    yield from doc.paragraphs
+    
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                yield from cell.paragraphs
+    
+    for section in doc.sections:
+        for header in [section.header, section.first_page_header, section.even_page_header]:
+            yield from header.paragraphs
+            for table in header.tables:
+                for row in table.rows:
+                    for cell in row.cells:
+                        yield from cell.paragraphs
+        
+        for footer in [section.footer, section.first_page_footer, section.even_page_footer]:
+            yield from footer.paragraphs
+            for table in footer.tables:
+                for row in table.rows:
+                    for cell in row.cells:
+                        yield from cell.paragraphs
+
+def replace_text(doc, search, replace):
+    """Reemplaza texto en todo el documento de forma exhaustiva"""
+    for paragraph in iter_paragraphs(doc):
+        replace_text_in_paragraph(paragraph, search, replace)
+    
+    replace_text_in_xml_elements(doc.element.body, search, replace)
+
+def sustituir_placeholders(texto, valores):
+    """Resuelve en una sola pasada todos los placeholders del texto que tengan valor en la fila"""
+    return PATRON_PLACEHOLDER.sub(lambda m: valores.get(m.group(1), m.group(0)), texto)
+
+def reemplazar_en_runs(runs, texto, valores):
+    """Escribe el texto ya sustituido en el primer run y vacía los demás, como replace_text_in_paragraph"""
+    nuevo_texto = sustituir_placeholders(texto, valores)
+    for i, r in enumerate(runs):
+        r.text = nuevo_texto if i == 0 else ''
+
+def reemplazar_placeholders(doc, valores):
+    """Reemplaza todos los placeholders de una fila recorriendo el documento una sola vez"""
+    for paragraph in iter_paragraphs(doc):
+        runs = [run._r for run in paragraph.runs]
+        texto = ''.join(r.text for r in runs)
+        if any(col in valores for col in PATRON_PLACEHOLDER.findall(texto)):
+            reemplazar_en_runs(runs, texto, valores)
+    
+    for t_elem in doc.element.body.iter():
+        if isinstance(t_elem.tag, str) and t_elem.tag.endswith('}t') and t_elem.text:
+            if '{' in t_elem.text:
+                t_elem.text = sustituir_placeholders(t_elem.text, valores)
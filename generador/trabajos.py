@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+PENDIENTE = 'pendiente'
+PROCESANDO = 'procesando'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+NOMBRE_ARCHIVO = 'diplomas_generados.zip'
+
+# Cada cuánto se guarda el avance en disco mientras se generan filas
+INTERVALO_AVANCE = 0.5
+
+_PATRON_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class Trabajo:
+    """Trabajo de generación en segundo plano.
+
+    El estado se guarda en estado.json dentro de la carpeta del trabajo, así
+    cualquier proceso del servidor puede consultarlo o entregar el archivo.
+    """
+
+    def __init__(self, directorio, id_trabajo):
+        self.id = id_trabajo
+        self.directorio = directorio
+        self.ruta_estado = os.path.join(directorio, 'estado.json')
+        self.ruta_archivo = os.path.join(directorio, NOMBRE_ARCHIVO)
+        self.generadas = 0
+        self._ultimo_guardado = 0.0
+
+    def guardar_estado(self, **cambios):
+        estado = self.leer_estado() or {}
+        estado.update(cambios)
+        estado['actualizado'] = time.time()
+        temporal = self.ruta_estado + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f)
+        os.replace(temporal, self.ruta_estado)
+        self._ultimo_guardado = time.monotonic()
+
+    def leer_estado(self):
+        try:
+            with open(self.ruta_estado, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def iniciar(self, total):
+        """Marca el comienzo de la generación, con el total de filas"""
+        self.generadas = 0
+        self.guardar_estado(total=total, generadas=0, inicio=time.time())
+
+    def contar(self, diplomas):
+        """Deja pasar los diplomas generados e informa el avance, como máximo una vez por intervalo"""
+        for diploma in diplomas:
+            self.generadas += 1
+            if time.monotonic() - self._ultimo_guardado >= INTERVALO_AVANCE:
+                self.guardar_estado(generadas=self.generadas)
+            yield diploma
+
+
+def resumen_trabajo(estado):
+    """Estado público de un trabajo, con filas por segundo y tiempo restante estimado"""
+    datos = {
+        'id': estado['id'],
+        'estado': estado['estado'],
+        'total': estado.get('total'),
+        'generadas': estado.get('generadas', 0),
+        'filas_por_segundo': None,
+        'eta_segundos': None,
+    }
+    if estado.get('error'):
+        datos['error'] = estado['error']
+    if estado.get('metricas'):
+        datos['metricas'] = estado['metricas']
+
+    inicio = estado.get('inicio')
+    if inicio and datos['generadas']:
+        fin = estado.get('fin') or estado['actualizado']
+        velocidad = datos['generadas'] / max(fin - inicio, 1e-6)
+        datos['filas_por_segundo'] = round(velocidad, 1)
+        if datos['total'] is not None and estado['estado'] == PROCESANDO:
+            datos['eta_segundos'] = round((datos['total'] - datos['generadas']) / velocidad, 1)
+    if estado['estado'] == COMPLETADO:
+        datos['eta_segundos'] = 0
+    return datos
+
+
+class GestorTrabajos:
+    """Ejecuta los trabajos en un pool de hilos local y limpia los vencidos.
+
+    Admite como máximo max_simultaneos trabajos en proceso más max_en_cola
+    esperando (None = sin límite); reservar() indica si entra uno más.
+    """
+
+    def __init__(self, directorio, max_simultaneos=2, ttl=3600, max_en_cola=None):
+        self.directorio = directorio
+        self.ttl = ttl
+        self.max_simultaneos = max_simultaneos
+        self.max_en_cola = max_en_cola
+        self._executor = ThreadPoolExecutor(max_workers=max_simultaneos, thread_name_prefix='trabajo')
+        self._lock = threading.Lock()
+        self._admitidos = 0
+        # Trabajos de este proceso enviados y sin terminar: la limpieza no los toca aunque esperen mucho
+        self._activos = set()
+        os.makedirs(directorio, exist_ok=True)
+
+    def reservar(self):
+        """Reserva lugar para un trabajo; False si la cola está llena.
+
+        La reserva se libera al terminar el trabajo enviado, o con liberar() si no llega a enviarse.
+        """
+        with self._lock:
+            if self.max_en_cola is not None and self._admitidos >= self.max_simultaneos + self.max_en_cola:
+                return False
+            self._admitidos += 1
+            return True
+
+    def liberar(self):
+        with self._lock:
+            self._admitidos -= 1
+
+    def crear(self):
+        self.limpiar_vencidos()
+        id_trabajo = uuid.uuid4().hex
+        trabajo = Trabajo(os.path.join(self.directorio, id_trabajo), id_trabajo)
+        os.makedirs(trabajo.directorio)
+        trabajo.guardar_estado(id=id_trabajo, estado=PENDIENTE, creado=time.time())
+        return trabajo
+
+    def borrar(self, trabajo):
+        """Borra la carpeta de un trabajo que no llegó a enviarse"""
+        shutil.rmtree(trabajo.directorio, ignore_errors=True)
+
+    def obtener(self, id_trabajo):
+        """Trabajo existente con ese id, o None"""
+        if not _PATRON_ID.match(id_trabajo):
+            return None
+        trabajo = Trabajo(os.path.join(self.directorio, id_trabajo), id_trabajo)
+        if trabajo.leer_estado() is None:
+            return None
+        return trabajo
+
+    def enviar(self, trabajo, funcion, *args):
+        """Programa funcion(trabajo, *args); debe escribir el resultado en trabajo.ruta_archivo.
+
+        Usa el lugar reservado antes con reservar() y lo libera al terminar.
+        """
+        def ejecutar():
+            try:
+                trabajo.guardar_estado(estado=PROCESANDO, comenzado=time.time())
+                funcion(trabajo, *args)
+            except Exception as e:
+                print(f"Error en el trabajo {trabajo.id}: {str(e)}")
+                print(traceback.format_exc())
+                trabajo.guardar_estado(estado=ERROR, error=str(e), generadas=trabajo.generadas, fin=time.time())
+            else:
+                trabajo.guardar_estado(estado=COMPLETADO, generadas=trabajo.generadas, fin=time.time())
+            finally:
+                with self._lock:
+                    self._activos.discard(trabajo.id)
+                self.liberar()
+
+        with self._lock:
+            self._activos.add(trabajo.id)
+        return self._executor.submit(ejecutar)
+
+    def limpiar_vencidos(self):
+        """Borra los trabajos terminados hace más de ttl segundos.
+
+        También los que no terminaron pero no cambian desde hace ttl segundos
+        (un proceso que murió a mitad de un trabajo), salvo los que este
+        proceso todavía tiene en cola o en proceso.
+        """
+        limite = time.time() - self.ttl
+        with self._lock:
+            for id_trabajo in os.listdir(self.directorio):
+                if id_trabajo in self._activos:
+                    continue
+                trabajo = self.obtener(id_trabajo)
+                if trabajo is None:
+                    continue
+                estado = trabajo.leer_estado()
+                if estado['estado'] in (COMPLETADO, ERROR):
+                    vencido = estado.get('fin', 0) < limite
+                else:
+                    vencido = estado.get('actualizado', 0) < limite
+                if vencido:
+                    shutil.rmtree(trabajo.directorio, ignore_errors=True)
@@ -0,0 +1,35 @@
+"""Configuración de gunicorn para producción: gunicorn app:app (este archivo se lee automáticamente)"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Procesos: WEB_CONCURRENCY si la plataforma la define (Render y Heroku la ajustan a la memoria de la instancia)
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+# Hilos por proceso: las descargas en streaming pasan buena parte del tiempo esperando a la red
+worker_class = 'gthread'
+threads = int(os.environ.get('DIPLOMAS_HILOS', 4))
+
+# app.py (pandas, python-docx, openpyxl, lxml) y la plantilla de ejemplo se cargan una sola vez
+# en el proceso principal y los workers los comparten (copy-on-write)
+preload_app = True
+
+# Un lote grande puede tardar minutos en generarse y descargarse
+timeout = int(os.environ.get('DIPLOMAS_TIMEOUT', 600))
+graceful_timeout = int(os.environ.get('DIPLOMAS_TIMEOUT_CIERRE', 120))
+keepalive = 5
+
+# El latido de los workers va en memoria: en contenedores, /tmp puede estar en un disco lento
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+
+
+def when_ready(server):
+    # Antes de crear los workers: plantilla de ejemplo compilada y objetos fuera del recolector de basura,
+    # para que los workers no copien las páginas compartidas al recorrerlas
+    import app
+    app.precalentar()
+    gc.freeze()
@@ -0,0 +1,71 @@
+import base64
+import hashlib
+import importlib
+import io
+import json
+import zipfile
+
+import pytest
+from docx import Document
+
+
+@pytest.fixture(scope='module')
+def cliente(tmp_path_factory):
+    # Las carpetas de la app se leen del entorno al importarla: cada prueba usa las suyas
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for variable in ('SUBIDAS', 'TRABAJOS', 'PLANTILLAS', 'DIPLOMAS'):
+            monkeypatch.setenv(f'DIPLOMAS_DIR_{variable}', str(tmp_path_factory.mktemp(variable.lower())))
+        app = importlib.import_module('app')
+    return app.app.test_client()
+
+
+@pytest.fixture(scope='module')
+def huella(cliente):
+    doc = Document()
+    doc.add_paragraph('Certificamos que {NOMBRE_COMPLETO}, C.C. {N_DOCUMENTO}')
+    contenido = io.BytesIO()
+    doc.save(contenido)
+    contenido.seek(0)
+    respuesta = cliente.post('/templates', data={'template': (contenido, 'plantilla.docx')},
+                             content_type='multipart/form-data')
+    assert respuesta.status_code == 201
+    return respuesta.get_json()['plantilla']
+
+
+def test_stream_ndjson_con_una_linea_invalida(cliente, huella):
+    lineas = [
+        '{"NOMBRE_COMPLETO": "Ana", "N_DOCUMENTO": 1234567}\n',
+        '{"NOMBRE_COMPLETO": "Luis"\n',
+        '\n',
+        '{"NOMBRE_COMPLETO": "Eva", "OTRA": 1}\n',
+        '{"nombre_completo": "Tomás"}\n',
+    ]
+    respuesta = cliente.post(f'/generate/stream?plantilla={huella}&respuesta=ndjson',
+                             data=''.join(lineas).encode('utf-8'), content_type='application/x-ndjson')
+    assert respuesta.status_code == 200
+    assert respuesta.mimetype == 'application/x-ndjson'
+    estados = [json.loads(linea) for linea in respuesta.get_data().splitlines()]
+
+    # Una línea por fila en el orden del cuerpo (la vacía no cuenta) y el resumen al final
+    assert [(estado['linea'], estado['estado']) for estado in estados[:-1]] == [
+        (1, 'ok'), (2, 'error'), (4, 'error'), (5, 'ok')]
+    assert estados[-1] == {'estado': 'fin', 'filas': 4, 'generadas': 2, 'errores': 2}
+    assert [estado['desplazamiento'] for estado in estados[:-1]] == [
+        len(''.join(lineas[:i]).encode('utf-8')) for i in (0, 1, 3, 4)]
+    assert estados[1]['error'].startswith('JSON no válido')
+    assert estados[2]['error'] == 'columna desconocida: OTRA'
+
+    for estado, texto in zip([estados[0], estados[3]], ['Ana, C.C. 1.234.567', 'Tomás, C.C. ']):
+        contenido = base64.b64decode(estado['contenido'])
+        assert estado['bytes'] == len(contenido)
+        assert estado['sha256'] == hashlib.sha256(contenido).hexdigest()
+        with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+            assert texto in zf.read('word/document.xml').decode('utf-8')
+    assert [estados[0]['nombre'], estados[3]['nombre']] == ['Diploma_Ana.docx', 'Diploma_Tomás.docx']
+
+
+def test_stream_zip_rechaza_la_primera_linea_invalida(cliente, huella):
+    respuesta = cliente.post(f'/generate/stream?plantilla={huella}', data=b'[1, 2]\n',
+                             content_type='application/x-ndjson')
+    assert respuesta.status_code == 400
+    assert respuesta.get_json() == {'error': 'Línea 1: cada línea debe ser un objeto JSON'}
@@ -0,0 +1,104 @@
+import io
+import zipfile
+
+import pytest
+
+from generador import reconstruir_combinado, zip_combinado_en_streaming
+from generador.archivo_zip import EscritorZipCrudo, MiembroZip, escribir_zip, leer_miembros
+
+FECHA = (2025, 3, 14, 10, 30, 0)
+
+
+def contenidos(datos):
+    with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+        assert zf.testzip() is None
+        return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+def docx(texto):
+    """Un .docx de mentira: lo que importa es que sus miembros se copian sin recomprimir"""
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', '<Types/>')
+        zf.writestr('word/styles.xml', '<w:styles/>' * 50)
+        zf.writestr('word/document.xml', f'<w:t>{texto}</w:t>')
+    return salida.getvalue()
+
+
+def test_escribir_zip_con_miembros_copiados():
+    esperado = {'a.txt': b'hola ' * 100, 'carpeta/ñandú.xml': '<ñ/>'.encode(), 'vacio': b''}
+    miembros = [MiembroZip.comprimir(nombre, contenido, FECHA) for nombre, contenido in esperado.items()]
+    # Un miembro sin comprimir, copiado de otro ZIP
+    guardado = io.BytesIO()
+    with zipfile.ZipFile(guardado, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('guardado.bin', bytes(range(256)))
+    miembros += leer_miembros(guardado.getvalue())
+    esperado['guardado.bin'] = bytes(range(256))
+
+    salida = io.BytesIO()
+    escribir_zip(salida, miembros)
+    assert contenidos(salida.getvalue()) == esperado
+
+
+def test_agregar_por_partes():
+    salida = io.BytesIO()
+    escritor = EscritorZipCrudo(salida)
+    escritor.agregar(MiembroZip.comprimir('antes.txt', b'antes', FECHA))
+    for _ in escritor.agregar_por_partes('trozos.txt', (b'trozo %d\n' % i for i in range(1000)), FECHA):
+        pass
+    escritor.cerrar()
+    assert contenidos(salida.getvalue()) == {
+        'antes.txt': b'antes',
+        'trozos.txt': b''.join(b'trozo %d\n' % i for i in range(1000)),
+    }
+
+
+def test_zip64_con_tamanos_y_cantidad_grandes(monkeypatch):
+    # Los límites de 32 y 16 bits se bajan para no escribir gigas: los miembros y el directorio los superan
+    monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', 1000)
+    monkeypatch.setattr(zipfile, 'ZIP_FILECOUNT_LIMIT', 3)
+    esperado = {f'grande{i}.bin': bytes(range(256)) * 20 for i in range(3)}
+    esperado['pequeño.txt'] = b'x'
+    guardado = io.BytesIO()
+    with zipfile.ZipFile(guardado, 'w', zipfile.ZIP_STORED) as zf:
+        for nombre, contenido in esperado.items():
+            zf.writestr(nombre, contenido)
+
+    salida = io.BytesIO()
+    escribir_zip(salida, leer_miembros(guardado.getvalue()))
+    datos = salida.getvalue()
+    assert b'PK\006\006' in datos and b'PK\006\007' in datos
+    assert contenidos(datos) == esperado
+
+
+def test_zip64_con_mas_de_65535_miembros():
+    miembro = MiembroZip.comprimir('x', b'', FECHA)
+    total = zipfile.ZIP_FILECOUNT_LIMIT + 2
+    salida = io.BytesIO()
+    escribir_zip(salida, (miembro.renombrar(f'{i}.txt') for i in range(total)))
+    with zipfile.ZipFile(salida) as zf:
+        assert zf.testzip() is None
+        assert len(zf.infolist()) == total
+
+
+def test_combinado_se_reconstruye(tmp_path):
+    diplomas = [('Diploma_Ana.docx', docx('Ana')), ('Diploma_Luis.docx', docx('Luis')),
+                ('Diploma_Ana.docx', docx('Ana 2'))]
+    origen = tmp_path / 'lote.zip'
+    origen.write_bytes(b''.join(zip_combinado_en_streaming(diplomas)))
+    partes = contenidos(origen.read_bytes())
+    # Estilos y tipos de contenido iguales se guardan una sola vez
+    assert len(partes) == 2 + len(diplomas) + 1
+
+    assert reconstruir_combinado(origen, tmp_path / 'salida') == 3
+    for nombre, contenido in zip(['Diploma_Ana.docx', 'Diploma_Luis.docx', 'Diploma_Ana_2.docx'], diplomas):
+        assert contenidos((tmp_path / 'salida' / nombre).read_bytes()) == contenidos(contenido[1])
+
+
+@pytest.mark.parametrize('nombre', ['../fuera.docx', '/tmp/fuera.docx', 'a/../../fuera.docx'])
+def test_combinado_rechaza_nombres_fuera_de_la_carpeta(tmp_path, nombre):
+    origen = tmp_path / 'lote.zip'
+    origen.write_bytes(b''.join(zip_combinado_en_streaming([(nombre, docx('Ana'))])))
+    with pytest.raises(zipfile.BadZipFile):
+        reconstruir_combinado(origen, tmp_path / 'salida')
+    assert not (tmp_path / 'fuera.docx').exists()
@@ -0,0 +1,40 @@
+from openpyxl import Workbook
+
+from generador import HojaExcel
+
+
+def escribir_excel(ruta, filas):
+    wb = Workbook()
+    for fila in filas:
+        wb.active.append(fila)
+    wb.save(ruta)
+    return ruta
+
+
+def test_filas_vacias_se_saltan(tmp_path):
+    ruta = escribir_excel(tmp_path / 'datos.xlsx', [
+        ['NOMBRE_COMPLETO', 'N_DOCUMENTO'],
+        ['Ana', 1234567],
+        [None, None],
+        ['Luis', 89],
+        [None, None],
+    ])
+    with HojaExcel(ruta) as hoja:
+        filas = list(hoja.filas())
+    assert filas == [
+        ('Diploma_Ana.docx', {'NOMBRE_COMPLETO': 'Ana', 'N_DOCUMENTO': '1.234.567'}),
+        ('Diploma_Luis.docx', {'NOMBRE_COMPLETO': 'Luis', 'N_DOCUMENTO': '89'}),
+    ]
+
+
+def test_documento_booleano_como_en_la_version_original(tmp_path):
+    # formatear_numero_con_puntos(True) daba '1': se usa int(celda)
+    ruta = escribir_excel(tmp_path / 'datos.xlsx', [
+        ['NOMBRE_COMPLETO', 'N_DOCUMENTO', 'OTRA'],
+        ['Ana', True, True],
+        ['Luis', False, 'x'],
+        ['Eva', 5, None],
+    ])
+    with HojaExcel(ruta) as hoja:
+        documentos = [(valores['N_DOCUMENTO'], valores['OTRA']) for _, valores in hoja.filas()]
+    assert documentos == [('1', 'True'), ('0', 'x'), ('5', '')]
@@ -0,0 +1,91 @@
+import csv
+import json
+
+import pytest
+
+from generador import LECTORES, HojaExcel, abrir_hoja
+from test_excel import escribir_excel
+
+COLUMNAS = ['NOMBRE_COMPLETO', 'N_DOCUMENTO', 'LUGAR_EXPEDICION', 'CURSO']
+FILAS = [
+    ['  Ana María  ', 1234567, ' Medellín ', 'Excel avanzado'],
+    ['Luis', 89, None, 'nan'],
+    ['Eva, "la de Cali"', None, 'Cali', None],
+    ['Ñandú', 1000000000, 'Bogotá D.C.', 'Curso;con;separadores'],
+]
+
+
+def escribir_csv(ruta, separador=','):
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f, delimiter=separador)
+        escritor.writerow(COLUMNAS)
+        escritor.writerows([['' if valor is None else valor for valor in fila] for fila in FILAS])
+
+
+def tabla():
+    pa = pytest.importorskip('pyarrow')
+    return pa.table({
+        columna: pa.array([fila[i] for fila in FILAS], type=pa.int64() if columna == 'N_DOCUMENTO' else pa.string())
+        for i, columna in enumerate(COLUMNAS)
+    })
+
+
+def escribir_parquet(ruta):
+    tabla_ = tabla()
+    import pyarrow.parquet
+
+    # Grupos de filas chicos: la hoja se lee de a varios lotes
+    pyarrow.parquet.write_table(tabla_, ruta, row_group_size=2)
+
+
+def escribir_arrow(ruta):
+    tabla_ = tabla()
+    import pyarrow.ipc
+
+    with pyarrow.ipc.new_file(ruta, tabla_.schema) as escritor:
+        escritor.write_table(tabla_, max_chunksize=3)
+
+
+def escribir_stream_arrow(ruta):
+    tabla_ = tabla()
+    import pyarrow.ipc
+
+    with pyarrow.ipc.new_stream(ruta, tabla_.schema) as escritor:
+        escritor.write_table(tabla_, max_chunksize=3)
+
+
+def escribir_ndjson(ruta):
+    with open(ruta, 'w', encoding='utf-8') as f:
+        for fila in FILAS:
+            f.write(json.dumps(dict(zip(COLUMNAS, fila)), ensure_ascii=False) + '\n')
+
+
+ESCRITORES = {
+    'csv': escribir_csv,
+    'txt': lambda ruta: escribir_csv(ruta, separador=';'),
+    'parquet': escribir_parquet,
+    'arrow': escribir_arrow,
+    'feather': escribir_arrow,
+    'ipc': escribir_stream_arrow,
+    'ndjson': escribir_ndjson,
+    'jsonl': escribir_ndjson,
+}
+
+
+@pytest.fixture(scope='module')
+def esperado(tmp_path_factory):
+    ruta = escribir_excel(tmp_path_factory.mktemp('excel') / 'datos.xlsx', [COLUMNAS] + FILAS)
+    with HojaExcel(ruta) as hoja:
+        return hoja.columnas, list(hoja.filas())
+
+
+def test_todos_los_lectores_tienen_prueba():
+    assert set(LECTORES) - {'xlsx', 'xls'} == set(ESCRITORES)
+
+
+@pytest.mark.parametrize('extension', sorted(ESCRITORES))
+def test_mismos_valores_que_excel(tmp_path, esperado, extension):
+    ruta = tmp_path / f'datos.{extension}'
+    ESCRITORES[extension](ruta)
+    with abrir_hoja(str(ruta)) as hoja:
+        assert (hoja.columnas, list(hoja.filas())) == esperado
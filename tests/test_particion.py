@@ -0,0 +1,88 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from generador import MANIFIESTO_PARTE, Particion, ParticionIncompleta, combinar_partes, verificar_partes
+
+FILAS = [(f'Diploma_{i}.docx', {'NOMBRE_COMPLETO': f'Persona {i}', 'N_DOCUMENTO': str(i)}) for i in range(20)]
+
+
+def generar_parte(carpeta, indice, total, filas=FILAS):
+    """Lo que hace una máquina con su parte: un archivo por fila y el manifiesto al terminar"""
+    particion = Particion(indice, total)
+    destino = carpeta / particion.nombre
+    destino.mkdir()
+    for archivo, valores in particion.filtrar(filas):
+        (destino / archivo).write_text(valores['NOMBRE_COMPLETO'])
+    particion.guardar_manifiesto(str(destino), {'plantilla': 'abc'})
+    return destino
+
+
+def leer_manifiesto(destino):
+    return json.loads((destino / MANIFIESTO_PARTE).read_text())
+
+
+def escribir_manifiesto(destino, manifiesto):
+    (destino / MANIFIESTO_PARTE).write_text(json.dumps(manifiesto))
+
+
+def problemas(carpeta):
+    with pytest.raises(ParticionIncompleta) as error:
+        verificar_partes(str(carpeta))
+    return error.value.problemas
+
+
+def test_partes_completas(tmp_path):
+    for indice in (1, 2, 3):
+        generar_parte(tmp_path, indice, 3)
+    partes, filas = verificar_partes(str(tmp_path))
+    assert len(partes) == 3
+    assert [(numero, nombre) for numero, nombre, _, _ in filas] == [(i, nombre) for i, (nombre, _) in enumerate(FILAS)]
+    # Cada fila está en una sola parte y todas tienen alguna
+    assert {parte for *_, parte in filas} == {1, 2, 3}
+
+    destino = tmp_path / 'lote.zip'
+    assert combinar_partes(str(tmp_path), str(destino), str(tmp_path / 'lote.json')) == len(FILAS)
+    with zipfile.ZipFile(destino) as zf:
+        assert zf.namelist() == [nombre for nombre, _ in FILAS]
+        assert zf.read('Diploma_7.docx') == b'Persona 7'
+
+
+def test_parte_faltante(tmp_path):
+    generar_parte(tmp_path, 1, 3)
+    generar_parte(tmp_path, 3, 3)
+    assert problemas(tmp_path) == ['Faltan las partes 2/3']
+
+
+def test_fila_repetida_en_dos_partes(tmp_path):
+    primera = generar_parte(tmp_path, 1, 2)
+    segunda = generar_parte(tmp_path, 2, 2)
+    # Una fila de la segunda parte también aparece en la primera
+    manifiesto = leer_manifiesto(primera)
+    numero, nombre, archivo = leer_manifiesto(segunda)['filas'][0]
+    (primera / archivo).write_text('otra vez')
+    manifiesto['filas'].append([numero, nombre, archivo])
+    escribir_manifiesto(primera, manifiesto)
+    assert problemas(tmp_path) == [f'Filas repetidas en más de una parte: {numero + 1}']
+
+
+def test_fila_sin_parte_y_diploma_borrado(tmp_path):
+    primera = generar_parte(tmp_path, 1, 2)
+    generar_parte(tmp_path, 2, 2)
+    manifiesto = leer_manifiesto(primera)
+    quitada, _, _ = manifiesto['filas'].pop()
+    escribir_manifiesto(primera, manifiesto)
+    borrada, _, archivo = manifiesto['filas'][0]
+    os.remove(primera / archivo)
+    assert problemas(tmp_path) == [
+        f'Filas que no están en ninguna parte: {quitada + 1}',
+        f'Filas sin su diploma en la carpeta de la parte: {borrada + 1}',
+    ]
+
+
+def test_partes_con_datos_distintos(tmp_path):
+    generar_parte(tmp_path, 1, 2)
+    generar_parte(tmp_path, 2, 2, filas=FILAS[:-1])
+    assert any('se generó con otros datos' in problema for problema in problemas(tmp_path))
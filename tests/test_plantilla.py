@@ -0,0 +1,85 @@
+import zipfile
+
+import pytest
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+
+from generador import compilar_plantilla, replace_text, sustituir_placeholders
+
+VALORES = {
+    'NOMBRE_COMPLETO': 'Ana María Pérez & Cía <sucursal>',
+    'N_DOCUMENTO': '1.234.567',
+    'LUGAR_EXPEDICION': 'Medellín',
+    'CURSO': '',
+}
+
+# Un cuadro de texto en el cuerpo (solo lo alcanza la pasada por los w:t de replace_text)
+CUADRO_TEXTO = (
+    f'<w:r {nsdecls("w")} xmlns:v="urn:schemas-microsoft-com:vml"><w:pict><v:shape><v:textbox><w:txbxContent>'
+    '<w:p><w:r><w:t>Lugar: {LUGAR_EXPEDICION}</w:t></w:r></w:p>'
+    '</w:txbxContent></v:textbox></v:shape></w:pict></w:r>'
+)
+
+
+def partido(contenedor, *trozos):
+    """Párrafo con el texto repartido en varios runs, como lo deja Word al editar"""
+    parrafo = contenedor.add_paragraph()
+    for i, trozo in enumerate(trozos):
+        parrafo.add_run(trozo).bold = i % 2 == 1
+    return parrafo
+
+
+@pytest.fixture
+def plantilla(tmp_path):
+    doc = Document()
+    partido(doc, 'Otorgado a {NOMBRE_', 'COMPLETO}', ' con C.C. {N_DOC', 'UMENTO}')
+    partido(doc, 'Sin valor: {DESCONOCIDO} y vacío: {CURSO}')
+    doc.add_paragraph('Texto fijo')
+    celda = doc.add_table(rows=1, cols=2).cell(0, 1)
+    partido(celda, '{N_', 'DOCUMENTO}')
+    partido(doc, 'Cuadro: ')._p.append(parse_xml(CUADRO_TEXTO))
+
+    seccion = doc.sections[0]
+    partido(seccion.header, 'Expedido en {LUGAR_', 'EXPEDICION}')
+    partido(seccion.footer, '{NOMBRE_COMPLETO}', ' - ', '{N_DOCUMENTO}')
+    ruta = tmp_path / 'plantilla.docx'
+    doc.save(ruta)
+    return ruta
+
+
+def textos(ruta):
+    """Texto de cada párrafo del cuerpo, los encabezados y los pies, por parte"""
+    with zipfile.ZipFile(ruta) as zf:
+        partes = [nombre for nombre in zf.namelist()
+                  if nombre == 'word/document.xml' or nombre.startswith(('word/header', 'word/footer'))]
+        return {
+            nombre: [''.join(t.text or '' for t in p.iter(qn('w:t'))) for p in parse_xml(zf.read(nombre)).iter(qn('w:p'))]
+            for nombre in partes
+        }
+
+
+def test_sustituir_placeholders():
+    texto = '{NOMBRE_COMPLETO} ({N_DOCUMENTO}) {DESCONOCIDO} {CURSO}'
+    assert sustituir_placeholders(texto, VALORES) == 'Ana María Pérez & Cía <sucursal> (1.234.567) {DESCONOCIDO} '
+
+
+@pytest.mark.parametrize('modo', ['rapido', 'docx'])
+def test_mismo_texto_que_replace_text(plantilla, tmp_path, modo):
+    # La versión original: un replace_text por columna sobre el documento recién abierto
+    doc = Document(plantilla)
+    for columna, valor in VALORES.items():
+        replace_text(doc, '{' + columna + '}', valor)
+    original = tmp_path / 'original.docx'
+    doc.save(original)
+
+    compilada = compilar_plantilla(str(plantilla), VALORES, modo=modo)
+    generado = tmp_path / f'{modo}.docx'
+    compilada.renderizar(VALORES, str(generado))
+
+    esperado = textos(original)
+    obtenido = textos(generado)
+    # replace_text crea los encabezados que no existían al recorrerlos; solo cuentan las partes de la plantilla
+    assert obtenido == {nombre: esperado[nombre] for nombre in obtenido}
+    assert 'Expedido en Medellín' in obtenido['word/header1.xml']
+    assert 'Lugar: Medellín' in obtenido['word/document.xml']